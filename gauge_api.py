@@ -0,0 +1,222 @@
+"""JSON API for the computed gauge statistics, served next to the notebook.
+
+    python gauge_api.py --port 8080      # notebook at /, API at /api/
+    curl -s localhost:8080/api/sites/09485000/streaks?wet_threshold=1
+
+Routes (GET):
+
+    /api/sites                          configured gauges
+    /api/sites/<site_id>                every resource below in one document
+                                        (the export's <site_id>.json)
+    /api/sites/<site_id>/<resource>     month_data | month_summary_data |
+                                        streaks | annual | top_flow
+
+streaks and the full document take the notebook's streak settings as
+?wet_threshold=<cfs>&max_gap=<days>. Documents are gauge_export's site bundle,
+or a part of it, computed from the same process-wide daily values cache the
+notebook sessions read. A bundle is built once per data version (and calendar
+end and streak settings) and each response body is encoded once per ETag and
+kept in a result cache. The ETag is a hash of the data version, the calendar
+end, PIPELINE_VERSION, the resource and its settings - so a conditional request
+is answered 304 before any statistics are looked at - and Cache-Control lets
+clients reuse a response for API_MAX_AGE seconds before revalidating.
+
+Only configured gauges (gauge_sites) are served.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+
+import pandas as pd
+
+from gauge_cache import PIPELINE_VERSION, ArtifactCache, get_daily_values, series_fingerprint, start_warmer
+from gauge_export import site_bundle, site_stats
+from gauge_metrics import stage, start_metrics_server
+from gauge_sites import GAUGE_SITE_IDS, GAUGE_SITE_LABELS
+from gauge_stats import calendar_bounds
+
+# well under the warmer's interval - clients see refreshed data within minutes
+API_MAX_AGE = 300
+
+# bundles and encoded bodies - a few per gauge and streak setting
+API_CACHE_ENTRIES = 256
+
+# bundle fields of each resource, after the site header
+RESOURCES = {
+    "month_data": ["month_data"],
+    "month_summary_data": ["month_summary_data"],
+    "streaks": ["streak_settings", "current_streak", "top10_wet", "top10_dry"],
+    "annual": ["annual_mean", "wettest", "driest"],
+    "top_flow": ["top10_flow"],
+}
+_HEADER = ["site_id", "site_name", "data_version", "pipeline_version", "generated_at", "start_date", "end_date"]
+_STREAK_RESOURCES = {None, "streaks"}
+
+# gzip bodies above this size when the client accepts it
+_GZIP_MIN_BYTES = 1024
+
+api_cache = ArtifactCache(API_CACHE_ENTRIES)
+
+# site id -> (daily values, fingerprint) - the cached frame is only re-hashed when it is replaced
+_versions: dict[str, tuple[pd.DataFrame, str]] = {}
+_versions_lock = threading.Lock()
+
+
+def _data_version(site_id: str, gauge_values: pd.DataFrame) -> str:
+    with _versions_lock:
+        entry = _versions.get(site_id)
+    if entry is not None and entry[0] is gauge_values:
+        return entry[1]
+    data_version = series_fingerprint(gauge_values)
+    with _versions_lock:
+        _versions[site_id] = (gauge_values, data_version)
+    return data_version
+
+
+def _etag(*parts) -> str:
+    return '"' + hashlib.blake2b(repr((PIPELINE_VERSION,) + parts).encode(), digest_size=12).hexdigest() + '"'
+
+
+def _not_modified(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+def _json_body(document) -> tuple[bytes, bytes | None]:
+    """(body, gzipped body or None when too small to be worth it)."""
+    body = json.dumps(document, separators=(",", ":")).encode()
+    return body, gzip.compress(body, compresslevel=6) if len(body) >= _GZIP_MIN_BYTES else None
+
+
+def _error(status: int, message: str) -> tuple[int, dict, bytes]:
+    return status, {"Content-Type": "application/json", "Cache-Control": "no-store"}, \
+        json.dumps({"error": message}).encode()
+
+
+def _streak_settings(params: dict) -> tuple[float, int]:
+    """(wet_threshold, max_gap) from the query, with the notebook's defaults and bounds."""
+    try:
+        wet_threshold = float(params.get("wet_threshold", 0))
+        max_gap = int(params.get("max_gap", 0))
+    except ValueError:
+        raise ValueError("wet_threshold must be a number and max_gap a whole number of days") from None
+    if not (0 <= wet_threshold <= 10000 and 0 <= max_gap <= 30):
+        raise ValueError("wet_threshold must be 0-10000 and max_gap 0-30")
+    return wet_threshold, max_gap
+
+
+def _site_document(site_id: str, resource: str | None, params: dict):
+    """(etag, loader of the document) for a site resource; raises LookupError/ValueError."""
+    if site_id not in GAUGE_SITE_LABELS:
+        raise LookupError(f"unknown site {site_id}")
+    if resource is not None and resource not in RESOURCES:
+        raise LookupError(f"unknown resource {resource} - one of {', '.join(RESOURCES)}")
+    settings = _streak_settings(params) if resource in _STREAK_RESOURCES else (0.0, 0)
+
+    gauge_values = get_daily_values(site_id)
+    if gauge_values.empty:
+        raise LookupError(f"no daily values for site {site_id}")
+    data_version = _data_version(site_id, gauge_values)
+    _, end_date = calendar_bounds(gauge_values)
+    bundle_key = (data_version, end_date, "api_bundle", site_id) + settings
+
+    def _document():
+        bundle = api_cache.get_or_compute(bundle_key, lambda: site_bundle(
+            site_id, str(gauge_values["siteName"].iloc[0]), data_version,
+            site_stats(gauge_values, end_date, *settings),
+        ))
+        if resource is None:
+            return bundle
+        return {name: bundle[name] for name in _HEADER + RESOURCES[resource]}
+
+    return _etag(data_version, end_date, site_id, resource, settings), _document
+
+
+def api_response(path: str, params: dict, if_none_match: str | None = None,
+                 accept_gzip: bool = False) -> tuple[int, dict, bytes]:
+    """(status, headers, body) for a GET of path (with the /api prefix) and query params."""
+    parts = [p for p in path.split("/") if p]
+    if parts[:2] != ["api", "sites"] or len(parts) > 4:
+        return _error(404, "not found")
+
+    with stage("api_request", resource=parts[3] if len(parts) == 4 else "site" if len(parts) == 3 else "sites"):
+        if len(parts) == 2:
+            etag = _etag("sites", tuple(GAUGE_SITE_IDS))
+
+            def document():
+                return [{"site_id": s, "label": GAUGE_SITE_LABELS[s], "url": f"/api/sites/{s}"}
+                        for s in GAUGE_SITE_IDS]
+        else:
+            try:
+                etag, document = _site_document(parts[2], parts[3] if len(parts) == 4 else None, params)
+            except LookupError as e:
+                return _error(404, str(e))
+            except ValueError as e:
+                return _error(400, str(e))
+
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"public, max-age={API_MAX_AGE}",
+            "Vary": "Accept-Encoding",
+        }
+        if _not_modified(if_none_match, etag):
+            return 304, headers, b""
+
+        body, gzipped = api_cache.get_or_compute(("api_body", etag), lambda: _json_body(document()))
+        headers["Content-Type"] = "application/json"
+        if accept_gzip and gzipped is not None:
+            headers["Content-Encoding"] = "gzip"
+            return 200, headers, gzipped
+        return 200, headers, body
+
+
+def _endpoint(request):
+    # sync - Starlette runs it in its thread pool, off the event loop
+    from starlette.responses import Response
+
+    status, headers, body = api_response(
+        request.url.path, dict(request.query_params), request.headers.get("if-none-match"),
+        "gzip" in request.headers.get("accept-encoding", ""),
+    )
+    return Response(body, status_code=status, headers=headers)
+
+
+def make_app(notebook: str | None = None):
+    """ASGI app with the API under /api and, given a notebook, the notebook (run mode) at /."""
+    import marimo
+    from starlette.applications import Starlette
+    from starlette.routing import Mount, Route
+
+    routes = [Route("/api/{path:path}", _endpoint, methods=["GET"])]
+    if notebook:
+        routes.append(Mount("/", app=marimo.create_asgi_app().with_app(path="", root=notebook).build()))
+    return Starlette(routes=routes)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the gauge notebook with a JSON API next to it.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8080")))
+    parser.add_argument("--notebook", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           "usgs_gauge_flow.py"))
+    parser.add_argument("--api-only", action="store_true", help="serve /api without the notebook")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    start_warmer(GAUGE_SITE_IDS)
+    start_metrics_server()
+    uvicorn.run(make_app(None if args.api_only else args.notebook), host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
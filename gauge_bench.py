@@ -0,0 +1,216 @@
+"""Offline benchmark of the gauge pipeline on synthetic Daily Values.
+
+    python gauge_bench.py --sites 1 10 100 --years 100 --format json rdb --json bench.json
+
+For every site count and payload format, synthetic sites (usgs_synthetic) are
+pushed one at a time through the same stages the notebook runs, and each stage
+is timed (best of --repeat) and, in a separate pass, has its peak Python/numpy
+allocation measured with tracemalloc. Results are reported per stage as the
+total over all sites, the per-site mean and the largest per-site peak.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import plotly
+import plotly.io as pio
+
+from gauge_figures import days_of_flow_tiles, max_flow_heatmap, monthly_flow_band_linear
+from gauge_incremental import IncrementalGaugeStats
+from gauge_stats import (
+    DRY,
+    WET,
+    annual_mean_flow,
+    build_day_data,
+    calendar_bounds,
+    find_runs,
+    month_of_year_flow_stats,
+    monthly_flow_stats,
+    ranked_years,
+    top_flow_days,
+    top_runs,
+)
+from usgs_service import DISCHARGE_PARAMETER, STREAM_CHUNK_BYTES, parse_dv_json, parse_dv_rdb
+from usgs_synthetic import dv_json_text, dv_rdb, synthetic_sites
+
+
+def _discharge(values: pd.DataFrame) -> pd.DataFrame:
+    return values[values["variableCode"] == DISCHARGE_PARAMETER].reset_index(drop=True)
+
+
+def _text_chunks(text: str):
+    # the body as a streamed response delivers it
+    return (text[i:i + STREAM_CHUNK_BYTES] for i in range(0, len(text), STREAM_CHUNK_BYTES))
+
+
+def _streaks(ctx):
+    runs = find_runs(ctx["day_data"])
+    return top_runs(runs, WET, 10), top_runs(runs, DRY, 10)
+
+
+def _annual(ctx):
+    annual_mean = annual_mean_flow(ctx["day_data"])
+    return ranked_years(annual_mean, 10), top_flow_days(ctx["day_data"], 10)
+
+
+def _figures(ctx):
+    return (
+        days_of_flow_tiles(ctx["month_data"]),
+        pio.to_json(monthly_flow_band_linear(ctx["month_summary_data"])),
+        pio.to_json(max_flow_heatmap(ctx["month_data"])),
+    )
+
+
+def _incremental_artifacts(stats: IncrementalGaugeStats) -> tuple:
+    return (stats.day_data(), stats.month_data(), stats.month_summary_data(), stats.top_runs(WET),
+            stats.top_runs(DRY), stats.annual_mean(), stats.top_flow_days())
+
+
+def _nightly_update(values: pd.DataFrame) -> pd.DataFrame:
+    # the series minus its last day, with the provisional tail revised
+    previous = values.iloc[:-1].copy()
+    provisional = np.flatnonzero(previous["qualifiers"].astype(str).str.contains("P").to_numpy())
+    previous.loc[provisional[::7], "value"] = previous["value"].iloc[provisional[::7]] * 1.1
+    return previous
+
+
+def _incremental_build(ctx):
+    stats = IncrementalGaugeStats()
+    stats.update(_nightly_update(ctx["values"]), "previous")
+    _incremental_artifacts(stats)
+    return stats
+
+
+def _incremental_update(ctx):
+    # a nightly refresh (one new day plus revised provisional values) and back again,
+    # with every notebook artifact read after each
+    stats = ctx["incremental_build"]
+    stats.update(ctx["values"], "current")
+    _incremental_artifacts(stats)
+    if "previous" not in ctx:
+        ctx["previous"] = _nightly_update(ctx["values"])
+    stats.update(ctx["previous"], "previous")
+    return _incremental_artifacts(stats)
+
+
+# (stage, function of the per-site context) - each result is stored in the context under the stage name
+_PAYLOAD_STAGES = {
+    "json": [
+        ("parse_dv_json", lambda ctx: _discharge(next(iter(parse_dv_json(_text_chunks(ctx["payload"])).values())))),
+    ],
+    "rdb": [
+        ("parse_dv_rdb", lambda ctx: _discharge(next(iter(parse_dv_rdb(ctx["payload"]).values())))),
+    ],
+}
+_VALUES_STAGE = {"json": "parse_dv_json", "rdb": "parse_dv_rdb"}
+
+_PIPELINE_STAGES = [
+    ("day_data", lambda ctx: build_day_data(ctx["values"], *calendar_bounds(ctx["values"]))),
+    ("month_data", lambda ctx: monthly_flow_stats(ctx["day_data"]).fillna({"max_mean_flow": 0})),
+    ("month_summary_data", lambda ctx: month_of_year_flow_stats(ctx["day_data"])),
+    ("streaks", _streaks),
+    ("annual", _annual),
+    ("figures", _figures),
+    ("incremental_build", _incremental_build),
+    ("incremental_update", _incremental_update),
+]
+
+
+def _run_stage(fn, ctx, repeat: int, measure_memory: bool) -> tuple[object, float, int | None]:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn(ctx)
+        best = min(best, time.perf_counter() - t)
+
+    peak = None
+    if measure_memory:
+        tracemalloc.start()
+        try:
+            fn(ctx)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, best, peak
+
+
+def bench(n_sites: int, years: float, fmt: str, repeat: int = 3, measure_memory: bool = True,
+          seed: int = 0) -> list[dict]:
+    """Per-stage results for n_sites synthetic sites of `years` years in payload format fmt."""
+    stages = _PAYLOAD_STAGES[fmt] + _PIPELINE_STAGES
+    seconds = {name: [] for name, _ in stages}
+    peaks = {name: 0 for name, _ in stages}
+    payload_bytes = rows = 0
+
+    for site in synthetic_sites(n_sites, seed=seed, years=years):
+        # one single-site payload at a time keeps memory flat however many sites run
+        payload = dv_json_text([site]) if fmt == "json" else dv_rdb([site])
+        payload_bytes += len(payload)
+        ctx = {"payload": payload}
+        for name, fn in stages:
+            ctx[name], elapsed, peak = _run_stage(fn, ctx, repeat, measure_memory)
+            seconds[name].append(elapsed)
+            peaks[name] = max(peaks[name], peak or 0)
+            if name == _VALUES_STAGE[fmt]:
+                ctx["values"] = ctx[name]
+                rows += len(ctx[name])
+
+    return [
+        {
+            "stage": name,
+            "format": fmt,
+            "sites": n_sites,
+            "years": years,
+            "total_s": float(np.sum(seconds[name])),
+            "per_site_ms": float(np.mean(seconds[name]) * 1000),
+            "peak_mib": peaks[name] / 2**20 if measure_memory else None,
+            "payload_mib": payload_bytes / 2**20,
+            "rows": rows,
+        }
+        for name, _ in stages
+    ]
+
+
+def _print_table(results: list[dict]) -> None:
+    print(f"{'format':<6} {'sites':>5} {'stage':<20} {'total s':>9} {'ms/site':>9} {'peak MiB':>9}")
+    for r in results:
+        peak = f"{r['peak_mib']:9.1f}" if r["peak_mib"] is not None else f"{'-':>9}"
+        print(f"{r['format']:<6} {r['sites']:>5} {r['stage']:<20} {r['total_s']:9.3f} {r['per_site_ms']:9.1f} {peak}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the gauge pipeline on synthetic Daily Values.")
+    parser.add_argument("--sites", type=int, nargs="+", default=[1, 10], help="site counts to run")
+    parser.add_argument("--years", type=float, default=100, help="record length per site")
+    parser.add_argument("--format", nargs="+", choices=["json", "rdb"], default=["json", "rdb"])
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage (best is kept)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="also write results (and versions) to this file")
+    args = parser.parse_args(argv)
+
+    results = []
+    for fmt in args.format:
+        for n_sites in args.sites:
+            results += bench(n_sites, args.years, fmt, args.repeat, not args.no_memory, args.seed)
+    _print_table(results)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "pandas": pd.__version__,
+                "plotly": plotly.__version__,
+                "results": results,
+            }, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,391 @@
+"""Process-wide in-memory cache of gauge daily values, kept warm in the background.
+
+Every marimo session in the process reads from the same TTL cache, and
+concurrent requests for a site that isn't cached share one load. A warmer thread
+loads all configured gauges at startup - batched multi-site requests, fetched
+concurrently - and then re-checks them on a schedule, so a dropdown change is
+normally served from memory.
+
+Derived artifacts (calendar, monthly stats, streaks, ...) are memoized in
+derived_cache under a content hash of the series they were computed from, so a
+gauge anyone has viewed renders from cache in every session.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from plotly.basedatatypes import BaseFigure
+
+from gauge_duration import FlowDuration
+from gauge_iv import IV_HISTORY_DAYS, iv_daily_aggregates, iv_gauge_values
+from gauge_ranges import CalendarIndex
+from gauge_store import load_daily_values, load_many_daily_values
+
+log = logging.getLogger(__name__)
+
+# the store itself decides when the service is actually asked for new data
+WARM_INTERVAL = timedelta(minutes=30)
+
+# longer than WARM_INTERVAL, so warmed sites never expire while the warmer runs
+DAILY_VALUES_TTL = timedelta(hours=1)
+
+
+class SingleFlightCache:
+    """TTL cache where concurrent misses for the same key share a single load.
+
+    The first caller for a missing or expired key runs the loader; callers
+    arriving while it runs wait for that result instead of starting their own.
+    hits / misses / coalesced count how each get() was served.
+    """
+
+    def __init__(self, ttl: timedelta):
+        self.ttl = ttl.total_seconds()
+        self._entries: dict[object, tuple[float, object]] = {}
+        self._in_flight: dict[object, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return flight.result()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            flight.set_exception(e)
+            raise
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            del self._in_flight[key]
+        flight.set_result(value)
+        return value
+
+    def get_many(self, keys, loader) -> dict:
+        """Values for several keys; the misses are loaded together by loader(missing keys) -> {key: value}.
+
+        Keys another caller is already loading are waited for, not loaded again.
+        Keys the loader leaves out are left out of the result and not cached.
+        """
+        values, waiting, missing = {}, {}, []
+        with self._lock:
+            now = time.monotonic()
+            for key in dict.fromkeys(keys):
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self.hits += 1
+                    values[key] = entry[1]
+                elif key in self._in_flight:
+                    self.coalesced += 1
+                    waiting[key] = self._in_flight[key]
+                else:
+                    self.misses += 1
+                    missing.append(key)
+                    self._in_flight[key] = Future()
+
+        if missing:
+            try:
+                loaded = loader(missing)
+            except BaseException as e:
+                with self._lock:
+                    flights = [self._in_flight.pop(key) for key in missing]
+                for flight in flights:
+                    flight.set_exception(e)
+                raise
+            with self._lock:
+                expires = time.monotonic() + self.ttl
+                flights = [self._in_flight.pop(key) for key in missing]
+                for key in missing:
+                    if key in loaded:
+                        self._entries[key] = (expires, loaded[key])
+            for key, flight in zip(missing, flights):
+                flight.set_result(loaded.get(key))
+                if key in loaded:
+                    values[key] = loaded[key]
+
+        for key, flight in waiting.items():
+            value = flight.result()
+            if value is not None:
+                values[key] = value
+        return values
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def values(self) -> list:
+        with self._lock:
+            return [value for _, value in self._entries.values()]
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+            }
+
+
+# one per process - shared by every marimo session
+daily_values_cache = SingleFlightCache(DAILY_VALUES_TTL)
+
+_warmer: threading.Thread | None = None
+_warmer_lock = threading.Lock()
+
+
+def get_daily_values(site_id: str) -> pd.DataFrame:
+    """Daily values for a site - from memory when warm, otherwise loaded once for all waiting sessions."""
+    return daily_values_cache.get(site_id, lambda: load_daily_values(site_id))
+
+
+def get_many_daily_values(site_ids: list[str]) -> dict[str, pd.DataFrame]:
+    """Daily values for several sites - warm ones from memory, the rest in one batched load.
+
+    Sites without data are left out.
+    """
+    values = daily_values_cache.get_many(site_ids, load_many_daily_values)
+    return {site_id: v for site_id, v in values.items() if not v.empty}
+
+
+# (site name, per-day aggregates) of the recent 15-minute record - loaded on demand, never warmed
+iv_aggregates_cache = SingleFlightCache(DAILY_VALUES_TTL)
+# the flattened daily frame per (site, statistic) - one copy shared by every session
+iv_values_cache = SingleFlightCache(DAILY_VALUES_TTL)
+
+
+def get_iv_aggregates(site_id: str) -> tuple[str | None, pd.DataFrame]:
+    """(site name, per-day aggregates) of a site's recent IV data."""
+    def _load():
+        end_dt = date.today()
+        return iv_daily_aggregates(site_id, end_dt - timedelta(days=IV_HISTORY_DAYS), end_dt)
+
+    return iv_aggregates_cache.get(site_id, _load)
+
+
+def get_iv_daily_values(site_id: str, statistic: str = "max") -> pd.DataFrame:
+    """Daily mean or max of a site's recent IV data as a flattened daily frame."""
+    def _values():
+        site_name, aggregates = get_iv_aggregates(site_id)
+        return iv_gauge_values(aggregates, site_id, site_name, statistic)
+
+    return iv_values_cache.get((site_id, statistic), _values)
+
+
+def warm_up(site_ids: list[str]) -> None:
+    """Load all sites into memory - missing and stale ones in batched requests."""
+    for site_id, values in load_many_daily_values(site_ids).items():
+        daily_values_cache.put(site_id, values)
+
+
+def start_warmer(site_ids: list[str], interval: timedelta = WARM_INTERVAL) -> None:
+    """Start the background warmer once per process - later calls are no-ops."""
+    global _warmer
+    with _warmer_lock:
+        if _warmer is not None:
+            return
+        _warmer = threading.Thread(target=_warm_forever, args=(list(site_ids), interval),
+                                   name="gauge-warmer", daemon=True)
+    _warmer.start()
+
+
+def _warm_forever(site_ids: list[str], interval: timedelta) -> None:
+    # daemon thread - ends with the process
+    while True:
+        try:
+            warm_up(site_ids)
+        except Exception as e:
+            log.warning("gauge warm-up failed: %s", e)
+        time.sleep(interval.total_seconds())
+
+
+# bump whenever a derived computation changes so cached artifacts are not reused
+PIPELINE_VERSION = 2
+
+# in-memory derived artifacts - a handful per gauge view
+DERIVED_CACHE_ENTRIES = 128
+
+# optional on-disk tier for derived artifacts (survives restarts)
+DERIVED_CACHE_DIR = os.environ.get("GAUGE_DERIVED_CACHE_DIR")
+
+
+def series_fingerprint(values: pd.DataFrame) -> str:
+    """Content hash of a daily series - identical data gives the identical key in every session.
+
+    Qualifiers are part of it, so a day approved with an unchanged value (P -> A)
+    is still a new version.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(values["dateTime"].to_numpy().astype("datetime64[ns]").tobytes())
+    digest.update(values["value"].to_numpy(dtype=np.float64).tobytes())
+    # categorical (IV) or object (DV) codes hash alike as strings
+    digest.update(pd.util.hash_array(values["qualifiers"].astype(str).to_numpy(dtype=object)).tobytes())
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """Bounded LRU of derived artifacts keyed by (input fingerprint, name, parameters).
+
+    Keys always include PIPELINE_VERSION. With a spill_dir each artifact is also
+    pickled to disk, and a memory miss is served from there before recomputing.
+    Concurrent misses for a key share one compute, like SingleFlightCache, so
+    every session gets the same object. Cached artifacts are shared between
+    sessions - callers must not mutate them.
+    """
+
+    def __init__(self, max_entries: int = DERIVED_CACHE_ENTRIES, spill_dir: str | None = None):
+        self.max_entries = max_entries
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self._entries: OrderedDict[str, object] = OrderedDict()
+        self._in_flight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(key: tuple) -> str:
+        return hashlib.blake2b(repr((PIPELINE_VERSION,) + tuple(key)).encode(), digest_size=16).hexdigest()
+
+    def get_or_compute(self, key: tuple, compute):
+        """Cached artifact for key, calling compute() to build it on a miss."""
+        k = self._key(key)
+        with self._lock:
+            if k in self._entries:
+                self._entries.move_to_end(k)
+                return self._entries[k]
+            flight = self._in_flight.get(k)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[k] = Future()
+        if not leader:
+            return flight.result()
+
+        try:
+            value = self._read_spill(k)
+            if value is None:
+                value = compute()
+                self._write_spill(k, value)
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[k]
+            flight.set_exception(e)
+            raise
+
+        with self._lock:
+            self._entries[k] = value
+            self._entries.move_to_end(k)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            del self._in_flight[k]
+        flight.set_result(value)
+        return value
+
+    def values(self) -> list:
+        with self._lock:
+            return list(self._entries.values())
+
+    def _read_spill(self, k: str):
+        if self.spill_dir is None:
+            return None
+        try:
+            with open(self.spill_dir / f"{k}.pkl", "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_spill(self, k: str, value) -> None:
+        if self.spill_dir is None:
+            return
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self.spill_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_name, self.spill_dir / f"{k}.pkl")
+
+
+derived_cache = ArtifactCache(spill_dir=DERIVED_CACHE_DIR)
+
+
+# Per-session data budget: bytes of array data a notebook session may hold that
+# no other session shares. Daily values come from the process-wide caches
+# (backed by the store's memory maps) and every derived frame from
+# derived_cache, so a session normally owns next to nothing - a cell that
+# copies the full history (~8 bytes per day per column) blows the budget.
+# test_session_budget.py runs the notebook in concurrent sessions and checks it.
+SESSION_BYTE_BUDGET = 64 * 1024
+
+
+def _arrays(obj):
+    """numpy arrays behind frames, series, categoricals, figures, the range/duration indexes and containers of them."""
+    if isinstance(obj, np.ndarray):
+        yield obj
+    elif isinstance(obj, pd.DataFrame):
+        for _, column in obj.items():
+            yield from _arrays(column)
+    elif isinstance(obj, (pd.Series, pd.Index)):
+        yield from _arrays(obj.array)
+    elif isinstance(obj, pd.Categorical):
+        yield obj.codes
+    elif isinstance(obj, pd.api.extensions.ExtensionArray):
+        yield from _arrays(getattr(obj, "_ndarray", None))
+    elif isinstance(obj, BaseFigure):
+        # the traces' data arrays as the figure stores them - to_plotly_json() would copy
+        for trace in obj.data:
+            for name in trace:
+                value = trace[name]
+                if isinstance(value, np.ndarray):
+                    yield value
+    elif isinstance(obj, (CalendarIndex, FlowDuration)):
+        yield from _arrays(vars(obj))
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            yield from _arrays(item)
+    elif isinstance(obj, dict):
+        for item in obj.values():
+            yield from _arrays(item)
+
+
+def _buffer_owner(array: np.ndarray):
+    # views chain to the array that owns the memory; memory-mapped columns end
+    # in the mmap object itself
+    while isinstance(array.base, np.ndarray):
+        array = array.base
+    return array if array.base is None else array.base
+
+
+def session_nbytes(*objects) -> int:
+    """Bytes of array data behind objects that is neither cached process-wide nor memory-mapped."""
+    shared = [daily_values_cache.values(), iv_aggregates_cache.values(), iv_values_cache.values(),
+              derived_cache.values()]
+    shared_owners = {id(_buffer_owner(a)) for a in _arrays(shared)}
+    owned = {}
+    for a in _arrays(objects):
+        owner = _buffer_owner(a)
+        if isinstance(owner, np.ndarray) and id(owner) not in shared_owners:
+            owned[id(owner)] = owner.nbytes
+    return sum(owned.values())
@@ -0,0 +1,120 @@
+"""Flow-duration (exceedance) curves and percentile lookups.
+
+FlowDuration lays the daily means out as sorted segments - one lexsort by
+(group, value), the layout grouped_flow_stats uses - for each grouping
+
+    record       the whole record
+    month        each month of the year (all Augusts)
+    year         each calendar year
+    year_month   each calendar month (August 2021)
+
+built once per data version. After that "the flow exceeded on p of the days"
+is an interpolation between two positions of a segment, and "the share of days
+a flow is exceeded" is a binary search - nothing is re-sorted per query.
+
+Exceedance p is a share of days (0-1); the flow exceeded on p of the days is
+the (1 - p) quantile with numpy's default 'linear' interpolation, so Q50 is
+the median_flow of the monthly aggregations.
+"""
+import numpy as np
+import pandas as pd
+
+from gauge_metrics import instrumented
+
+# exceedance probabilities the curves are drawn at - dense at both tails
+EXCEEDANCE_GRID = np.unique(np.concatenate([
+    np.geomspace(0.001, 0.05, 40),
+    np.linspace(0.05, 0.95, 91),
+    1 - np.geomspace(0.001, 0.05, 40),
+]))
+
+# the usual flow-duration percentiles - Q10 is high flow, Q90 base flow
+DURATION_EXCEEDANCES = (0.1, 0.5, 0.9)
+
+
+def _segments(group_ids: np.ndarray, values: np.ndarray, n_groups: int) -> tuple[np.ndarray, np.ndarray]:
+    """(values sorted by group then value, group bounds - group g is values[bounds[g]:bounds[g + 1]])."""
+    order = np.lexsort((values, group_ids))
+    bounds = np.zeros(n_groups + 1, dtype=np.int64)
+    np.cumsum(np.bincount(group_ids, minlength=n_groups), out=bounds[1:])
+    return values[order], bounds
+
+
+def flow_exceeded(sorted_values: np.ndarray, exceedance):
+    """Flow exceeded on the given share(s) of days of an ascending array; NaN if it is empty."""
+    exceedance = np.asarray(exceedance, dtype=np.float64)
+    if not len(sorted_values):
+        return np.full(exceedance.shape, np.nan)[()]
+    position = (1 - np.clip(exceedance, 0, 1)) * (len(sorted_values) - 1)
+    below = np.floor(position).astype(np.int64)
+    above = np.minimum(below + 1, len(sorted_values) - 1)
+    low, high = sorted_values[below], sorted_values[above]
+    return (low + (high - low) * (position - below))[()]
+
+
+def exceedance_of(sorted_values: np.ndarray, flow):
+    """Share of days of an ascending array with flow strictly above the given flow(s)."""
+    flow = np.asarray(flow, dtype=np.float64)
+    if not len(sorted_values):
+        return np.full(flow.shape, np.nan)[()]
+    return ((len(sorted_values) - np.searchsorted(sorted_values, flow, "right")) / len(sorted_values))[()]
+
+
+class FlowDuration:
+    """Sorted daily means per grouping of a day_data calendar."""
+
+    @instrumented("flow_duration")
+    def __init__(self, day_data: pd.DataFrame):
+        mean_flow = day_data["mean_flow"].to_numpy(dtype=np.float64)
+        valid = day_data["has_data"].to_numpy(dtype=bool) & ~np.isnan(mean_flow)
+        values = mean_flow[valid]
+        months = day_data["month"].to_numpy()[valid].astype(np.int64) - 1
+        years = day_data["year"].to_numpy()[valid].astype(np.int64)
+
+        self.first_year = int(day_data["year"].iloc[0]) if len(day_data) else 0
+        n_years = int(day_data["year"].iloc[-1]) - self.first_year + 1 if len(day_data) else 0
+        year_ids = years - self.first_year
+        self._groups = {
+            "record": _segments(np.zeros(len(values), dtype=np.int64), values, 1),
+            "month": _segments(months, values, 12),
+            "year": _segments(year_ids, values, n_years),
+            "year_month": _segments(year_ids * 12 + months, values, n_years * 12),
+        }
+
+    def values(self, month: int | None = None, year: int | None = None) -> np.ndarray:
+        """Ascending daily means of the record, a month of the year, a year, or one month of one year."""
+        if month is not None and not 1 <= month <= 12:
+            raise ValueError(f"month must be 1-12, got {month}")
+        if year is None:
+            grouping, group = ("record", 0) if month is None else ("month", month - 1)
+        else:
+            year_id = year - self.first_year
+            grouping, group = ("year", year_id) if month is None else ("year_month", year_id * 12 + month - 1)
+        values, bounds = self._groups[grouping]
+        if not 0 <= group < len(bounds) - 1:
+            return values[:0]
+        return values[bounds[group]:bounds[group + 1]]
+
+    def flow_exceeded(self, exceedance, month: int | None = None, year: int | None = None):
+        """Flow exceeded on the given share(s) of days, e.g. flow_exceeded(0.1, month=8)."""
+        return flow_exceeded(self.values(month, year), exceedance)
+
+    def exceedance(self, flow, month: int | None = None, year: int | None = None):
+        """Share of days with flow above the given flow(s)."""
+        return exceedance_of(self.values(month, year), flow)
+
+    def curve(self, month: int | None = None, year: int | None = None,
+              grid: np.ndarray = EXCEEDANCE_GRID) -> pd.DataFrame:
+        """Flow-duration curve - flow exceeded at each exceedance of the grid, and the days behind it."""
+        values = self.values(month, year)
+        return pd.DataFrame({"exceedance": grid, "flow": flow_exceeded(values, grid)}).assign(days=len(values))
+
+    def percentile_table(self, exceedances=DURATION_EXCEEDANCES, year: int | None = None) -> pd.DataFrame:
+        """One row per month of the year - days with data and a Qp column per exceedance p."""
+        exceedances = np.asarray(exceedances, dtype=np.float64)
+        segments = [self.values(month, year) for month in range(1, 13)]
+        table = pd.DataFrame(np.array([flow_exceeded(values, exceedances) for values in segments]).reshape(12, -1),
+                             columns=[f"Q{p * 100:g}" for p in exceedances])
+        table.insert(0, "days", [len(values) for values in segments])
+        table.insert(0, "month", np.arange(1, 13))
+        return table
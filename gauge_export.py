@@ -0,0 +1,232 @@
+"""Headless export of gauges to static HTML and JSON.
+
+    python gauge_export.py --out export [--sites 09485000 09484000] [--workers 4]
+
+Runs the notebook's pipeline - fetch, daily calendar, monthly aggregation,
+streaks, annual summaries and figures - for every configured gauge, one site
+per worker process, and writes:
+
+    <out>/<site_id>.json   computed statistics
+    <out>/<site_id>.html   standalone page (plotly from the CDN)
+    <out>/index.html       links to every exported site
+    <out>/index.json       site ids, names and data versions
+
+The files can be served as-is by any static file server; re-run the export
+(e.g. nightly) for fresh data. Fetching goes through the local store, so the
+export also leaves every site's daily values warm for the notebook.
+"""
+import argparse
+import html
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from gauge_cache import PIPELINE_VERSION, series_fingerprint
+from gauge_figures import (
+    days_of_flow_tiles,
+    max_flow_heatmap,
+    monthly_flow_band_linear,
+    summary_lists_html,
+)
+from gauge_sites import GAUGE_SITE_IDS, GAUGE_SITE_LABELS
+from gauge_stats import (
+    DRY,
+    WET,
+    annual_mean_flow,
+    build_day_data,
+    calendar_bounds,
+    current_run,
+    find_runs,
+    month_of_year_flow_stats,
+    monthly_flow_stats,
+    ranked_years,
+    top_flow_days,
+    top_runs,
+)
+from gauge_store import load_daily_values, load_many_daily_values
+
+log = logging.getLogger(__name__)
+
+_PLOT_CONFIG = {"displayModeBar": False, "scrollZoom": False, "doubleClick": False}
+
+
+def site_stats(gauge_values: pd.DataFrame, today: date | None = None,
+               wet_threshold: float = 0.0, max_gap: int = 0) -> dict:
+    """Every derived artifact the notebook shows for one gauge."""
+    start_date, end_date = calendar_bounds(gauge_values, today)
+    day_data = build_day_data(gauge_values, start_date, end_date)
+    runs = find_runs(day_data, wet_threshold=wet_threshold, max_gap=max_gap)
+    annual_mean = annual_mean_flow(day_data)
+    wettest, driest = ranked_years(annual_mean, 10)
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "wet_threshold": wet_threshold,
+        "max_gap": max_gap,
+        "day_data": day_data,
+        "month_data": monthly_flow_stats(day_data).fillna({"max_mean_flow": 0}),
+        "month_summary_data": month_of_year_flow_stats(day_data),
+        "top10_wet": top_runs(runs, WET, 10),
+        "top10_dry": top_runs(runs, DRY, 10),
+        "current_streak": current_run(runs),
+        "annual_mean": annual_mean,
+        "wettest": wettest,
+        "driest": driest,
+        "top10_flow": top_flow_days(day_data, 10),
+    }
+
+
+def frame_records(frame: pd.DataFrame | pd.Series) -> list[dict]:
+    """JSON-ready records - dates as YYYY-MM-DD, NaN as null."""
+    if isinstance(frame, pd.Series):
+        frame = frame.reset_index()
+    frame = frame.copy()
+    for c in frame.columns:
+        if pd.api.types.is_datetime64_any_dtype(frame[c]):
+            frame[c] = frame[c].dt.strftime("%Y-%m-%d")
+    return json.loads(frame.to_json(orient="records"))
+
+
+def _streak_record(streak: pd.DataFrame) -> dict | None:
+    """The current streak as {state: wet|dry, start, end, length}; None without data."""
+    if streak.empty:
+        return None
+    return frame_records(streak.assign(state=np.where(streak["state"] == WET, "wet", "dry")))[0]
+
+
+def site_bundle(site_id: str, site_name: str, data_version: str, stats: dict) -> dict:
+    """The JSON document for one site."""
+    return {
+        "site_id": site_id,
+        "site_name": site_name,
+        "data_version": data_version,
+        "pipeline_version": PIPELINE_VERSION,
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "start_date": stats["start_date"].isoformat(),
+        "end_date": stats["end_date"].isoformat(),
+        "streak_settings": {"wet_threshold": stats["wet_threshold"], "max_gap": stats["max_gap"]},
+        "month_data": frame_records(stats["month_data"]),
+        "month_summary_data": frame_records(stats["month_summary_data"]),
+        "top10_wet": frame_records(stats["top10_wet"]),
+        "top10_dry": frame_records(stats["top10_dry"]),
+        "current_streak": _streak_record(stats["current_streak"]),
+        "annual_mean": frame_records(stats["annual_mean"]),
+        "wettest": frame_records(stats["wettest"]),
+        "driest": frame_records(stats["driest"]),
+        "top10_flow": frame_records(stats["top10_flow"][["date_str", "mean_flow"]]),
+    }
+
+
+def _section(title: str, body: str) -> str:
+    return f"""
+    <h2 style="text-align:center;">{title}</h2>
+    <hr style="width:100%; border:none; border-top:1px solid #ddd; margin:30px 0;">
+    {body}
+    <hr style="width:100%; border:none; border-top:1px solid #ddd; margin:30px 0;">
+    """
+
+
+def site_page_html(title: str, stats: dict) -> str:
+    """Standalone HTML page with the notebook's sections for one site."""
+    tiles = "".join(f"<div>{t}</div>" for t in days_of_flow_tiles(stats["month_data"]))
+    band = monthly_flow_band_linear(stats["month_summary_data"]).to_html(
+        full_html=False, include_plotlyjs="cdn", config=_PLOT_CONFIG)
+    heatmap = max_flow_heatmap(stats["month_data"]).to_html(
+        full_html=False, include_plotlyjs=False, config=_PLOT_CONFIG)
+    lists = summary_lists_html(stats["top10_wet"], stats["top10_dry"], stats["wettest"], stats["driest"],
+                               stats["top10_flow"], wet_threshold=stats["wet_threshold"])
+
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{html.escape(title)}</title>
+</head>
+<body style="font-family:sans-serif; max-width:1100px; margin:0 auto; padding:12px;">
+<h1>{html.escape(title)}</h1>
+<p><a href="index.html">All gauges</a></p>
+{_section("Days of Flow", f'<div style="display:flex; flex-wrap:wrap; column-gap:2px; row-gap:12px; align-items:flex-start;">{tiles}</div>')}
+{_section("Monthly Flow - Median with 25-75% Band", band)}
+{_section("Max Daily Mean Flow by Month", heatmap)}
+{lists}
+</body>
+</html>
+"""
+
+
+def _site_label(site_id: str, site_name: str) -> str:
+    return GAUGE_SITE_LABELS.get(site_id, f"{site_name} -- {site_id}")
+
+
+def export_site(site_id: str, out_dir: Path, today: date | None = None) -> dict | None:
+    """Compute and write one site's bundle and page; returns its index entry (None without data)."""
+    gauge_values = load_daily_values(site_id)
+    if gauge_values.empty:
+        log.warning("no daily values for site %s - skipped", site_id)
+        return None
+
+    site_name = str(gauge_values["siteName"].iloc[0])
+    data_version = series_fingerprint(gauge_values)
+    stats = site_stats(gauge_values, today)
+
+    bundle = site_bundle(site_id, site_name, data_version, stats)
+    (out_dir / f"{site_id}.json").write_text(json.dumps(bundle))
+    (out_dir / f"{site_id}.html").write_text(site_page_html(_site_label(site_id, site_name), stats))
+
+    return {"site_id": site_id, "site_name": site_name, "data_version": data_version}
+
+
+def _index_html(entries: list[dict]) -> str:
+    items = "".join(
+        f'<li><a href="{e["site_id"]}.html">{html.escape(_site_label(e["site_id"], e["site_name"]))}</a>'
+        f' (<a href="{e["site_id"]}.json">json</a>)</li>'
+        for e in entries
+    )
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"><title>Tucson Area USGS Stream Gauges</title></head>
+<body style="font-family:sans-serif;">
+<h1>Tucson Area USGS Stream Gauges</h1>
+<ul>{items}</ul>
+</body>
+</html>
+"""
+
+
+def export_all(site_ids: list[str], out_dir: Path, workers: int | None = None) -> list[dict]:
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    # one batched fetch up front - the workers then read the local store
+    load_many_daily_values(site_ids)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        entries = [e for e in pool.map(export_site, site_ids, [out_dir] * len(site_ids)) if e is not None]
+
+    (out_dir / "index.json").write_text(json.dumps(entries))
+    (out_dir / "index.html").write_text(_index_html(entries))
+    return entries
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Export USGS gauge statistics to static HTML and JSON.")
+    parser.add_argument("--out", type=Path, default=Path("export"), help="output directory")
+    parser.add_argument("--sites", nargs="+", default=GAUGE_SITE_IDS, help="USGS site ids (default: all configured)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    entries = export_all(args.sites, args.out, args.workers)
+    log.info("exported %d of %d sites to %s", len(entries), len(args.sites), args.out)
+    return 0 if entries else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,447 @@
+"""Figure and HTML builders for the gauge notebook and the static export."""
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from gauge_metrics import instrumented
+
+# --- Days of Flow small multiples ---
+FACET_W = 90
+FACET_H = 70
+FACET_TOP = 10    # room for the year label
+FACET_BOTTOM = 2
+LINE_COLOR = "#3366cc"
+BAR_COLOR = "rgba(200,200,200,0.4)"
+BAR_GAP = 0.2
+
+
+def month_grid(month_data: pd.DataFrame, column: str) -> tuple[np.ndarray, np.ndarray]:
+    """(years, years x 12 matrix) of a month_data column - NaN where a month is absent."""
+    years, year_ids = np.unique(month_data["year"].to_numpy(), return_inverse=True)
+    grid = np.full((len(years), 12), np.nan)
+    grid[year_ids, month_data["month"].to_numpy().astype(np.int64) - 1] = month_data[column].to_numpy(dtype=float)
+    return years, grid
+
+
+def _days_of_flow_svg(year: int, days_with_data: np.ndarray, days_with_flow: np.ndarray) -> str:
+    plot_h = FACET_H - FACET_TOP - FACET_BOTTOM
+    band = FACET_W / 12
+    bar_w = band * (1 - BAR_GAP)
+
+    # safe headroom; base at 0
+    y_top = max(31.0, np.nanmax(days_with_data, initial=0), np.nanmax(days_with_flow, initial=0)) + 0.6
+
+    def y(v):
+        return FACET_TOP + plot_h * (1 - v / y_top)
+
+    # bars should show 0 for missing months
+    bars = "".join(
+        f'<rect x="{i * band + (band - bar_w) / 2:.2f}" y="{y(v):.2f}" width="{bar_w:.2f}" height="{FACET_TOP + plot_h - y(v):.2f}"/>'
+        for i, v in enumerate(np.nan_to_num(days_with_data))
+    )
+
+    # line hidden where there is no data that month - a gap starts a new subpath
+    path, pen_down = [], False
+    for i, (d, f) in enumerate(zip(days_with_data, days_with_flow)):
+        if d > 0 and not np.isnan(f):
+            path.append(f'{"L" if pen_down else "M"}{(i + 0.5) * band:.2f} {y(f):.2f}')
+            pen_down = True
+        else:
+            pen_down = False
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{FACET_W}" height="{FACET_H}" '
+        f'viewBox="0 0 {FACET_W} {FACET_H}" role="img" aria-label="{year}">'
+        f'<g fill="{BAR_COLOR}">{bars}</g>'
+        f'<path d="{"".join(path)}" fill="none" stroke="{LINE_COLOR}" stroke-width="2" stroke-linejoin="round"/>'
+        f'<text x="0" y="8" font-size="9" font-family="sans-serif" fill="rgba(0,0,0,0.3)">{year}</text>'
+        f'</svg>'
+    )
+
+
+@instrumented()
+def days_of_flow_tiles(month_data: pd.DataFrame) -> list[str]:
+    """One static inline SVG per year - days with data (bars) and days with flow (line) by month.
+
+    Built from a single reshape of month_data into year x month grids instead of
+    filtering the frame per year; plain SVG needs no plotly runtime in the browser.
+    """
+    years, days_with_data = month_grid(month_data, "days_with_data")
+    _, days_with_flow = month_grid(month_data, "days_with_flow")
+    return [_days_of_flow_svg(int(y), days_with_data[i], days_with_flow[i]) for i, y in enumerate(years)]
+
+
+# --- Monthly band and heatmap (plotly) ---
+MONTH_LABELS = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
+
+
+@instrumented()
+def monthly_flow_band_linear(
+    month_summary_data: pd.DataFrame,
+    y_title="Flow (cfs)"
+) -> go.Figure:
+    # --- Keep only needed columns and ensure months 1–12 ---
+    cols = ["month", "median_flow",
+            "twenty_five_quantile_flow", "seventy_five_quantile_flow"]
+    df = month_summary_data[cols].copy()
+
+    df["month"] = df["month"].astype(int)
+    month_index = pd.Index(np.arange(1, 13), name="month")
+    df = df.set_index("month").reindex(month_index).reset_index()
+
+    # ensure numeric (preserve NaN)
+    for c in ["median_flow", "twenty_five_quantile_flow", "seventy_five_quantile_flow"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+
+    # --- Handle swapped quantiles (rare but safe check) ---
+    # float32 - sent as base64 typed arrays, formatted client-side by hovertemplate
+    q25 = df["twenty_five_quantile_flow"].to_numpy(dtype=np.float32)
+    q75 = df["seventy_five_quantile_flow"].to_numpy(dtype=np.float32)
+    median = df["median_flow"].to_numpy(dtype=np.float32)
+    swap_mask = (q25 > q75) & np.isfinite(q25) & np.isfinite(q75)
+    if np.any(swap_mask):
+        tmp = q25.copy()
+        q25[swap_mask] = q75[swap_mask]
+        q75[swap_mask] = tmp[swap_mask]
+
+    x = MONTH_LABELS
+
+    # --- Plotly figure ---
+    fig = go.Figure()
+
+    # Lower bound (q25) invisible anchor
+    fig.add_trace(go.Scatter(
+        x=x, y=q25,
+        mode="lines",
+        line=dict(width=0),
+        showlegend=False,
+        hoverinfo="skip"
+    ))
+
+    # Upper bound (q75) filled to q25
+    fig.add_trace(go.Scatter(
+        x=x, y=q75,
+        mode="lines",
+        line=dict(width=0),
+        fill="tonexty",
+        name="25–75% band",
+        hoverinfo="skip",
+        # optional: set a subtle fill if you want
+        # fillcolor="rgba(31,119,180,0.2)"
+    ))
+
+    # Median line (+ show band in tooltip via customdata)
+    custom = np.column_stack([q25, q75])
+    fig.add_trace(go.Scatter(
+        x=x, y=median,
+        mode="lines+markers",
+        name="Median",
+        customdata=custom,
+        hovertemplate=(
+            "Month: %{x}<br>"
+            "Median: %{y:.2f} cfs<br>"
+            "25–75%: %{customdata[0]:.2f}–%{customdata[1]:.2f} cfs"
+            "<extra></extra>"
+        )
+    ))
+
+    # --- Layout (mobile/static friendly) ---
+    fig.update_layout(
+        title=None,
+        xaxis_title="",
+        yaxis_title=y_title,
+        margin=dict(l=8, r=8, t=40, b=30),
+        height=280,
+        legend=dict(orientation="h", y=1.1, x=0),
+        hovermode="x unified",
+        dragmode=False,
+        plot_bgcolor="white",
+        paper_bgcolor="white"
+    )
+
+    fig.update_xaxes(fixedrange=True)
+    fig.update_yaxes(rangemode="tozero", fixedrange=True, tickformat="~s")  # 1.2k style
+
+    return fig
+
+
+@instrumented()
+def max_flow_heatmap(month_data: pd.DataFrame) -> go.Figure:
+    """Year x month heatmap of the max daily mean flow (log scale)."""
+    years, mmf = month_grid(month_data, "max_mean_flow")
+
+    # float32 is plenty for a color scale and a 2-decimal tooltip; plotly ships
+    # numpy arrays as base64 typed arrays, and the tooltip is formatted in the
+    # browser from customdata - no per-cell strings. NaN cells are gaps.
+    z_logged = np.log10(mmf + 1).astype(np.float32)
+    flow = mmf.astype(np.float32)
+    years = years.astype(np.int16)
+
+    fig = go.Figure(
+        data=go.Heatmap(
+            z=z_logged,
+            x=MONTH_LABELS,
+            y=years,
+            colorscale="PuBu",
+            customdata=flow,
+            hovertemplate=(
+                "Year: %{y}<br>"
+                "Month: %{x}<br>"
+                "max_mean_flow: %{customdata:.2f}<extra></extra>"
+            ),
+            colorbar=dict(
+                title="log₁₀",
+                orientation="h",
+                x=0.5,
+                xanchor="center",
+                y=1.02,
+                yanchor="bottom",
+                len=0.8,
+                thickness=15
+            ),
+            showscale=True,
+            hoverongaps=False
+        )
+    )
+
+    # Size per year for mobile
+    row_height = 20
+    total_height = max(400, len(years) * row_height)
+
+    fig.update_layout(
+        title="",
+        xaxis=dict(title="", fixedrange=True, showgrid=False),
+        yaxis=dict(
+            title="",
+            # years as categories - one row each, never a continuous (fractional) scale
+            type="category",
+            autorange="reversed",
+            fixedrange=True,
+            showgrid=False,
+            tickmode="array",
+            tickvals=years,
+            ticktext=years.astype(str),
+        ),
+        margin=dict(l=4, r=4, t=2, b=10),
+        height=total_height,
+        paper_bgcolor="white",
+        plot_bgcolor="white",
+        hovermode="x unified",
+        dragmode=False
+    )
+
+    return fig
+
+
+@instrumented()
+def flow_duration_figure(curves: dict[str, pd.DataFrame]) -> go.Figure:
+    """Flow-duration curves by label - % of days exceeded vs flow (log scale, so zero flows drop off)."""
+    fig = go.Figure()
+    for label, curve in curves.items():
+        flow = curve["flow"].to_numpy(dtype=np.float32)
+        fig.add_trace(go.Scatter(
+            x=curve["exceedance"].to_numpy(dtype=np.float32) * 100,
+            y=np.where(flow > 0, flow, np.nan),
+            mode="lines",
+            name=f"{label} ({int(curve['days'].iloc[0]):,} days)" if len(curve) else label,
+            hovertemplate="%{y:.2f} cfs exceeded on %{x:.1f}% of days<extra></extra>",
+        ))
+
+    fig.update_layout(
+        title=None,
+        xaxis_title="Days flow is exceeded (%)",
+        yaxis_title="Flow (cfs)",
+        margin=dict(l=8, r=8, t=40, b=30),
+        height=320,
+        legend=dict(orientation="h", y=1.1, x=0),
+        dragmode=False,
+        plot_bgcolor="white",
+        paper_bgcolor="white"
+    )
+    fig.update_xaxes(range=[0, 100], fixedrange=True, showgrid=True, gridcolor="#eee")
+    fig.update_yaxes(type="log", fixedrange=True, showgrid=True, gridcolor="#eee")
+    return fig
+
+
+# --- Streak / year / top flow lists ---
+def fmt_cfs(x):
+    if pd.isna(x): return "—"
+    if x >= 1000:  return f"{x:,.0f}"
+    if x >= 100:   return f"{x:,.0f}"
+    if x >= 10:    return f"{x:,.1f}"
+    return f"{x:,.2f}"
+
+
+def fmt_date(d):
+    return d.strftime("%Y-%m-%d") if pd.notna(d) else "—"
+
+
+def _streak_list_html(streaks: pd.DataFrame, kind: str) -> str:
+    if streaks.empty:
+        return f"<li>No {kind} streaks found</li>"
+    return "".join(
+        f"<li><strong>{int(r.length)}</strong> days &nbsp; "
+        f"({fmt_date(r.start)} → {fmt_date(r.end)})</li>"
+        for r in streaks.itertuples(index=False)
+    )
+
+
+def _year_list_html(series: pd.Series) -> str:
+    if series.empty:
+        return "<li>No eligible years</li>"
+    return "".join(
+        f"<li><strong>{int(y)}</strong> — {fmt_cfs(v)} cfs</li>"
+        for y, v in series.items()
+    )
+
+
+def _flow_list_html(top10_flow: pd.DataFrame) -> str:
+    return "".join(
+        f"<li>{r.date_str}: {fmt_cfs(r.mean_flow)} cfs</li>"
+        for r in top10_flow.itertuples(index=False)
+    )
+
+
+@instrumented()
+def summary_lists_html(top10_wet, top10_dry, wettest, driest, top10_flow, wet_threshold: float = 0.0) -> str:
+    return f"""
+    <style>
+    .section {{ margin-bottom: 30px; }}
+    .top-list {{ margin: 12px 0 0 20px; padding: 0; }}
+    .top-list li {{ margin: 4px 0; }}
+    h3 {{ margin: 16px 0 6px 0; }}
+    </style>
+
+    <div class="section">
+      <h3>Top 10 Wet Streaks (&gt; {wet_threshold:g} cfs)</h3>
+      <ol class="top-list">{_streak_list_html(top10_wet, "wet")}</ol>
+    </div>
+
+    <div class="section">
+      <h3>Top 10 Dry Streaks</h3>
+      <ol class="top-list">{_streak_list_html(top10_dry, "dry")}</ol>
+    </div>
+
+    <div class="section">
+      <h3>Top 10 Wettest Years (annual mean, full coverage)</h3>
+      <ol class="top-list">{_year_list_html(wettest)}</ol>
+    </div>
+
+    <div class="section">
+      <h3>Top 10 Driest Years (annual mean, full coverage)</h3>
+      <ol class="top-list">{_year_list_html(driest)}</ol>
+    </div>
+
+    <div class="section">
+      <h3>Top 10 Daily Mean Flow Days</h3>
+      <ol class="top-list">{_flow_list_html(top10_flow)}</ol>
+    </div>
+    """
+
+
+@instrumented()
+def range_summary_html(label: str, totals: dict, wettest: pd.Series, driest: pd.Series) -> str:
+    """Totals of a date range / season and its wettest and driest years."""
+    share = f"{totals['share_with_flow']:.0%}" if pd.notna(totals["share_with_flow"]) else "—"
+    return f"""
+    <div class="section">
+      <h3>{label}</h3>
+      <p>{totals['days_with_data']:,} of {totals['days']:,} days with data ({totals['coverage']:.0%}) &nbsp;·&nbsp;
+         {totals['days_with_flow']:,} days with flow ({share} of days with data) &nbsp;·&nbsp;
+         mean flow {fmt_cfs(totals['mean_flow'])} cfs</p>
+    </div>
+
+    <div class="section">
+      <h3>Wettest Years (season mean, full coverage)</h3>
+      <ol class="top-list">{_year_list_html(wettest)}</ol>
+    </div>
+
+    <div class="section">
+      <h3>Driest Years (season mean, full coverage)</h3>
+      <ol class="top-list">{_year_list_html(driest)}</ol>
+    </div>
+    """
+
+
+# --- Regional comparison (site x month / site x day matrices from gauge_region) ---
+def _regional_layout(fig: go.Figure, n_sites: int) -> go.Figure:
+    fig.update_layout(
+        title="",
+        xaxis=dict(title="", showgrid=False),
+        yaxis=dict(title="", autorange="reversed", fixedrange=True, showgrid=False),
+        margin=dict(l=4, r=4, t=2, b=10),
+        height=max(300, 60 + n_sites * 22),
+        paper_bgcolor="white",
+        plot_bgcolor="white",
+        dragmode="pan",
+    )
+    return fig
+
+
+def _colorbar(title: str) -> dict:
+    return dict(title=title, orientation="h", x=0.5, xanchor="center", y=1.02, yanchor="bottom",
+                len=0.8, thickness=15)
+
+
+@instrumented()
+def regional_days_of_flow_heatmap(region: dict, site_labels: list[str]) -> go.Figure:
+    """Site x month share of days with flow (of days with data)."""
+    days_with_data = region["days_with_data"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        share = (region["days_with_flow"] / days_with_data).astype(np.float32)  # NaN without data
+
+    fig = go.Figure(go.Heatmap(
+        z=share,
+        x=region["months"].astype("datetime64[D]"),
+        y=site_labels,
+        zmin=0,
+        zmax=1,
+        colorscale="PuBu",
+        customdata=region["days_with_flow"],
+        hovertemplate="%{y}<br>%{x|%b %Y}: %{customdata} days of flow (%{z:.0%})<extra></extra>",
+        colorbar=_colorbar("share of days with flow"),
+        hoverongaps=False,
+    ))
+    return _regional_layout(fig, len(site_labels))
+
+
+@instrumented()
+def regional_max_flow_heatmap(region: dict, site_labels: list[str]) -> go.Figure:
+    """Site x month max daily mean flow (log scale)."""
+    max_flow = region["max_mean_flow"]
+    fig = go.Figure(go.Heatmap(
+        z=np.log10(max_flow + 1).astype(np.float32),
+        x=region["months"].astype("datetime64[D]"),
+        y=site_labels,
+        colorscale="PuBu",
+        customdata=max_flow,
+        hovertemplate="%{y}<br>%{x|%b %Y}: max_mean_flow %{customdata:.2f}<extra></extra>",
+        colorbar=_colorbar("log₁₀"),
+        hoverongaps=False,
+    ))
+    return _regional_layout(fig, len(site_labels))
+
+
+@instrumented()
+def regional_day_flow_heatmap(region: dict, site_labels: list[str], year: int) -> go.Figure:
+    """Which sites had flow on each day of a year - site x day, blank without data."""
+    dates = region["dates"]
+    in_year = (dates >= np.datetime64(f"{year}-01-01")) & (dates <= np.datetime64(f"{year}-12-31"))
+    mean_flow = region["mean_flow"][:, in_year]
+    flowing = np.where(region["has_data"][:, in_year], (mean_flow > 0).astype(np.float32), np.nan).astype(np.float32)
+
+    fig = go.Figure(go.Heatmap(
+        z=flowing,
+        x=dates[in_year],
+        y=site_labels,
+        zmin=0,
+        zmax=1,
+        colorscale=[[0, "#f1eef6"], [1, LINE_COLOR]],
+        showscale=False,
+        customdata=mean_flow,
+        hovertemplate="%{y}<br>%{x|%b %d, %Y}: %{customdata:.2f} cfs<extra></extra>",
+        hoverongaps=False,
+    ))
+    fig = _regional_layout(fig, len(site_labels))
+    fig.update_xaxes(fixedrange=True, tickformat="%b")
+    return fig
@@ -0,0 +1,422 @@
+"""Running statistics for a gauge that a refreshed series updates in place.
+
+A nightly refresh usually appends a day and revises the provisional ("P") tail,
+yet the batch functions in gauge_stats recompute the calendar, every month,
+the climatology, every run and the annual means over the whole record.
+IncrementalGaugeStats keeps running state instead:
+
+    day arrays      has_data / has_flow / mean_flow on the dense calendar
+    month partials  per calendar month: day counts, valid count, sum, max and
+                    quantiles - annual means and the climatology mean are
+                    reduced from these
+    climatology     per month of the year, the sorted values with data
+    runs            per streak setting, bounded top-k heaps of runs that can
+                    no longer change plus the open runs after them
+    top flow days   a bounded top-k heap of days that can no longer change
+
+Everything before the first provisional observation counts as approved and
+frozen. An update finds the first day whose observations changed and
+recomputes from there - the month it falls in, the open runs and the
+provisional tail, never the whole record. A change inside the frozen part (a
+revised approved value, a backfilled gap) or a new calendar year rebuilds
+from scratch, so the results always match the batch functions; the annual and
+climatology means are summed from month partials and may differ from them in
+the last bits.
+"""
+import heapq
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from gauge_metrics import instrumented
+from gauge_stats import (
+    DRY,
+    FLOW_QUANTILES,
+    WET,
+    bridge_gaps,
+    calendar_bounds,
+    flow_states,
+    grouped_flow_stats,
+    run_lengths,
+    scatter_days,
+    year_month,
+)
+
+# longest runs / highest days kept per heap - the notebook shows ten of each
+TOP_K = 10
+
+# streak settings tracked per gauge before the least recently used is dropped
+RUN_SETTINGS = 8
+
+# gauges (and value sources) tracked per process
+TRACKED_SERIES = 64
+
+_DAY_NS = 86_400 * 10**9
+
+
+def _run_start(states: np.ndarray, i: int) -> int:
+    """First index of the run of equal values containing index i - scans back from i only."""
+    hi, step = i, 64
+    while hi > 0:
+        lo = max(0, hi - step)
+        different = np.flatnonzero(states[lo:hi] != states[i])
+        if len(different):
+            return lo + int(different[-1]) + 1
+        hi, step = lo, step * 4
+    return 0
+
+
+def _push_top(heap: list, keys: np.ndarray, starts: np.ndarray, k: int) -> None:
+    """Add candidates to a min-heap of the k largest keys (earlier start winning ties)."""
+    for i in np.lexsort((starts, -keys))[:k]:
+        heapq.heappush(heap, (keys[i].item(), -int(starts[i])))
+        if len(heap) > k:
+            heapq.heappop(heap)
+
+
+def _top(heap: list, keys: np.ndarray, starts: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """(keys, starts) of the k best among the heap and the candidates, best first."""
+    keys = np.concatenate((np.array([key for key, _ in heap], dtype=keys.dtype), keys))
+    starts = np.concatenate((np.array([-start for _, start in heap], dtype=np.int64), starts))
+    order = np.lexsort((starts, -keys))[:k]
+    return keys[order], starts[order]
+
+
+def _provisional(qualifiers: pd.Series) -> np.ndarray:
+    """Whether each observation is provisional ("P" among its qualifiers)."""
+    quals = pd.Categorical(qualifiers)
+    flags = np.array([False] + ["P" in str(c).split(",") for c in quals.categories])
+    return flags[quals.codes.astype(np.int64) + 1]  # code -1 (missing) -> False
+
+
+def _sorted_quantile(values: np.ndarray, q: float) -> float:
+    # numpy's default 'linear' method, as in grouped_flow_stats
+    if not len(values):
+        return np.nan
+    position = q * (len(values) - 1)
+    below = int(np.floor(position))
+    above = min(below + 1, len(values) - 1)
+    return values[below] + (values[above] - values[below]) * (position - below)
+
+
+class _Runs:
+    """Wet/dry runs for one streak setting.
+
+    Runs starting before `restart` can no longer change - only the k longest of
+    each state are kept, in min-heaps keyed (length, -start). The runs from
+    restart on are re-derived whenever a day after the frozen boundary changes.
+    """
+
+    def __init__(self, wet_threshold: float, max_gap: int, k: int):
+        self.wet_threshold = wet_threshold
+        self.max_gap = max_gap
+        self.k = k
+        self.raw = None  # unbridged day states of the whole calendar
+        self.restart = 0
+        self.heaps = {WET: [], DRY: []}
+        self.states = np.empty(0, dtype=np.int8)
+        self.starts = self.lengths = np.empty(0, dtype=np.int64)
+
+    def update(self, has_data: np.ndarray, mean_flow: np.ndarray, first_day: int) -> None:
+        if self.raw is None:
+            self.raw = flow_states(has_data, mean_flow, self.wet_threshold)
+        else:
+            self.raw[first_day:] = flow_states(has_data[first_day:], mean_flow[first_day:], self.wet_threshold)
+        # bridging a run looks at its neighbours - start one raw run early for context
+        context = _run_start(self.raw, self.restart - 1) if self.restart else 0
+        bridged = bridge_gaps(self.raw[context:], self.max_gap)[self.restart - context:]
+        self.states, starts, self.lengths = run_lengths(bridged)
+        self.starts = starts + self.restart
+
+    def freeze(self, frozen_day: int) -> None:
+        """Move the runs no change on/after frozen_day can reach into the heaps.
+
+        A change there can alter the raw run containing frozen_day and the
+        length of the one before it (so how that one bridges), but nothing
+        earlier - the bridged run holding the day before those two is the new
+        restart.
+        """
+        if not len(self.raw):
+            return
+        current = _run_start(self.raw, min(frozen_day, len(self.raw) - 1))
+        previous = _run_start(self.raw, current - 1) if current else 0
+        if previous <= self.restart:
+            return
+        i = int(np.searchsorted(self.starts, previous - 1, "right")) - 1
+        for state in (WET, DRY):
+            done = self.states[:i] == state
+            _push_top(self.heaps[state], self.lengths[:i][done], self.starts[:i][done], self.k)
+        self.restart = int(self.starts[i])
+        self.states, self.starts, self.lengths = self.states[i:], self.starts[i:], self.lengths[i:]
+
+
+class IncrementalGaugeStats:
+    """Derived statistics of one gauge's series, updated from the first changed day.
+
+    The series must be in date order, as every loader returns it. Not thread
+    safe on its own - use incremental_stats(), which holds the lock.
+    """
+
+    def __init__(self, k: int = TOP_K, quantiles: dict[str, float] = FLOW_QUANTILES):
+        self.k = k
+        self.quantiles = quantiles
+        self.lock = threading.Lock()
+        self.version = None
+        self.start_date = self.end_date = None
+        self.rebuilds = self.updates = 0
+        self._times = None
+
+    def _reset(self, start_date: date, end_date: date) -> None:
+        self.start_date, self.end_date = start_date, end_date
+        self._start_ns = np.datetime64(start_date, "ns").astype(np.int64)
+        self._dates = np.datetime64(start_date, "D") + np.arange((end_date - start_date).days + 1)
+        self._years, self._months = year_month(self._dates)
+        n = len(self._dates)
+        self.has_data = np.zeros(n, dtype=bool)
+        self.has_flow = np.zeros(n, dtype=bool)
+        self.mean_flow = np.full(n, np.nan)
+
+        months = self._dates.astype("datetime64[M]")
+        self._month_starts = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+        self._month_years, self._month_months = year_month(months[self._month_starts])
+        n_months = len(self._month_starts)
+        self._month_stats = {
+            "days_with_data": np.zeros(n_months, dtype=np.int16),
+            "days_with_flow": np.zeros(n_months, dtype=np.int16),
+            "max_mean_flow": np.full(n_months, np.nan),
+            "mean_flow": np.full(n_months, np.nan),
+            **{name: np.full(n_months, np.nan) for name in self.quantiles},
+        }
+        self._valid_days = np.zeros(n_months, dtype=np.int64)
+        self._flow_sums = np.zeros(n_months)
+
+        self._climatology = [np.empty(0) for _ in range(12)]
+        self._top_days = []
+        self._runs = OrderedDict()
+        self._frozen = 0  # calendar days before this are approved and final
+        self._first_provisional = 0  # index of the first provisional observation
+        self._times = self._values = None
+
+    @instrumented("incremental_update")
+    def update(self, gauge_values: pd.DataFrame, version: str | None = None, today: date | None = None) -> None:
+        """Bring the statistics up to gauge_values (a no-op for the version already held)."""
+        if version is not None and version == self.version:
+            return
+        start_date, end_date = calendar_bounds(gauge_values, today)
+        times = gauge_values["dateTime"].to_numpy().astype("datetime64[ns]", copy=False).view(np.int64)
+        values = gauge_values["value"].to_numpy(dtype=np.float64)
+
+        change = None
+        if self._times is not None and (start_date, end_date) == (self.start_date, self.end_date):
+            change = self._first_change(times, values)
+            if change is None:
+                self._times, self._values, self.version = times, values, version
+                return
+        if change is None or change[1] < self._frozen:
+            self._reset(start_date, end_date)
+            change = (0, 0)
+            self.rebuilds += 1
+        else:
+            self.updates += 1
+        first_obs, first_day = change
+
+        old_has_data = self.has_data[first_day:].copy()
+        old_mean_flow = self.mean_flow[first_day:].copy()
+        self._update_days(times, values, first_day)
+        self._update_months(first_day)
+        self._update_climatology(first_day, old_has_data, old_mean_flow)
+        for runs in self._runs.values():
+            runs.update(self.has_data, self.mean_flow, first_day)
+
+        self._times, self._values, self.version = times, values, version
+        self._freeze(gauge_values["qualifiers"], min(first_obs, self._first_provisional))
+
+    def _first_change(self, times: np.ndarray, values: np.ndarray) -> tuple[int, int] | None:
+        """(observation index, calendar day) of the first difference from the held series; None if equal."""
+        n = min(len(times), len(self._times))
+        # one vectorized compare of the common part - the only step that still spans the record
+        different = np.flatnonzero((times[:n] != self._times[:n])
+                                   | (values[:n].view(np.int64) != self._values[:n].view(np.int64)))
+        if len(different):
+            i = int(different[0])
+        elif len(times) == len(self._times):
+            return None
+        else:
+            i = n
+        first = min(t[i] for t in (times, self._times) if i < len(t))
+        return i, max(0, int((first - self._start_ns) // _DAY_NS))
+
+    def _update_days(self, times: np.ndarray, values: np.ndarray, first_day: int) -> None:
+        lo = int(np.searchsorted(times, self._start_ns + first_day * _DAY_NS))
+        offsets = (times[lo:] - self._start_ns) // _DAY_NS - first_day
+        days = len(self._dates) - first_day
+        inside = offsets < days
+        has_data, has_flow, mean_flow = scatter_days(offsets[inside], values[lo:][inside], days)
+        self.has_data[first_day:] = has_data
+        self.has_flow[first_day:] = has_flow
+        self.mean_flow[first_day:] = mean_flow
+
+    def _update_months(self, first_day: int) -> None:
+        """Recompute the month partials from the month holding first_day on."""
+        if first_day >= len(self._dates):
+            return
+        m0 = int(np.searchsorted(self._month_starts, first_day, "right")) - 1
+        d0 = int(self._month_starts[m0])
+        months = self._dates[d0:].astype("datetime64[M]")
+        ids = (months - months[0]).astype(np.int64)
+        n = len(self._month_starts) - m0
+        flow = self.mean_flow[d0:]
+        valid = ~np.isnan(flow)
+
+        stats = grouped_flow_stats(ids, flow, n, self.quantiles)
+        self._month_stats["days_with_data"][m0:] = np.bincount(ids, weights=self.has_data[d0:], minlength=n)
+        self._month_stats["days_with_flow"][m0:] = np.bincount(ids, weights=self.has_flow[d0:], minlength=n)
+        self._month_stats["max_mean_flow"][m0:] = stats.pop("max")
+        self._month_stats["mean_flow"][m0:] = stats.pop("mean")
+        for name, column in stats.items():
+            self._month_stats[name][m0:] = column
+        self._valid_days[m0:] = np.bincount(ids[valid], minlength=n)
+        self._flow_sums[m0:] = np.bincount(ids[valid], weights=flow[valid], minlength=n)
+
+    def _update_climatology(self, first_day: int, old_has_data: np.ndarray, old_mean_flow: np.ndarray) -> None:
+        """Swap the changed days' old values for the new ones in each month-of-year's sorted values."""
+        month_of_year = self._months[first_day:] - 1
+        old = old_has_data & ~np.isnan(old_mean_flow)
+        new = self.has_data[first_day:] & ~np.isnan(self.mean_flow[first_day:])
+        for m in np.unique(month_of_year[old | new]):
+            current = self._climatology[m]
+            gone = np.sort(old_mean_flow[old & (month_of_year == m)])
+            if len(gone):
+                # equal values: the i-th removed copy takes the i-th equal slot
+                rank = np.arange(len(gone)) - np.searchsorted(gone, gone, "left")
+                current = np.delete(current, np.searchsorted(current, gone, "left") + rank)
+            added = np.sort(self.mean_flow[first_day:][new & (month_of_year == m)])
+            self._climatology[m] = np.insert(current, np.searchsorted(current, added), added)
+
+    def _freeze(self, qualifiers: pd.Series, lo: int) -> None:
+        """Advance the frozen boundary to the first provisional observation (or past the last one)."""
+        provisional = np.flatnonzero(_provisional(qualifiers.iloc[lo:]))
+        if len(provisional):
+            self._first_provisional = lo + int(provisional[0])
+            boundary = self._times[self._first_provisional]
+        else:
+            self._first_provisional = len(self._times)
+            boundary = self._times[-1] + _DAY_NS if len(self._times) else self._start_ns
+        frozen = int(np.clip((boundary - self._start_ns) // _DAY_NS, 0, len(self._dates)))
+        if frozen <= self._frozen:
+            return
+
+        days = np.arange(self._frozen, frozen)
+        flows = self.mean_flow[self._frozen:frozen]
+        valid = ~np.isnan(flows)
+        _push_top(self._top_days, flows[valid], days[valid], self.k)
+        self._frozen = frozen
+        for runs in self._runs.values():
+            runs.freeze(frozen)
+
+    def _runs_for(self, wet_threshold: float, max_gap: int) -> _Runs:
+        key = (float(wet_threshold), int(max_gap))
+        runs = self._runs.get(key)
+        if runs is None:
+            runs = self._runs[key] = _Runs(*key, self.k)
+            runs.update(self.has_data, self.mean_flow, 0)
+            runs.freeze(self._frozen)
+            while len(self._runs) > RUN_SETTINGS:
+                self._runs.popitem(last=False)
+        self._runs.move_to_end(key)
+        return runs
+
+    def _check_k(self, k: int) -> None:
+        if k > self.k:
+            raise ValueError(f"only the top {self.k} are tracked, asked for {k}")
+
+    # --- the batch functions' outputs -------------------------------------------------
+    # arrays that later updates write to are copied; the calendar columns never change
+
+    def day_data(self) -> pd.DataFrame:
+        """As build_day_data."""
+        return pd.DataFrame({
+            "dateTime": self._dates.astype("datetime64[ns]"),
+            "has_flow": self.has_flow.copy(),
+            "mean_flow": self.mean_flow.copy(),
+            "has_data": self.has_data.copy(),
+            "year": self._years,
+            "month": self._months,
+        }, copy=False)
+
+    def month_data(self) -> pd.DataFrame:
+        """As monthly_flow_stats."""
+        return pd.DataFrame({
+            **{name: column.copy() for name, column in self._month_stats.items()},
+            "year": self._month_years,
+            "month": self._month_months,
+        }, copy=False)
+
+    def month_summary_data(self) -> pd.DataFrame:
+        """As month_of_year_flow_stats."""
+        month_of_year = self._month_months.astype(np.int64) - 1
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (np.bincount(month_of_year, weights=self._flow_sums, minlength=12)
+                    / np.bincount(month_of_year, weights=self._valid_days, minlength=12))
+        return pd.DataFrame({
+            "month": np.arange(1, 13),
+            "max_mean_flow": [values[-1] if len(values) else np.nan for values in self._climatology],
+            "mean_flow": mean,
+            **{name: [_sorted_quantile(values, q) for values in self._climatology]
+               for name, q in self.quantiles.items()},
+        })
+
+    def top_runs(self, state: int, wet_threshold: float = 0.0, max_gap: int = 0, k: int = TOP_K) -> pd.DataFrame:
+        """As top_runs(find_runs(day_data, wet_threshold, max_gap), state, k)."""
+        self._check_k(k)
+        runs = self._runs_for(wet_threshold, max_gap)
+        candidates = runs.states == state
+        lengths, starts = _top(runs.heaps[state], runs.lengths[candidates], runs.starts[candidates], k)
+        dates = self._dates.astype("datetime64[ns]")
+        return pd.DataFrame({"length": lengths, "start": dates[starts], "end": dates[starts + lengths - 1]})
+
+    def annual_mean(self) -> pd.Series:
+        """As annual_mean_flow."""
+        n_years = len(self._month_starts) // 12
+        month_has_data = self._month_stats["days_with_data"].reshape(n_years, 12) > 0
+        if not month_has_data.any():
+            return pd.Series(dtype=float, name="mean_flow")
+        eligible = month_has_data.all(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = (self._flow_sums.reshape(n_years, 12).sum(axis=1)
+                     / self._valid_days.reshape(n_years, 12).sum(axis=1))
+        years = self._month_years[::12].astype(np.int64)
+        return pd.Series(means[eligible], index=pd.Index(years[eligible], name="year"), name="mean_flow")
+
+    def top_flow_days(self, k: int = TOP_K) -> pd.DataFrame:
+        """As top_flow_days."""
+        self._check_k(k)
+        flows = self.mean_flow[self._frozen:]
+        valid = ~np.isnan(flows)
+        flows, days = _top(self._top_days, flows[valid], np.flatnonzero(valid) + self._frozen, k)
+        top = pd.DataFrame({"dateTime": self._dates[days].astype("datetime64[ns]"), "mean_flow": flows})
+        return top.assign(date_str=top["dateTime"].dt.strftime("%Y-%m-%d"))
+
+
+_trackers: OrderedDict[object, IncrementalGaugeStats] = OrderedDict()
+_trackers_lock = threading.Lock()
+
+
+@contextmanager
+def incremental_stats(key, gauge_values: pd.DataFrame, version: str | None = None, today: date | None = None):
+    """The process-wide tracker for key (e.g. site and value source), brought up to
+    gauge_values and held locked while the caller reads from it."""
+    with _trackers_lock:
+        tracker = _trackers.get(key)
+        if tracker is None:
+            tracker = _trackers[key] = IncrementalGaugeStats()
+            while len(_trackers) > TRACKED_SERIES:
+                _trackers.popitem(last=False)
+        _trackers.move_to_end(key)
+    with tracker.lock:
+        tracker.update(gauge_values, version, today)
+        yield tracker
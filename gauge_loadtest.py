@@ -0,0 +1,252 @@
+"""Concurrent-session load test of the notebook served by `marimo run`.
+
+    # everything local: USGS mock + marimo run, then 20 sessions x 10 gauge switches
+    python gauge_loadtest.py --serve --sessions 20 --switches 10 --latency-ms 400 --failure-rate 0.02
+
+    # against a running server (e.g. the container, pointed at usgs_mock.py)
+    python gauge_loadtest.py --url http://127.0.0.1:8080 --sessions 50 --json load.json
+
+Each simulated session opens the notebook's websocket like a browser, waits
+for the first complete run, then switches the site dropdown --switches times
+(random gauges, --think-ms apart) through the same HTTP endpoint the frontend
+uses. Page latency is the time from the switch until the kernel reports the
+run completed. Reported: page loads and switches per second, p50/p95/p99
+latency of first loads and switches, cell errors, and the server's resident
+memory (process and children) before and at peak, per session.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+
+import numpy as np
+import psutil
+import websockets
+
+from gauge_sites import GAUGE_SITES
+
+SITE_DROPDOWN_LABEL = "Select USGS Site"
+
+# a run that takes longer than this counts as failed
+PAGE_TIMEOUT = 180
+
+_DROPDOWN = re.compile(
+    r"object-id='([^']+)'[^>]*>\s*<marimo-dropdown[^>]*" + re.escape(SITE_DROPDOWN_LABEL))
+_SERVER_TOKEN = re.compile(r'serverToken"\s*:\s*"([^"]+)"')
+
+
+def _server_token(url: str) -> str:
+    return _SERVER_TOKEN.search(urllib.request.urlopen(url + "/").read().decode()).group(1)
+
+
+def _set_value(url: str, session_id: str, server_token: str, object_id: str, value) -> None:
+    request = urllib.request.Request(
+        url + "/api/kernel/set_ui_element_value",
+        method="POST",
+        data=json.dumps({"objectIds": [object_id], "values": [value]}).encode(),
+        headers={"Content-Type": "application/json", "Marimo-Session-Id": session_id,
+                 "Marimo-Server-Token": server_token},
+    )
+    urllib.request.urlopen(request).read()
+
+
+async def _wait_for_run(ws) -> tuple[str | None, int]:
+    """Read kernel messages until a run completes; (site dropdown object id if seen, cell errors)."""
+    dropdown_id, errors = None, 0
+    async with asyncio.timeout(PAGE_TIMEOUT):
+        while True:
+            message = json.loads(await ws.recv())
+            op = message.get("op")
+            if op == "completed-run":
+                return dropdown_id, errors
+            if op != "cell-op":
+                continue
+            output = message.get("data", message).get("output") or {}
+            if output.get("channel") == "marimo-error":
+                # cells skipped by mo.stop (the regional view while it is off) are not failures
+                errors += any(e.get("type") != "ancestor-stopped" for e in output.get("data") or [{}])
+            match = _DROPDOWN.search(str(output.get("data", "")))
+            if match:
+                dropdown_id = match.group(1)
+
+
+async def run_session(url: str, server_token: str, switches: int, think: float, rng: random.Random) -> dict:
+    session_id = f"loadtest-{uuid.uuid4().hex}"
+    ws_url = re.sub(r"^http", "ws", url) + f"/ws?session_id={session_id}"
+    result = {"first_load": None, "switches": [], "errors": 0, "failed": False}
+
+    start = time.perf_counter()
+    try:
+        async with websockets.connect(ws_url, max_size=None) as ws:
+            dropdown_id, errors = await _wait_for_run(ws)
+            result["first_load"] = time.perf_counter() - start
+            result["errors"] += errors
+            if dropdown_id is None:
+                raise RuntimeError("site dropdown not found in the page")
+
+            for _ in range(switches):
+                await asyncio.sleep(think)
+                start = time.perf_counter()
+                await asyncio.to_thread(_set_value, url, session_id, server_token, dropdown_id,
+                                        [rng.choice(GAUGE_SITES)])
+                _, errors = await _wait_for_run(ws)
+                result["switches"].append(time.perf_counter() - start)
+                result["errors"] += errors
+    except (OSError, TimeoutError, RuntimeError, websockets.WebSocketException) as e:
+        result["failed"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def _tree_rss(process: psutil.Process) -> int:
+    rss = 0
+    for p in [process] + process.children(recursive=True):
+        try:
+            rss += p.memory_info().rss
+        except psutil.Error:
+            pass
+    return rss
+
+
+async def _sample_rss(process: psutil.Process, samples: list, interval: float = 0.25) -> None:
+    while True:
+        samples.append(_tree_rss(process))
+        await asyncio.sleep(interval)
+
+
+def _listening_process(port: int) -> psutil.Process | None:
+    for conn in psutil.net_connections(kind="tcp"):
+        if conn.status == psutil.CONN_LISTEN and conn.laddr.port == port and conn.pid:
+            return psutil.Process(conn.pid)
+    return None
+
+
+def _percentiles(seconds: list[float]) -> dict:
+    if not seconds:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(np.array(seconds) * 1000, [50, 95, 99])
+    return {"count": len(seconds), "p50_ms": round(p50, 1), "p95_ms": round(p95, 1), "p99_ms": round(p99, 1)}
+
+
+async def load_test(url: str, sessions: int, switches: int, think: float, ramp: float,
+                    process: psutil.Process | None, seed: int = 0) -> dict:
+    server_token = _server_token(url)
+    rng = random.Random(seed)
+
+    samples = []
+    baseline = _tree_rss(process) if process else None
+    sampler = asyncio.create_task(_sample_rss(process, samples)) if process else None
+
+    async def _delayed(i):
+        await asyncio.sleep(ramp * i / max(sessions, 1))
+        return await run_session(url, server_token, switches, think, random.Random(rng.random()))
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[_delayed(i) for i in range(sessions)])
+    elapsed = time.perf_counter() - start
+    if sampler:
+        sampler.cancel()
+
+    first_loads = [r["first_load"] for r in results if r["first_load"] is not None]
+    switch_times = [s for r in results for s in r["switches"]]
+    peak = max(samples) if samples else None
+    return {
+        "sessions": sessions,
+        "switches_per_session": switches,
+        "elapsed_s": round(elapsed, 2),
+        "pages_per_s": round((len(first_loads) + len(switch_times)) / elapsed, 2),
+        "first_load": _percentiles(first_loads),
+        "switch": _percentiles(switch_times),
+        "cell_errors": sum(r["errors"] for r in results),
+        "failed_sessions": [r["failed"] for r in results if r["failed"]],
+        "rss_baseline_mib": round(baseline / 2**20, 1) if baseline else None,
+        "rss_peak_mib": round(peak / 2**20, 1) if peak else None,
+        "rss_per_session_mib": round((peak - baseline) / 2**20 / sessions, 2) if peak and sessions else None,
+    }
+
+
+def _wait_until_up(url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            urllib.request.urlopen(url + "/health").read()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+
+def _serve(args) -> tuple[str, subprocess.Popen]:
+    """Start the USGS mock (in this process) and `marimo run` pointed at it."""
+    from usgs_mock import MockSettings, start_mock_server
+
+    mock = start_mock_server(MockSettings(args.latency_ms, args.jitter_ms, args.failure_rate, years=args.years))
+    env = dict(
+        os.environ,
+        USGS_WATER_SERVICES_URL=f"http://127.0.0.1:{mock.server_address[1]}",
+        USGS_CACHE_DIR=tempfile.mkdtemp(prefix="gauge-loadtest-"),
+    )
+    notebook = os.path.join(os.path.dirname(os.path.abspath(__file__)), "usgs_gauge_flow.py")
+    server = subprocess.Popen(
+        ["marimo", "run", "--headless", "--host", "127.0.0.1", "--port", str(args.port), notebook],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{args.port}"
+    _wait_until_up(url)
+    return url, server
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the gauge notebook with concurrent marimo sessions.")
+    parser.add_argument("--url", default="http://127.0.0.1:2718", help="marimo run server (ignored with --serve)")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--switches", type=int, default=5, help="gauge switches per session")
+    parser.add_argument("--think-ms", type=float, default=500, help="pause before each switch")
+    parser.add_argument("--ramp-s", type=float, default=5, help="spread session starts over this many seconds")
+    parser.add_argument("--pid", type=int, help="server pid for memory sampling (default: whoever listens on the port)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    serve = parser.add_argument_group("--serve: start usgs_mock.py and marimo run locally")
+    serve.add_argument("--serve", action="store_true")
+    serve.add_argument("--port", type=int, default=2718)
+    serve.add_argument("--latency-ms", type=float, default=300)
+    serve.add_argument("--jitter-ms", type=float, default=200)
+    serve.add_argument("--failure-rate", type=float, default=0.0)
+    serve.add_argument("--years", type=float, default=75)
+    args = parser.parse_args(argv)
+
+    server = None
+    url = args.url.rstrip("/")
+    if args.serve:
+        url, server = _serve(args)
+    try:
+        if args.pid:
+            process = psutil.Process(args.pid)
+        elif server is not None:
+            process = psutil.Process(server.pid)
+        else:
+            process = _listening_process(int(url.rsplit(":", 1)[-1].split("/")[0]))
+        report = asyncio.run(load_test(url, args.sessions, args.switches, args.think_ms / 1000, args.ramp_s,
+                                       process, args.seed))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if not report["failed_sessions"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
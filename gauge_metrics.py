@@ -0,0 +1,237 @@
+"""Per-stage instrumentation of the gauge pipeline.
+
+Every pipeline stage (USGS request, json decode, flattening, store read/write,
+the statistics and the figure builders) runs inside `stage(name)` - directly
+or through the `instrumented` decorator - which records wall time, rows
+produced, bytes downloaded and, with GAUGE_TRACE_MEMORY=1, the peak traced
+allocation above the stage's starting point. Each record is
+
+  - logged as one JSON object per line on the "gauge_metrics" logger (INFO),
+  - folded into per-stage Prometheus histograms/counters (metrics_text), served
+    at /metrics by start_metrics_server when GAUGE_METRICS_PORT is set,
+  - kept in a bounded per-stage window for percentile summaries (stage_summary),
+    which the notebook shows in its diagnostics panel when GAUGE_DIAGNOSTICS=1.
+
+Metrics are process wide - concurrent sessions share them. Traced peaks are
+approximate when several threads allocate at once.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger("gauge_metrics")
+
+TRACE_MEMORY = os.environ.get("GAUGE_TRACE_MEMORY") == "1"
+METRICS_PORT = int(os.environ.get("GAUGE_METRICS_PORT", "0"))
+DIAGNOSTICS = os.environ.get("GAUGE_DIAGNOSTICS") == "1"
+
+# samples per stage kept for percentiles
+RECENT_SAMPLES = 512
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+if TRACE_MEMORY and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+
+class StageRecord:
+    """One run of a stage; the stage body may fill in rows and bytes."""
+
+    def __init__(self, stage: str, labels: dict):
+        self.stage = stage
+        self.labels = labels
+        self.seconds = 0.0
+        self.rows = None
+        self.bytes = None
+        self.peak_bytes = None
+        self.error = None
+        self._child_peak = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "stage": self.stage,
+            "seconds": round(self.seconds, 6),
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "peak_bytes": self.peak_bytes,
+            "error": self.error,
+            **self.labels,
+        }
+
+
+class _StageMetrics:
+    def __init__(self):
+        self.count = 0
+        self.seconds_sum = 0.0
+        self.buckets = [0] * len(SECONDS_BUCKETS)
+        self.rows_total = 0
+        self.bytes_total = 0
+        self.errors_total = 0
+        self.peak_bytes_max = 0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def add(self, record: StageRecord):
+        self.count += 1
+        self.seconds_sum += record.seconds
+        for i, le in enumerate(SECONDS_BUCKETS):
+            if record.seconds <= le:
+                self.buckets[i] += 1
+        self.rows_total += record.rows or 0
+        self.bytes_total += record.bytes or 0
+        self.errors_total += record.error is not None
+        self.peak_bytes_max = max(self.peak_bytes_max, record.peak_bytes or 0)
+        self.recent.append(record)
+
+
+_metrics: dict[str, _StageMetrics] = {}
+_metrics_lock = threading.Lock()
+
+# stages open in the current thread/task - nested peaks are handed up to the parent
+_open_stages: ContextVar[tuple] = ContextVar("gauge_open_stages", default=())
+
+
+def _record(record: StageRecord):
+    with _metrics_lock:
+        _metrics.setdefault(record.stage, _StageMetrics()).add(record)
+    if log.isEnabledFor(logging.INFO):
+        log.info(json.dumps(record.as_dict()))
+
+
+@contextmanager
+def stage(name: str, **labels):
+    """Time (and optionally trace) the enclosed block as pipeline stage `name`."""
+    record = StageRecord(name, labels)
+    parents = _open_stages.get()
+    token = _open_stages.set(parents + (record,))
+    if TRACE_MEMORY:
+        start_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record.error = type(e).__name__
+        raise
+    finally:
+        record.seconds = time.perf_counter() - start
+        if TRACE_MEMORY:
+            # a nested stage resets the peak - take the larger of ours and our children's
+            peak = max(tracemalloc.get_traced_memory()[1], record._child_peak)
+            record.peak_bytes = max(0, peak - start_bytes)
+            if parents:
+                parents[-1]._child_peak = max(parents[-1]._child_peak, peak)
+        _open_stages.reset(token)
+        _record(record)
+
+
+def instrumented(name: str | None = None):
+    """Decorator running a function as a stage; frame/series results set rows."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name or fn.__name__) as record:
+                result = fn(*args, **kwargs)
+                if isinstance(result, (pd.DataFrame, pd.Series)):
+                    record.rows = len(result)
+                return result
+        return wrapper
+    return decorate
+
+
+def stage_summary() -> pd.DataFrame:
+    """Per-stage count, latency percentiles (recent window), rows, bytes and peak allocation."""
+    with _metrics_lock:
+        snapshot = {name: (m.count, m.bytes_total, m.errors_total, m.peak_bytes_max, list(m.recent))
+                    for name, m in _metrics.items()}
+
+    rows = []
+    for name, (count, bytes_total, errors_total, peak_max, recent) in sorted(snapshot.items()):
+        ms = np.array([r.seconds for r in recent]) * 1000
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        rows.append({
+            "stage": name,
+            "count": count,
+            "last_ms": round(ms[-1], 2),
+            "p50_ms": round(p50, 2),
+            "p95_ms": round(p95, 2),
+            "p99_ms": round(p99, 2),
+            "last_rows": recent[-1].rows,
+            "bytes_total": bytes_total,
+            "peak_mib": round(peak_max / 2**20, 2) if TRACE_MEMORY else None,
+            "errors": errors_total,
+        })
+    return pd.DataFrame(rows, columns=["stage", "count", "last_ms", "p50_ms", "p95_ms", "p99_ms",
+                                       "last_rows", "bytes_total", "peak_mib", "errors"])
+
+
+def metrics_text() -> str:
+    """Prometheus text exposition (format 0.0.4) of the per-stage metrics."""
+    with _metrics_lock:
+        snapshot = {name: (m.count, m.seconds_sum, list(m.buckets), m.rows_total, m.bytes_total,
+                           m.errors_total, m.peak_bytes_max)
+                    for name, m in sorted(_metrics.items())}
+
+    lines = [
+        "# HELP gauge_stage_seconds Wall time of a pipeline stage.",
+        "# TYPE gauge_stage_seconds histogram",
+    ]
+    for name, (count, seconds_sum, buckets, *_) in snapshot.items():
+        for le, n in zip(SECONDS_BUCKETS, buckets):
+            lines.append(f'gauge_stage_seconds_bucket{{stage="{name}",le="{le}"}} {n}')
+        lines.append(f'gauge_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {count}')
+        lines.append(f'gauge_stage_seconds_sum{{stage="{name}"}} {seconds_sum:.6f}')
+        lines.append(f'gauge_stage_seconds_count{{stage="{name}"}} {count}')
+
+    for metric, kind, help_text, index in [
+        ("gauge_stage_rows_total", "counter", "Rows produced by a pipeline stage.", 3),
+        ("gauge_stage_bytes_total", "counter", "Bytes downloaded by a pipeline stage.", 4),
+        ("gauge_stage_errors_total", "counter", "Pipeline stage runs that raised.", 5),
+        ("gauge_stage_peak_bytes", "gauge", "Largest traced allocation peak of a pipeline stage.", 6),
+    ]:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        lines += [f'{metric}{{stage="{name}"}} {values[index]}' for name, values in snapshot.items()]
+
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> None:
+    """Serve metrics_text at http://0.0.0.0:<port>/metrics (once per process; no-op when port is 0)."""
+    global _server
+    if not port:
+        return
+    with _server_lock:
+        if _server is not None:
+            return
+        _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name="gauge-metrics", daemon=True).start()
@@ -0,0 +1,125 @@
+"""Date-range and season queries over the dense daily calendar.
+
+CalendarIndex keeps prefix sums (with a leading zero) of the day_data columns
+
+    days_with_data   days with at least one observation
+    days_with_flow   days with an observation > 0
+    valid_days       days with a non-NaN daily mean
+    flow_sum         sum of the daily means
+
+so the totals of any date range are two lookups and a subtraction - O(1)
+however long the range. A season is the same lookup for every (year, month)
+window it covers, vectorized over all windows. Built once per data version.
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from gauge_metrics import instrumented
+
+# a season that wraps the new year belongs to the year it ends in - Winter
+# (Dec-Mar) 2020 is Dec 2019 plus Jan-Mar 2020
+SEASONS = {
+    "All year": tuple(range(1, 13)),
+    "Winter (Dec-Mar)": (12, 1, 2, 3),
+    "Spring (Apr-Jun)": (4, 5, 6),
+    "Monsoon (Jul-Sep)": (7, 8, 9),
+    "Fall (Oct-Nov)": (10, 11),
+}
+
+
+def _year_offsets(months) -> np.ndarray:
+    """Calendar year of each month relative to its season's year - -1 for the months before a wrap."""
+    months = np.asarray(months)
+    wrap = np.flatnonzero(np.diff(months) < 0)
+    offsets = np.zeros(len(months), dtype=np.int64)
+    if len(wrap):
+        offsets[:wrap[0] + 1] = -1
+    return offsets
+
+
+def _prefix(values: np.ndarray, dtype) -> np.ndarray:
+    out = np.zeros(len(values) + 1, dtype=dtype)
+    np.cumsum(values, out=out[1:])
+    return out
+
+
+class CalendarIndex:
+    """Prefix sums over a day_data calendar; every query is a few array lookups."""
+
+    @instrumented("calendar_index")
+    def __init__(self, day_data: pd.DataFrame):
+        dates = day_data["dateTime"].to_numpy().astype("datetime64[D]")
+        self.start = dates[0] if len(dates) else np.datetime64("1970-01-01", "D")
+        self.days = len(dates)
+        mean_flow = day_data["mean_flow"].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(mean_flow)
+        self._prefix = {
+            "days_with_data": _prefix(day_data["has_data"].to_numpy(dtype=bool), np.int32),
+            "days_with_flow": _prefix(day_data["has_flow"].to_numpy(dtype=bool), np.int32),
+            "valid_days": _prefix(valid, np.int32),
+            "flow_sum": _prefix(np.where(valid, mean_flow, 0.0), np.float64),
+        }
+
+    def rows(self, start: date, end: date) -> slice:
+        """day_data rows of start..end (inclusive), clipped to the calendar."""
+        lo = int(np.clip((np.datetime64(start, "D") - self.start).astype(np.int64), 0, self.days))
+        hi = int(np.clip((np.datetime64(end, "D") - self.start).astype(np.int64) + 1, lo, self.days))
+        return slice(lo, hi)
+
+    def window_totals(self, starts, ends) -> dict[str, np.ndarray]:
+        """Totals of each inclusive [start, end] window (datetime64[D] arrays), clipped to the calendar."""
+        lo = np.clip((np.asarray(starts, dtype="datetime64[D]") - self.start).astype(np.int64), 0, self.days)
+        hi = np.clip((np.asarray(ends, dtype="datetime64[D]") - self.start).astype(np.int64) + 1, lo, self.days)
+        totals = {"days": hi - lo}
+        for name, prefix in self._prefix.items():
+            totals[name] = prefix[hi] - prefix[lo]
+        return totals
+
+    def _month_windows(self, first_year: int, last_year: int, months) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(season year of each window, starts, ends) of every month of a season over first_year..last_year."""
+        n_years = last_year - first_year + 1
+        years = np.repeat(np.arange(first_year, last_year + 1), len(months))
+        calendar_years = years + np.tile(_year_offsets(months), n_years)
+        month_ids = (calendar_years - 1970) * 12 + np.tile(np.asarray(months) - 1, n_years)
+        starts = month_ids.astype("datetime64[M]").astype("datetime64[D]")
+        ends = (month_ids + 1).astype("datetime64[M]").astype("datetime64[D]") - 1
+        return years, starts, ends
+
+    def totals(self, start: date, end: date, months=SEASONS["All year"]) -> dict[str, float]:
+        """Days, coverage, days with flow and mean flow over start..end, only in the given months."""
+        if len(set(months)) == 12:
+            totals = {name: column[0] for name, column in self.window_totals([start], [end]).items()}
+        else:
+            # the season years whose months can fall in start..end - windows outside it clip to nothing
+            _, starts, ends = self._month_windows(start.year, end.year - _year_offsets(months).min(), months)
+            windows = self.window_totals(np.maximum(starts, np.datetime64(start, "D")),
+                                         np.minimum(ends, np.datetime64(end, "D")))
+            totals = {name: column.sum() for name, column in windows.items()}
+        return _with_ratios({name: value.item() for name, value in totals.items()})
+
+    def season_bounds(self, first_year: int, last_year: int, months=SEASONS["All year"]) -> tuple[date, date]:
+        """First and last day of a season over the season years first_year..last_year."""
+        _, starts, ends = self._month_windows(first_year, last_year, months)
+        return starts.min().item(), ends.max().item()
+
+    def by_year(self, first_year: int, last_year: int, months=SEASONS["All year"]) -> pd.DataFrame:
+        """Per-year season totals; complete - every month of the season has at least one day of data."""
+        years, starts, ends = self._month_windows(first_year, last_year, months)
+        windows = self.window_totals(starts, ends)
+        # months of one year are adjacent, so per-year sums are one reduceat
+        firsts = np.arange(0, len(years), len(months))
+        frame = pd.DataFrame({name: np.add.reduceat(column, firsts) for name, column in windows.items()},
+                             index=pd.Index(years[firsts], name="year"))
+        frame["complete"] = np.logical_and.reduceat(windows["days_with_data"] > 0, firsts)
+        return _with_ratios(frame)
+
+
+def _with_ratios(totals):
+    """Add mean_flow, coverage and share_with_flow (NaN where undefined) to a dict or frame of totals."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        totals["mean_flow"] = np.divide(totals["flow_sum"], totals["valid_days"])
+        totals["coverage"] = np.divide(totals["days_with_data"], totals["days"])
+        totals["share_with_flow"] = np.divide(totals["days_with_flow"], totals["days_with_data"])
+    return totals
@@ -0,0 +1,139 @@
+"""Regional comparison of many gauges on one aligned calendar.
+
+Each site's dense daily calendar is built in a worker process from the dates
+and values of the process-wide daily values cache - the same series the result
+is keyed on - and scattered into site x day matrices covering the union of all
+site calendars:
+
+    has_data   bool     site x day
+    mean_flow  float32  site x day, NaN without data
+
+Month matrices (site x month: days with data, days with flow, max daily mean)
+are reduced from those with np.*.reduceat over the month boundaries, so one
+matrix operation covers every site.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from gauge_cache import derived_cache, get_many_daily_values, series_fingerprint
+from gauge_metrics import instrumented
+from gauge_stats import DRY, WET, build_day_data, calendar_bounds, find_runs, top_runs, year_month
+
+# worker processes for the per-site calendars (None - one per CPU)
+REGION_WORKERS = None
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _region_pool() -> ProcessPoolExecutor:
+    # one pool per process, started on first use; spawn rather than fork - the
+    # notebook server is multi-threaded
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=REGION_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def site_calendar(site_id: str, date_times: np.ndarray, values: np.ndarray, today: date) -> dict:
+    """One site's daily has_data / mean_flow arrays and longest runs (runs in a worker)."""
+    gauge_values = pd.DataFrame({"dateTime": date_times, "value": values}, copy=False)
+    start_date, end_date = calendar_bounds(gauge_values, today)
+    day_data = build_day_data(gauge_values, start_date, end_date)
+    runs = find_runs(day_data)
+    longest_wet, longest_dry = top_runs(runs, WET, 1), top_runs(runs, DRY, 1)
+    return {
+        "site_id": site_id,
+        "start_date": start_date,
+        "has_data": day_data["has_data"].to_numpy(),
+        "mean_flow": day_data["mean_flow"].to_numpy(dtype=np.float32),
+        "longest_wet": longest_wet.iloc[0].to_dict() if len(longest_wet) else None,
+        "longest_dry": longest_dry.iloc[0].to_dict() if len(longest_dry) else None,
+    }
+
+
+@instrumented()
+def align_calendars(calendars: list[dict], end_date: date) -> dict:
+    """Scatter per-site calendars into site x day matrices and reduce them to site x month."""
+    start_date = min(c["start_date"] for c in calendars)
+    days = (end_date - start_date).days + 1
+
+    has_data = np.zeros((len(calendars), days), dtype=bool)
+    mean_flow = np.full((len(calendars), days), np.nan, dtype=np.float32)
+    for i, c in enumerate(calendars):
+        offset = (c["start_date"] - start_date).days
+        has_data[i, offset:offset + len(c["has_data"])] = c["has_data"]
+        mean_flow[i, offset:offset + len(c["mean_flow"])] = c["mean_flow"]
+
+    dates = np.datetime64(start_date, "D") + np.arange(days)
+    months = dates.astype("datetime64[M]")
+    month_starts = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+
+    has_flow = has_data & (mean_flow > 0)
+    with np.errstate(invalid="ignore"):
+        # fmax skips NaN; months without any data stay NaN
+        max_mean_flow = np.fmax.reduceat(mean_flow, month_starts, axis=1)
+
+    return {
+        "site_ids": [c["site_id"] for c in calendars],
+        "dates": dates,
+        "has_data": has_data,
+        "mean_flow": mean_flow,
+        "months": months[month_starts],
+        "days_with_data": np.add.reduceat(has_data, month_starts, axis=1, dtype=np.int16),
+        "days_with_flow": np.add.reduceat(has_flow, month_starts, axis=1, dtype=np.int16),
+        "max_mean_flow": max_mean_flow,
+    }
+
+
+def _longest_runs(calendars: list[dict]) -> pd.DataFrame:
+    rows = []
+    for c in calendars:
+        wet, dry = c["longest_wet"] or {}, c["longest_dry"] or {}
+        rows.append({
+            "site_id": c["site_id"],
+            "longest_wet_days": wet.get("length"), "wet_start": wet.get("start"), "wet_end": wet.get("end"),
+            "longest_dry_days": dry.get("length"), "dry_start": dry.get("start"), "dry_end": dry.get("end"),
+        })
+    return pd.DataFrame(rows)
+
+
+def regional_flow(site_ids: list[str], today: date | None = None) -> dict:
+    """Aligned site x day / site x month matrices (plus longest runs) for every site with data.
+
+    Values come from the process-wide daily values cache - warmed sites from
+    memory, the rest in one batched load shared with concurrent callers; the
+    result is cached under the content of every site's series, and the workers
+    get exactly those series' dates and values.
+    """
+    today = today or date.today()
+    values = get_many_daily_values(site_ids)
+    site_ids = [s for s in site_ids if s in values]
+    if not site_ids:
+        return {}
+    key = ("regional_flow", today.year) + tuple((s, series_fingerprint(values[s])) for s in site_ids)
+
+    def _compute():
+        pool = _region_pool()
+        calendars = list(pool.map(
+            site_calendar, site_ids,
+            [values[s]["dateTime"].to_numpy() for s in site_ids],
+            [values[s]["value"].to_numpy(dtype=np.float64) for s in site_ids],
+            [today] * len(site_ids),
+        ))
+        region = align_calendars(calendars, date(today.year, 12, 31))
+        region["longest_runs"] = _longest_runs(calendars)
+        return region
+
+    return derived_cache.get_or_compute(key, _compute)
+
+
+def region_years(region: dict) -> tuple[int, int]:
+    years, _ = year_month(region["months"][[0, -1]])
+    return int(years[0]), int(years[1])
@@ -0,0 +1,31 @@
+"""Gauges offered in the notebook - dropdown labels end with the 8 digit USGS site id."""
+
+GAUGE_SITES = [
+    "Rincon Creek -- 09485000",
+    "Sabino Creek Near Tucson-- 09484000",
+    "Bear Creek Above Bear Canyon Road -- 09484201",
+    "Pantano Wash Near Vail -- 09484600",
+    "Cienega Creek Near Sonoita -- 09484550",
+    "Tanque Verde Creek at Tucson -- 09484500",
+    "Rillito Creek at Dodge Boulevard at Tucson -- 09485700",
+    "San Pedro R at Redington Bridge nr Redington -- 09472050",
+    "Barrel Canyon Near Sonoita -- 09484580",
+    "Rillito Creek at La Cholla Blvd Near Tucson -- 09486055",
+    "Canada Del Oro Blw Ina Road, Near Tucson -- 09486350",
+    "Santa Cruz River at Tucson -- 09482500",
+    "Santa Cruz River at Mission Lane GCS at Tucson -- 09482495",
+    "Santa Cruz River at Starr Pass GCS at Tucson AZ -- 09482490",
+    "Santa Cruz River at Silverlake Rd, at Tucson -- 09482440",
+]
+
+DEFAULT_SITE = "Rincon Creek -- 09485000"
+
+
+def site_id_from_label(label: str) -> str:
+    return label[-8:]  # parse last 8 characters
+
+
+GAUGE_SITE_IDS = [site_id_from_label(label) for label in GAUGE_SITES]
+
+# site id -> dropdown label
+GAUGE_SITE_LABELS = {site_id_from_label(label): label for label in GAUGE_SITES}
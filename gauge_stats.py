@@ -0,0 +1,283 @@
+"""Vectorized statistics over a gauge's daily values.
+
+The daily calendar is dense: row i is start_date + i days, so any observation
+maps to a row by its integer day offset and aggregates are scattered into
+preallocated arrays with np.bincount rather than grouped and merged.
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from gauge_metrics import instrumented
+
+
+def day_offsets(date_times, start_date: date) -> np.ndarray:
+    """Integer day offset of each datetime from start_date."""
+    return (np.asarray(date_times).astype("datetime64[D]") - np.datetime64(start_date, "D")).astype(np.int64)
+
+
+def year_month(date_times) -> tuple[np.ndarray, np.ndarray]:
+    """Calendar year and month (1-12) derived from datetime64 values without pandas accessors."""
+    months = np.asarray(date_times).astype("datetime64[M]").astype(np.int64)
+    return (months // 12 + 1970).astype(np.int16), (months % 12 + 1).astype(np.int8)
+
+
+def calendar_bounds(gauge_values: pd.DataFrame, today: date | None = None) -> tuple[date, date]:
+    """Calendar used for all stats - first full year of record through the end of the current year."""
+    today = today or date.today()
+    return date(gauge_values["dateTime"].min().year + 1, 1, 1), date(today.year, 12, 31)
+
+
+@instrumented()
+def build_day_data(gauge_values: pd.DataFrame, start_date: date, end_date: date) -> pd.DataFrame:
+    """Dense daily calendar from start_date through end_date.
+
+    has_data - at least one observation that day
+    has_flow - at least one observation > 0
+    mean_flow - mean of the day's non-NaN observations (NaN without data)
+    """
+    days = (end_date - start_date).days + 1
+
+    offsets = day_offsets(gauge_values["dateTime"].to_numpy(), start_date)
+    values = gauge_values["value"].to_numpy(dtype=np.float64)
+    inside = (offsets >= 0) & (offsets < days)
+    offsets, values = offsets[inside], values[inside]
+
+    has_data, has_flow, mean_flow = scatter_days(offsets, values, days)
+
+    date_times = np.datetime64(start_date, "D") + np.arange(days)
+    year, month = year_month(date_times)
+
+    return pd.DataFrame({
+        "dateTime": date_times.astype("datetime64[ns]"),
+        "has_flow": has_flow,
+        "mean_flow": mean_flow,
+        "has_data": has_data,
+        "year": year,
+        "month": month,
+    }, copy=False)
+
+
+def scatter_days(offsets: np.ndarray, values: np.ndarray, days: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(has_data, has_flow, mean_flow) of `days` calendar days from observations at day offsets 0..days-1."""
+    has_data = np.bincount(offsets, minlength=days) > 0
+    has_flow = np.bincount(offsets[values > 0], minlength=days) > 0
+
+    valid = ~np.isnan(values)
+    counts = np.bincount(offsets[valid], minlength=days)
+    sums = np.bincount(offsets[valid], weights=values[valid], minlength=days)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_flow = sums / counts  # 0/0 -> NaN on days without data
+    return has_data, has_flow, mean_flow
+
+
+# quantile columns produced by the monthly aggregations - add entries for more percentiles
+FLOW_QUANTILES = {
+    "twenty_five_quantile_flow": 0.25,
+    "median_flow": 0.5,
+    "seventy_five_quantile_flow": 0.75,
+}
+
+
+def grouped_flow_stats(group_ids: np.ndarray, values: np.ndarray, n_groups: int,
+                       quantiles: dict[str, float] = FLOW_QUANTILES) -> dict[str, np.ndarray]:
+    """max, mean and named quantiles of values per group, NaNs skipped.
+
+    One lexsort by (group, value) lays every group out as a sorted segment; the
+    max is the segment's last element and each quantile is a linear interpolation
+    between two positions inside it (numpy's default 'linear' method), so any
+    number of quantiles costs one extra gather each. Empty groups give NaN.
+    """
+    valid = ~np.isnan(values)
+    groups, values = group_ids[valid], values[valid]
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    last = np.maximum(counts - 1, 0)
+    empty = counts == 0
+
+    def _at(offsets):
+        # empty groups read a placeholder and are masked to NaN below
+        if not len(values):
+            return np.full(n_groups, np.nan)
+        return values[np.minimum(starts + offsets, len(values) - 1)]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stats = {
+            "max": np.where(empty, np.nan, _at(last)),
+            "mean": np.bincount(groups, weights=values, minlength=n_groups) / counts,
+        }
+    for name, q in quantiles.items():
+        position = q * last
+        below = np.floor(position).astype(np.int64)
+        above = np.minimum(below + 1, last)
+        low, high = _at(below), _at(above)
+        stats[name] = np.where(empty, np.nan, low + (high - low) * (position - below))
+    return stats
+
+
+@instrumented()
+def monthly_flow_stats(day_data: pd.DataFrame, quantiles: dict[str, float] = FLOW_QUANTILES) -> pd.DataFrame:
+    """One row per calendar month of the dense day_data calendar."""
+    months = day_data["dateTime"].to_numpy().astype("datetime64[M]")
+    month_ids = (months - months[0]).astype(np.int64)
+    n_months = int(month_ids[-1]) + 1 if len(month_ids) else 0
+
+    stats = grouped_flow_stats(month_ids, day_data["mean_flow"].to_numpy(dtype=np.float64), n_months, quantiles)
+
+    # year and month identify the row - no separate month timestamp column
+    year, month = year_month(months[0] + np.arange(n_months) if n_months else months)
+    return pd.DataFrame({
+        "days_with_data": np.bincount(month_ids, weights=day_data["has_data"].to_numpy(),
+                                      minlength=n_months).astype(np.int16),
+        "days_with_flow": np.bincount(month_ids, weights=day_data["has_flow"].to_numpy(),
+                                      minlength=n_months).astype(np.int16),
+        "max_mean_flow": stats.pop("max"),
+        "mean_flow": stats.pop("mean"),
+        **stats,
+        "year": year,
+        "month": month,
+    }, copy=False)
+
+
+@instrumented()
+def month_of_year_flow_stats(day_data: pd.DataFrame, quantiles: dict[str, float] = FLOW_QUANTILES) -> pd.DataFrame:
+    """Climatology - one row per month of the year (1-12) over all days with data."""
+    with_data = day_data["has_data"].to_numpy()
+    month_ids = day_data["month"].to_numpy()[with_data].astype(np.int64) - 1
+
+    stats = grouped_flow_stats(month_ids, day_data["mean_flow"].to_numpy(dtype=np.float64)[with_data], 12, quantiles)
+
+    return pd.DataFrame({
+        "month": np.arange(1, 13),
+        "max_mean_flow": stats.pop("max"),
+        "mean_flow": stats.pop("mean"),
+        **stats,
+    })
+
+
+# day states for the streak engine - same codes the notebook always used
+MISSING = -1
+WET = 0
+DRY = 1
+
+
+def day_states(day_data: pd.DataFrame, wet_threshold: float = 0.0) -> np.ndarray:
+    """MISSING / WET (mean flow > wet_threshold) / DRY for every calendar day."""
+    return flow_states(day_data["has_data"].to_numpy(dtype=bool),
+                       day_data["mean_flow"].to_numpy(dtype=np.float64), wet_threshold)
+
+
+def flow_states(has_data: np.ndarray, mean_flow: np.ndarray, wet_threshold: float = 0.0) -> np.ndarray:
+    """day_states over plain has_data / mean_flow arrays."""
+    return np.where(~has_data, MISSING, np.where(mean_flow > wet_threshold, WET, DRY)).astype(np.int8)
+
+
+def run_lengths(states: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Run-length encode states -> (state, start index, length) of every run."""
+    if not len(states):
+        return states[:0], np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    starts = np.concatenate(([0], np.flatnonzero(states[1:] != states[:-1]) + 1))
+    lengths = np.diff(np.append(starts, len(states)))
+    return states[starts], starts, lengths
+
+
+def bridge_gaps(states: np.ndarray, max_gap: int) -> np.ndarray:
+    """Relabel runs of at most max_gap missing days that sit between two runs of the same state."""
+    if max_gap <= 0:
+        return states
+    run_states, _, lengths = run_lengths(states)
+    before = np.concatenate(([MISSING], run_states[:-1]))
+    after = np.concatenate((run_states[1:], [MISSING]))
+    bridged = (run_states == MISSING) & (lengths <= max_gap) & (before == after) & (before != MISSING)
+    return np.repeat(np.where(bridged, before, run_states), lengths)
+
+
+@instrumented()
+def find_runs(day_data: pd.DataFrame, wet_threshold: float = 0.0, max_gap: int = 0) -> pd.DataFrame:
+    """Every wet/dry/missing run in the calendar as (state, start, end, length).
+
+    Missing data ends a run unless the gap is at most max_gap days and the run
+    continues on the other side - bridged days count toward the run length.
+    """
+    states = bridge_gaps(day_states(day_data, wet_threshold), max_gap)
+    run_states, starts, lengths = run_lengths(states)
+    date_times = day_data["dateTime"].to_numpy()
+    return pd.DataFrame({
+        "state": run_states,
+        "start": date_times[starts],
+        "end": date_times[starts + lengths - 1],
+        "length": lengths,
+    })
+
+
+def current_run(runs: pd.DataFrame) -> pd.DataFrame:
+    """The latest wet or dry run (0 or 1 rows) - missing days at the end of the record are passed over."""
+    return runs[runs["state"].to_numpy() != MISSING].tail(1).reset_index(drop=True)
+
+
+def top_runs(runs: pd.DataFrame, state: int, k: int = 10) -> pd.DataFrame:
+    """The k longest runs of a state, longest first, earlier start winning ties.
+
+    Only the k winners are sorted - the cut-off length comes from a partial
+    partition rather than a full sort of every run.
+    """
+    candidates = np.flatnonzero(runs["state"].to_numpy() == state)
+    lengths = runs["length"].to_numpy()[candidates]
+    if len(candidates) > k:
+        cutoff = np.partition(lengths, len(lengths) - k)[len(lengths) - k]
+        longer = candidates[lengths > cutoff]
+        # candidates are in start order, so the first ties are the earliest
+        tied = candidates[lengths == cutoff][:k - len(longer)]
+        candidates = np.concatenate((longer, tied))
+
+    top = runs.iloc[candidates]
+    top = top.iloc[np.lexsort((top["start"].to_numpy(), -top["length"].to_numpy()))]
+    return top[["length", "start", "end"]].reset_index(drop=True)
+
+
+@instrumented()
+def annual_mean_flow(day_data: pd.DataFrame) -> pd.Series:
+    """Mean daily flow per year, only for years with at least one day of data in every month."""
+    with_data = day_data["has_data"].to_numpy(dtype=bool)
+    years = day_data["year"].to_numpy()[with_data].astype(np.int64)
+    months = day_data["month"].to_numpy()[with_data].astype(np.int64)
+    flow = day_data["mean_flow"].to_numpy(dtype=np.float64)[with_data]
+    if not len(years):
+        return pd.Series(dtype=float, name="mean_flow")
+
+    first_year = years.min()
+    year_ids = years - first_year
+    n_years = int(year_ids.max()) + 1
+
+    month_has_data = np.bincount(year_ids * 12 + months - 1, minlength=n_years * 12).reshape(n_years, 12) > 0
+    eligible = month_has_data.all(axis=1)
+
+    valid = ~np.isnan(flow)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = (np.bincount(year_ids[valid], weights=flow[valid], minlength=n_years)
+                 / np.bincount(year_ids[valid], minlength=n_years))
+
+    return pd.Series(means[eligible], index=pd.Index(np.arange(n_years)[eligible] + first_year, name="year"),
+                     name="mean_flow")
+
+
+def ranked_years(annual_mean: pd.Series, k: int = 10) -> tuple[pd.Series, pd.Series]:
+    """(wettest, driest) - the k highest and lowest annual means."""
+    if annual_mean.empty:
+        return pd.Series(dtype=float), pd.Series(dtype=float)
+    return (annual_mean.sort_values(ascending=False).head(k),
+            annual_mean.sort_values(ascending=True).head(k))
+
+
+@instrumented()
+def top_flow_days(day_data: pd.DataFrame, k: int = 10) -> pd.DataFrame:
+    """The k days with the highest daily mean flow."""
+    return (
+        day_data.nlargest(k, "mean_flow")[["dateTime", "mean_flow"]]
+          .assign(date_str=lambda s: s["dateTime"].dt.strftime("%Y-%m-%d"))
+          .reset_index(drop=True)
+    )
@@ -0,0 +1,216 @@
+"""Local per-site store of USGS daily values with incremental (tail) refresh.
+
+The full record for a site is downloaded once. After that a refresh only asks
+the service for the last PROVISIONAL_OVERLAP_DAYS before the newest cached day
+- provisional values in that window can still be revised by USGS - and merges
+the tail over the cached history.
+
+Each site is one partition of plain .npy columns, opened memory-mapped so the
+concurrent notebook sessions in the container share the OS page cache instead
+of each holding a parsed copy:
+
+    <CACHE_DIR>/<siteCode>/CURRENT          name of the live generation
+    <CACHE_DIR>/<siteCode>/<generation>/    dateTime.npy, value.npy,
+                                            <coded column>.npy, meta.json
+    <CACHE_DIR>/<siteCode>/NO_DATA          the service had no series for the
+                                            site (asked again after REFRESH_INTERVAL)
+
+String columns are stored as categorical codes with their categories in
+meta.json. A refresh writes a new generation and then swaps CURRENT, so readers
+never see a half written partition.
+"""
+import fcntl
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import requests
+
+from gauge_metrics import instrumented, stage
+from usgs_service import DAILY_COLUMNS, empty_daily_values, fetch_dv_batch
+
+log = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.environ.get("USGS_CACHE_DIR", Path(__file__).parent / ".usgs_cache"))
+
+# provisional data is commonly revised for a few months after collection
+PROVISIONAL_OVERLAP_DAYS = 120
+
+# DV data is published daily - no need to ask the service more often than this
+REFRESH_INTERVAL = timedelta(hours=6)
+
+# constant within a partition - kept in meta.json only
+_SITE_COLUMNS = ["siteCode", "siteName"]
+# stored as categorical codes
+_CODED_COLUMNS = ["variableCode", "statisticCode", "qualifiers"]
+# stored as-is
+_ARRAY_COLUMNS = ["dateTime", "value"]
+
+
+@instrumented("store_read")
+def read_partition(site_dir: Path) -> pd.DataFrame | None:
+    """Open a site partition memory-mapped; None when the site is not stored."""
+    try:
+        generation = (site_dir / "CURRENT").read_text().strip()
+    except FileNotFoundError:
+        return None
+
+    part_dir = site_dir / generation
+    meta = json.loads((part_dir / "meta.json").read_text())
+    rows = meta["rows"]
+    if not rows:
+        return None
+
+    columns = {}
+    site_codes = np.zeros(rows, dtype=np.int8)
+    for c in _SITE_COLUMNS:
+        columns[c] = pd.Categorical.from_codes(site_codes, [meta[c]])
+    for c in _CODED_COLUMNS:
+        codes = np.load(part_dir / f"{c}.npy", mmap_mode="r")
+        columns[c] = pd.Categorical.from_codes(codes, meta["categories"][c])
+    for c in _ARRAY_COLUMNS:
+        columns[c] = np.load(part_dir / f"{c}.npy", mmap_mode="r")
+
+    # copy=False keeps the columns backed by the mapped files
+    return pd.DataFrame({c: columns[c] for c in DAILY_COLUMNS}, copy=False)
+
+
+def write_partition(site_dir: Path, values: pd.DataFrame) -> None:
+    """Write values as a new generation and make it the live one."""
+    site_dir.mkdir(parents=True, exist_ok=True)
+    # writers (threads or other processes) take turns so cleanup never removes
+    # a generation another writer is about to publish
+    with open(site_dir / ".lock", "w") as lock, stage("store_write") as record:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        _write_generation(site_dir, values)
+        record.rows = len(values)
+
+
+def _write_generation(site_dir: Path, values: pd.DataFrame) -> None:
+    part_dir = Path(tempfile.mkdtemp(dir=site_dir, prefix="gen-"))
+
+    meta = {"rows": len(values), "categories": {}}
+    for c in _SITE_COLUMNS:
+        meta[c] = str(values[c].iloc[0])
+    for c in _CODED_COLUMNS:
+        cat = pd.Categorical(values[c].astype(str))
+        meta["categories"][c] = [str(x) for x in cat.categories]
+        np.save(part_dir / f"{c}.npy", cat.codes)
+    for c in _ARRAY_COLUMNS:
+        np.save(part_dir / f"{c}.npy", values[c].to_numpy())
+    (part_dir / "meta.json").write_text(json.dumps(meta))
+
+    previous = _current_generation(site_dir)
+    fd, tmp_name = tempfile.mkstemp(dir=site_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(part_dir.name)
+    os.replace(tmp_name, site_dir / "CURRENT")
+
+    # keep the previous generation for readers that just resolved CURRENT;
+    # anything older is unreferenced (open maps survive the unlink)
+    for old in site_dir.glob("gen-*"):
+        if old.name not in (part_dir.name, previous):
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def _current_generation(site_dir: Path) -> str | None:
+    try:
+        return (site_dir / "CURRENT").read_text().strip()
+    except FileNotFoundError:
+        return None
+
+
+def merge_tail(cached: pd.DataFrame, tail: pd.DataFrame, start_dt) -> pd.DataFrame:
+    """Replace everything on/after start_dt in cached with the freshly fetched tail."""
+    if tail.empty:
+        return cached
+    keep = cached[cached["dateTime"] < pd.Timestamp(start_dt)]
+    return (pd.concat([keep, tail[DAILY_COLUMNS]], ignore_index=True)
+              .sort_values("dateTime", kind="stable")
+              .reset_index(drop=True))
+
+
+def _is_fresh(site_dir: Path, marker: str = "CURRENT") -> bool:
+    return time.time() - (site_dir / marker).stat().st_mtime < REFRESH_INTERVAL.total_seconds()
+
+
+def _known_empty(site_dir: Path) -> bool:
+    try:
+        return _is_fresh(site_dir, "NO_DATA")
+    except FileNotFoundError:
+        return False
+
+
+def _mark_empty(site_dir: Path) -> None:
+    site_dir.mkdir(parents=True, exist_ok=True)
+    (site_dir / "NO_DATA").touch()
+
+
+def load_many_daily_values(site_ids: list[str], cache_dir: Path = CACHE_DIR) -> dict[str, pd.DataFrame]:
+    """Flattened daily values for several sites, served from the local store when possible.
+
+    Sites not yet stored are fetched in full and stale sites get a tail refresh -
+    each group in batched multi-site requests. Sites with no data are left out,
+    and so are sites that could not be fetched; a site the service has no data
+    for is not asked for again within REFRESH_INTERVAL.
+    """
+    values = {}
+    missing = []
+    stale = {}
+    for site_id in site_ids:
+        site_dir = Path(cache_dir) / site_id
+        cached = read_partition(site_dir)
+        if cached is None:
+            if not _known_empty(site_dir):
+                missing.append(site_id)
+        elif _is_fresh(site_dir):
+            values[site_id] = cached
+        else:
+            stale[site_id] = cached
+
+    if missing:
+        try:
+            fetched = fetch_dv_batch(missing)
+        except requests.RequestException as e:
+            # service trouble - still serve the sites already stored
+            log.warning("daily values fetch for %d new sites failed: %s", len(missing), e)
+        else:
+            for site_id in missing:
+                site_dir = Path(cache_dir) / site_id
+                site_values = fetched.get(site_id)
+                if site_values is None or site_values.empty:
+                    _mark_empty(site_dir)
+                    continue
+                write_partition(site_dir, site_values)
+                (site_dir / "NO_DATA").unlink(missing_ok=True)
+                values[site_id] = read_partition(site_dir)
+
+    if stale:
+        # one start date for the whole batch - the earliest any stale site needs
+        start_dt = min(cached["dateTime"].max().date() for cached in stale.values()) \
+            - timedelta(days=PROVISIONAL_OVERLAP_DAYS)
+        try:
+            tails = fetch_dv_batch(list(stale), start_dt)
+        except requests.RequestException:
+            # service trouble - stale history beats no history
+            values.update(stale)
+        else:
+            for site_id, cached in stale.items():
+                site_dir = Path(cache_dir) / site_id
+                write_partition(site_dir, merge_tail(cached, tails.get(site_id, empty_daily_values()), start_dt))
+                values[site_id] = read_partition(site_dir)
+
+    return values
+
+
+def load_daily_values(site_id: str, cache_dir: Path = CACHE_DIR) -> pd.DataFrame:
+    """Flattened daily values for a site, served from the local store when possible."""
+    values = load_many_daily_values([site_id], cache_dir)
+    return values.get(site_id, empty_daily_values())
@@ -0,0 +1,146 @@
+"""Concurrent notebook sessions stay within SESSION_BYTE_BUDGET.
+
+    python -m pytest -q test_session_budget.py
+
+Runs the real notebook (usgs_gauge_flow.app) for several sessions at once
+against the local USGS stand-in, on one gauge or split across two, with every
+lazy section opened, and measures with session_nbytes the array data behind what a
+session holds: its cell definitions (gauge_values, day_data, month_data, ...),
+every artifact its cells read from the derived cache (streak frames, annual and
+top-flow tables, figures, ...) and every figure it renders.
+"""
+import os
+import socket
+import tempfile
+import threading
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# before the gauge modules read their configuration
+_PORT = _free_port()
+os.environ["USGS_WATER_SERVICES_URL"] = f"http://127.0.0.1:{_PORT}"
+os.environ["USGS_CACHE_DIR"] = tempfile.mkdtemp(prefix="gauge-budget-test-")
+
+import marimo as mo  # noqa: E402
+import pytest  # noqa: E402
+
+from gauge_cache import SESSION_BYTE_BUDGET, derived_cache, session_nbytes  # noqa: E402
+from gauge_sites import GAUGE_SITE_IDS, GAUGE_SITE_LABELS, GAUGE_SITES  # noqa: E402
+from usgs_gauge_flow import app  # noqa: E402
+from usgs_mock import MockSettings, start_mock_server  # noqa: E402
+
+start_mock_server(MockSettings(years=30), _PORT)
+
+SESSIONS = 8
+
+def _setup_cell_defs() -> set[str]:
+    """Names defined by the notebook's setup cell - the one defining site_dropdown."""
+    app._maybe_initialize()
+    (cell_id,) = app._graph.get_defining_cells("site_dropdown")
+    return app._graph.cells[cell_id].defs
+
+
+class _Rendered(threading.local):
+    """What the session running on this thread holds, and the lazy sections it renders."""
+
+    def __init__(self):
+        self.held, self.lazy = [], []
+
+
+_local = _Rendered()
+
+
+class _HeldCache:
+    """The notebook's derived cache for one session - records every artifact the cells read."""
+
+    def __init__(self, held: list):
+        self.held = held
+
+    def get_or_compute(self, key, compute):
+        artifact = derived_cache.get_or_compute(key, compute)
+        self.held.append(artifact)
+        return artifact
+
+
+@pytest.fixture(scope="module")
+def setup_defs():
+    """The setup cell's definitions, from one plain run of the notebook."""
+    _, defs = app.run()
+    return {name: defs[name] for name in _setup_cell_defs()}
+
+
+@pytest.fixture(autouse=True)
+def recorded_rendering(monkeypatch):
+    """Record the lazy sections and figures each session renders."""
+    lazy, plotly = mo.lazy, mo.ui.plotly
+
+    def recording_lazy(element, *args, **kwargs):
+        _local.lazy.append(element)
+        return lazy(element, *args, **kwargs)
+
+    def recording_plotly(figure, *args, **kwargs):
+        _local.held.append(figure)
+        return plotly(figure, *args, **kwargs)
+
+    monkeypatch.setattr(mo, "lazy", recording_lazy)
+    monkeypatch.setattr(mo.ui, "plotly", recording_plotly)
+
+
+def _session(setup_defs: dict, site_id: str) -> tuple[dict, list]:
+    """(cell definitions, everything else held) of one session on site_id, every lazy section opened."""
+    _local.held, _local.lazy = held, lazy = [], []
+    overrides = dict(setup_defs)
+    overrides["site_dropdown"] = mo.ui.dropdown(options=GAUGE_SITES, value=GAUGE_SITE_LABELS[site_id])
+    overrides["derived_cache"] = _HeldCache(held)
+    # one app per session, as each browser session gets its own kernel - a shared
+    # app object tracks only one executing cell
+    _, defs = app.clone().run(defs=overrides)
+
+    # sections opened inside other sections are appended while loading
+    for element in lazy:
+        held.append(element() if callable(element) else element)
+    return {name: value for name, value in defs.items() if name not in overrides}, held
+
+
+def _concurrent_sessions(setup_defs: dict, site_ids: list[str]) -> list[tuple[dict, list]]:
+    """Run one session per site id, all released at once."""
+    barrier = threading.Barrier(len(site_ids))
+    results: list = [None] * len(site_ids)
+    errors = []
+
+    def run(i):
+        try:
+            barrier.wait()
+            results[i] = _session(setup_defs, site_ids[i])
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(site_ids))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+@pytest.mark.parametrize("n_sites", [1, 2])
+def test_concurrent_sessions_within_budget(setup_defs, n_sites):
+    site_ids = [GAUGE_SITE_IDS[i % n_sites] for i in range(SESSIONS)]
+    results = _concurrent_sessions(setup_defs, site_ids)
+
+    for site_id, (defs, held) in zip(site_ids, results):
+        assert defs["site_id"] == site_id
+        nbytes = session_nbytes(list(defs.values()), held)
+        assert nbytes <= SESSION_BYTE_BUDGET, f"session for {site_id} holds {nbytes:,} unshared bytes"
+
+
+def test_copied_history_exceeds_budget(setup_defs):
+    defs, _ = _session(setup_defs, GAUGE_SITE_IDS[0])
+    assert session_nbytes(defs["day_data"].copy()) > SESSION_BYTE_BUDGET
@@ -14,9 +14,12 @@ def _(mo):
      - Days of Flow: For frequently dry or low-flow streams “Days of Flow > 0” is the interesting metric for answering 'when is there water' - useful for a number of Tucson area streams.
      - Monthly Flow: Monthly means from the available data.
      - Max Daily Mean Flow by Month: Maximum daily means for years/months.
-     - Wet/Dry Streaks: Based both on continuous > 0 mean flow AND continuous days of data (missing data will break the streak).
+     - Wet/Dry Streaks: Based both on continuous > 0 mean flow AND continuous days of data (missing data will break the streak) - the flow threshold and the number of missing days tolerated inside a streak can be adjusted.
      - Wettest/Dryest Years: Based on mean flow for the year.
      - Top 10 Daily Mean Flow Days: Top 10 days based on mean flow.
+     - Flow Duration: Flow-duration (exceedance) curves for the whole record, a month of the year or a year, and the flow exceeded on any share of days (e.g. the flow exceeded on 10% of August days).
+     - Date Range & Season: Days of flow, wettest/driest years and the monthly band for a span of years and a season (e.g. monsoon only, since 2000).
+     - Regional Comparison: Turn on 'Compare all gauges' to see days of flow, max flows and streaks for every gauge side by side.
 
     Use the dropdown below to view data for one of the gauges below:
       - [USGS 09484580 BARREL CANYON NEAR SONOITA, AZ](https://waterdata.usgs.gov/nwis/inventory?agency_code=USGS&site_no=09484580) - 83 and Barrel Canyon
@@ -35,6 +38,8 @@ def _(mo):
       - [USGS 09482440 SANTA CRUZ RIVER AT SILVERLAKE RD, AT TUCSON, AZ](https://waterdata.usgs.gov/nwis/inventory?agency_code=USGS&site_no=09482440)
       - [USGS 09484500 TANQUE VERDE CREEK AT TUCSON, AZ.](https://waterdata.usgs.gov/nwis/inventory?agency_code=USGS&site_no=09484500) - Sabino Canyon Road and Tanque Verde Creek
 
+    The 'Values' dropdown switches every section from the USGS Daily Mean to the daily mean or peak of the [Instantaneous Values](https://waterservices.usgs.gov/docs/instantaneous-values/) (15-minute) data for the last few years - useful for flash floods on ephemeral streams, where the daily mean hides the peak.
+
     The [National Water Information System 'Mapper'](https://maps.waterdata.usgs.gov/mapper/index.html) page shows a map of the USGS Gauges.
 
     The [Water Services Web](https://waterservices.usgs.gov/) page provides an overview of the data services available to retrieve data. Data in this report is from the Daily Values Service - [Daily Values Service Documentation](https://waterservices.usgs.gov/docs/dv-service/daily-values-service-details/), [Water Services URL Generation Tool](https://waterservices.usgs.gov/test-tools/?service=stat&siteType=&statTypeCd=all&major-filters=sites&format=rdb&date-type=type-period&statReportType=daily&statYearType=calendar&missingData=off&siteStatus=all&siteNameMatchOperator=start).
@@ -46,676 +51,594 @@ def _(mo):
 @app.cell
 def _():
     import marimo as mo
-    import requests
-    import pandas as pd
-    from datetime import date
+    import numpy as np
+
+    from gauge_cache import (
+        derived_cache,
+        get_daily_values,
+        get_iv_aggregates,
+        get_iv_daily_values,
+        series_fingerprint,
+        start_warmer,
+    )
+    from gauge_metrics import DIAGNOSTICS, stage, stage_summary, start_metrics_server
+    from gauge_figures import (
+        MONTH_LABELS,
+        days_of_flow_tiles,
+        flow_duration_figure,
+        fmt_cfs,
+        max_flow_heatmap,
+        monthly_flow_band_linear,
+        range_summary_html,
+        regional_day_flow_heatmap,
+        regional_days_of_flow_heatmap,
+        regional_max_flow_heatmap,
+        summary_lists_html,
+    )
+    from gauge_duration import DURATION_EXCEEDANCES, FlowDuration
+    from gauge_incremental import incremental_stats
+    from gauge_iv import IV_FLOW_THRESHOLD, hours_above_summary
+    from gauge_ranges import SEASONS, CalendarIndex
+    from gauge_region import region_years, regional_flow
+    from gauge_stats import DRY, WET, calendar_bounds, month_of_year_flow_stats, ranked_years
+    from gauge_sites import DEFAULT_SITE, GAUGE_SITE_IDS, GAUGE_SITE_LABELS, GAUGE_SITES, site_id_from_label
+
+    # load every gauge in the background (once per process) so switching is served from memory
+    start_warmer(GAUGE_SITE_IDS)
+    # Prometheus /metrics when GAUGE_METRICS_PORT is set (once per process)
+    start_metrics_server()
 
     # --- dropdown with human-readable labels ---
     site_dropdown = mo.ui.dropdown(
-        options=[
-            "Rincon Creek -- 09485000",
-            "Sabino Creek Near Tucson-- 09484000",
-            "Bear Creek Above Bear Canyon Road -- 09484201",
-            "Pantano Wash Near Vail -- 09484600",
-            "Cienega Creek Near Sonoita -- 09484550",
-            "Tanque Verde Creek at Tucson -- 09484500",
-            "Rillito Creek at Dodge Boulevard at Tucson -- 09485700",
-            "San Pedro R at Redington Bridge nr Redington -- 09472050",
-            "Barrel Canyon Near Sonoita -- 09484580",
-            "Rillito Creek at La Cholla Blvd Near Tucson -- 09486055",
-            "Canada Del Oro Blw Ina Road, Near Tucson -- 09486350",
-            "Santa Cruz River at Tucson -- 09482500",
-            "Santa Cruz River at Mission Lane GCS at Tucson -- 09482495",
-            "Santa Cruz River at Starr Pass GCS at Tucson AZ -- 09482490",
-            "Santa Cruz River at Silverlake Rd, at Tucson -- 09482440",
-        ],
-        value="Rincon Creek -- 09485000",
+        options=GAUGE_SITES,
+        value=DEFAULT_SITE,
         label="Select USGS Site"
     )
 
-    site_dropdown
-    return date, mo, pd, requests, site_dropdown
+    # the 15-minute (IV) record shows flash-flood peaks the daily mean hides - recent years only
+    value_source = mo.ui.dropdown(
+        options={
+            "Daily mean (DV)": "dv",
+            "Daily mean of 15-minute values (IV)": "mean",
+            "Daily peak of 15-minute values (IV)": "max",
+        },
+        value="Daily mean (DV)",
+        label="Values"
+    )
+
+    mo.hstack([site_dropdown, value_source], justify="start", gap=2)
+    return (
+        CalendarIndex,
+        DIAGNOSTICS,
+        DRY,
+        DURATION_EXCEEDANCES,
+        FlowDuration,
+        GAUGE_SITE_IDS,
+        GAUGE_SITE_LABELS,
+        IV_FLOW_THRESHOLD,
+        MONTH_LABELS,
+        SEASONS,
+        WET,
+        calendar_bounds,
+        days_of_flow_tiles,
+        derived_cache,
+        flow_duration_figure,
+        fmt_cfs,
+        get_daily_values,
+        get_iv_aggregates,
+        get_iv_daily_values,
+        hours_above_summary,
+        incremental_stats,
+        max_flow_heatmap,
+        mo,
+        month_of_year_flow_stats,
+        monthly_flow_band_linear,
+        np,
+        range_summary_html,
+        ranked_years,
+        region_years,
+        regional_day_flow_heatmap,
+        regional_days_of_flow_heatmap,
+        regional_flow,
+        regional_max_flow_heatmap,
+        series_fingerprint,
+        site_dropdown,
+        site_id_from_label,
+        stage,
+        stage_summary,
+        summary_lists_html,
+        value_source,
+    )
 
 
 @app.cell
-def _(mo, requests, site_dropdown):
+def _(
+    IV_FLOW_THRESHOLD,
+    get_daily_values,
+    get_iv_aggregates,
+    get_iv_daily_values,
+    hours_above_summary,
+    mo,
+    site_dropdown,
+    site_id_from_label,
+    value_source,
+):
     selected_label = site_dropdown.value
-    site_id = selected_label[-8:]  # parse last 8 characters
-
-    gauge_url = "https://waterservices.usgs.gov/nwis/dv/"
-    params = {
-        "format": "json",
-        "sites": site_id,
-        "period": "P3900W",
-        "siteStatus": "all"
-    }
+    site_id = site_id_from_label(selected_label)
+    _fetched = f"Fetched data for **{selected_label}** (site ID: `{site_id}`)"
 
-    gauge_response = requests.get(gauge_url, params=params)
-    gauge_data = gauge_response.json()
+    if value_source.value == "dv":
+        # memory when warm, else the local store - only the recent (provisional) tail is re-fetched
+        gauge_values = get_daily_values(site_id)
+    else:
+        # daily mean/peak of the 15-minute record, folded chunk by chunk as it downloads
+        gauge_values = get_iv_daily_values(site_id, value_source.value)
+
+    # not every gauge reports 15-minute values - nothing below has a calendar without data
+    mo.stop(gauge_values.empty, mo.md(f"{_fetched}\n\nNo data for this site from **{value_source.selected_key}**."))
+
+    _output = mo.md(_fetched)
+    if value_source.value != "dv":
+        # time with flow, from the reading durations of the same cached aggregates
+        _hours = hours_above_summary(get_iv_aggregates(site_id)[1])
+        if _hours["start"] is not None:
+            _output = mo.md(
+                f"{_fetched}\n\n"
+                f"Flow above {IV_FLOW_THRESHOLD:g} cfs for **{_hours['recent_hours_above']:,.1f} h** of the last "
+                f"{_hours['recent_days']} days ({_hours['recent_hours']:,.0f} h recorded) and "
+                f"**{_hours['hours_above']:,.0f} h** of {_hours['hours']:,.0f} h recorded since {_hours['start']}."
+            )
 
-    mo.md(f"Fetched data for **{selected_label}** (site ID: `{site_id}`)")
-    return (gauge_data,)
+    _output
+    return gauge_values, site_id
 
 
 @app.cell
-def _(gauge_data, pd):
-    def flatten_usgs_daily(data):
-        rows = []
-        for ts in data["value"]["timeSeries"]:
-            site = ts["sourceInfo"]["siteCode"][0]["value"]
-            site_name = ts["sourceInfo"]["siteName"]
-            var_code = ts["variable"]["variableCode"][0]["value"]
-            stat_code = ts["variable"]["options"]["option"][0]["optionCode"]
-
-            for point in ts["values"][0]["value"]:
-                if not point or "dateTime" not in point or "value" not in point:
-                    continue
-                quals = point.get("qualifiers") or []
-                quals_str = ",".join(map(str, quals)) if isinstance(quals, list) else str(quals or "")
-                rows.append({
-                    "siteCode": site,
-                    "siteName": site_name,
-                    "variableCode": var_code,
-                    "statisticCode": stat_code,
-                    "dateTime": point["dateTime"],
-                    "value": point["value"],
-                    "qualifiers": quals_str
-                })
-
-        month_data = pd.DataFrame(rows)
-        if not month_data.empty:
-            month_data["dateTime"] = pd.to_datetime(month_data["dateTime"], errors="coerce")
-            month_data["value"] = pd.to_numeric(month_data["value"], errors="coerce")
-            month_data = month_data.sort_values("dateTime").reset_index(drop=True)
-        return month_data
-
-    gauge_values = flatten_usgs_daily(gauge_data)
-
-    assert not (gauge_values['dateTime'].dt.floor('D') != gauge_values['dateTime']).any(), \
+def _(gauge_values, np, series_fingerprint):
+    # int64 nanoseconds - no datetime copies of the full history
+    assert not (gauge_values['dateTime'].to_numpy().view(np.int64) % 86_400_000_000_000).any(), \
         "Error: Some datetimes have non-zero time components"
 
+    # content hash of the series - derived artifacts are cached under it
+    data_version = series_fingerprint(gauge_values)
+
     gauge_values
-    return (gauge_values,)
+    return (data_version,)
 
 
 @app.cell
-def _(date, gauge_values, pd):
-    gauge_start_date = date(gauge_values["dateTime"].min().year + 1, 1, 1)
-    gauge_end_date = date(date.today().year, 12, 31)
-
-    day_frame = pd.date_range(start=gauge_start_date, end=gauge_end_date, freq='D')
-
-    day_data = pd.DataFrame(index=day_frame)
-    day_data = day_data.reset_index().rename(columns={"index": "dateTime"})
-
-    grouped_gauge_days = gauge_values.groupby('dateTime').agg(has_flow=('value', lambda x: (x > 0).any()), mean_flow=('value', 'mean'))
-    grouped_gauge_days['has_data'] = True
-    grouped_gauge_days.reset_index(inplace=True)
-
-    day_data = day_data.merge(grouped_gauge_days, how='left', on='dateTime')
-
-    day_data['year'] = day_data['dateTime'].dt.year
-    day_data['month'] = day_data['dateTime'].dt.month
-
-    day_data['has_data'] = day_data['has_data'].astype('boolean')
-    day_data['has_flow'] = day_data['has_flow'].astype('boolean')
+def _(
+    calendar_bounds,
+    data_version,
+    derived_cache,
+    gauge_values,
+    incremental_stats,
+    site_id,
+    value_source,
+):
+    gauge_start_date, gauge_end_date = calendar_bounds(gauge_values)
+
+    # everything derived from the series is keyed on its content and the calendar end
+    day_key = (data_version, gauge_end_date)
+
+    def gauge_stats(artifact):
+        """artifact(stats) from the gauge's running statistics - a refreshed series
+        is folded in from its first changed day, not recomputed over the record."""
+        with incremental_stats((site_id, value_source.value), gauge_values, data_version) as stats:
+            return artifact(stats)
+
+    # dense calendar - one row per day
+    day_data = derived_cache.get_or_compute(
+        day_key + ("day_data",),
+        lambda: gauge_stats(lambda stats: stats.day_data())
+    )
 
-    day_data['has_data'] = day_data['has_data'].fillna(False)
-    day_data['has_flow'] = day_data['has_flow'].fillna(False)
+    day_data
+    return day_data, day_key, gauge_stats
 
-    day_data['month_date_time'] = day_data['dateTime'].values.astype('datetime64[M]')
-    day_data['year_date_time'] = day_data['dateTime'].values.astype('datetime64[Y]')
 
-    day_data.sort_values('dateTime', inplace=True)
+@app.cell
+def _(day_key, derived_cache, gauge_stats):
+    # max/mean/quantiles for every (year, month) - only months with changed days are recomputed
+    month_data = derived_cache.get_or_compute(
+        day_key + ("month_data",),
+        lambda: gauge_stats(lambda stats: stats.month_data()).fillna({"max_mean_flow": 0})
+    )
 
-    day_data
-    return day_data, gauge_end_date, gauge_start_date
+    month_data
+    return (month_data,)
 
 
 @app.cell
-def _(day_data, gauge_end_date, gauge_start_date, pd):
-    import numpy as np
-
-    month_frame = pd.date_range(start=gauge_start_date, end=gauge_end_date, freq='MS')
+def _(day_key, days_of_flow_tiles, derived_cache, mo, month_data):
+    # static svg tiles, built once per data version and shared by every session
+    tiles = derived_cache.get_or_compute(
+        day_key + ("days_of_flow_tiles",),
+        lambda: days_of_flow_tiles(month_data)
+    )
 
-    month_data = pd.DataFrame(index=month_frame)
-    month_data = month_data.reset_index().rename(columns={"index": "month_date_time"})
+    mo.Html(
+        f"""
+        <h2 style="text-align:center;">Days of Flow</h2>
+        <hr style="width:100%; border:none; border-top:1px solid #ddd; margin:30px 0;">
+        <div style="display:flex; flex-wrap:wrap; column-gap:2px; row-gap:12px; align-items:flex-start;">
+          {"".join(f"<div>{t}</div>" for t in tiles)}
+        </div>
+        <hr style="width:100%; border:none; border-top:1px solid #ddd; margin:30px 0;">
+        """
+    )
+    return (tiles,)
 
-    month_day_grouped = day_data.groupby('month_date_time').agg(
-        days_with_data=('has_data', 'sum'),
-        days_with_flow=('has_flow', 'sum'),
-        max_mean_flow=('mean_flow', lambda x: np.max(x) if len(x) else np.nan),
-        mean_flow=('mean_flow', lambda x: np.mean(x) if len(x) else np.nan),
-        twenty_five_quantile_flow=('mean_flow', lambda x: np.quantile(x, 0.25) if len(x) else np.nan),
-        seventy_five_quantile_flow=('mean_flow', lambda x: np.quantile(x, 0.75) if len(x) else np.nan),
-    ).reset_index()
 
-    month_data = month_data.merge(month_day_grouped, how='left', on='month_date_time')
+@app.cell
+def _(
+    day_key,
+    derived_cache,
+    gauge_stats,
+    max_flow_heatmap,
+    mo,
+    month_data,
+    monthly_flow_band_linear,
+    stage,
+):
+    # below the fold - computed when first scrolled into view, then cached per data version
+    _plot_config = {
+        "displayModeBar": False,
+        "scrollZoom": False,
+        "doubleClick": False,   # ok to disable double-click reset
+        "staticPlot": False     # keep interactivity for tooltips
+    }
 
-    month_data['max_mean_flow'] = month_data['max_mean_flow'].fillna(0)
-    month_data['days_with_data'] = month_data['days_with_data'].fillna(0).astype(int)
+    def _monthly_flow_tile():
+        monthly_flow_fig = derived_cache.get_or_compute(
+            day_key + ("monthly_flow_fig",),
+            lambda: monthly_flow_band_linear(
+                derived_cache.get_or_compute(
+                    day_key + ("month_summary_data",),
+                    lambda: gauge_stats(lambda stats: stats.month_summary_data())
+                )
+            )
+        )
+        with stage("plotly_ui", figure="monthly_flow_band"):
+            return mo.ui.plotly(monthly_flow_fig, config=_plot_config)
 
-    month_data["year"]  = month_data["month_date_time"].dt.year
-    month_data["month"] = month_data["month_date_time"].dt.month
+    def _heat_map_tile():
+        fig = derived_cache.get_or_compute(
+            day_key + ("max_flow_heatmap",),
+            lambda: max_flow_heatmap(month_data)
+        )
+        with stage("plotly_ui", figure="max_flow_heatmap"):
+            return mo.ui.plotly(fig, config=_plot_config)
 
-    month_numbers = range(1, 13)
+    mo.md(
+        f"""
+        <h2 style="text-align:center;">Monthly Flow - Median with 25-75% Band</h2>
+        <hr style="width:100%; border:none; border-top:1px solid #ddd; margin:30px 0;">
+        {mo.lazy(_monthly_flow_tile, show_loading_indicator=True)}
+        <hr style="width:100%; border:none; border-top:1px solid #ddd; margin:30px 0;">
 
-    month_data
-    return month_data, month_numbers, np
+        <h2 style="text-align:center;">Max Daily Mean Flow by Month</h2>
+        <hr style="width:100%; border:none; border-top:1px solid #ddd; margin:30px 0;">
+        {mo.lazy(_heat_map_tile, show_loading_indicator=True)}
+        <hr style="width:100%; border:none; border-top:1px solid #ddd; margin:30px 0;">
+        """
+    )
+    return
 
 
 @app.cell
-def _(day_data, np):
-    month_summary_data = (day_data.query('has_data').groupby('month').agg(
-        max_mean_flow=('mean_flow', 'max'),
-        median_flow=('mean_flow', 'median'),
-        twenty_five_quantile_flow=('mean_flow', lambda x: np.quantile(x, 0.25)),
-        seventy_five_quantile_flow=('mean_flow', lambda x: np.quantile(x, 0.75)),
-        ).reindex(np.arange(1, 13), fill_value=np.nan)  # ensure 1..12 present
-                .rename_axis('month')
-                .reset_index())
-    return (month_summary_data,)
+def _(mo):
+    streak_threshold = mo.ui.number(
+        start=0, stop=10000, step=0.1, value=0,
+        label="Wet streak: daily mean flow > (cfs)"
+    )
+    streak_max_gap = mo.ui.number(
+        start=0, stop=30, step=1, value=0,
+        label="Missing days allowed inside a streak"
+    )
+
+    mo.hstack([streak_threshold, streak_max_gap], justify="start", gap=2)
+    return streak_max_gap, streak_threshold
 
 
 @app.cell
-def _(mo, month_data, np):
-
-    import plotly.graph_objects as go
-
-    years = sorted(month_data["year"].unique())
-
-    FACET_W   = 90
-    FACET_H   = 70
-    LINE_COLOR = "#3366cc"
-
-    def _nanmax0(a):
-        """nan-safe max -> 0 when all NaN/empty"""
-        try:
-            m = np.nanmax(a)
-            return 0 if np.isnan(m) else float(m)
-        except ValueError:  # empty
-            return 0
-
-    def tiny_fig(year: int) -> go.Figure:
-        g = month_data[month_data["year"] == year].sort_values("month").copy()
-
-        # bars should show 0 for missing months
-        g["days_with_data"] = g["days_with_data"].fillna(0)
-
-        # line hidden where there is no data that month
-        # keep actual flow values where data exists; otherwise None breaks the line
-        flow_vals = g["days_with_flow"].to_numpy(dtype=float)
-        flow_vals = np.where(g["days_with_data"].to_numpy() > 0, flow_vals, np.nan)
-        flow_vals = np.where(np.isnan(flow_vals), None, flow_vals)  # Plotly wants None to break lines
-
-        # safe headroom; base at 0
-        ymax_data = _nanmax0(g["days_with_data"].to_numpy(dtype=float))
-        ymax_flow = _nanmax0(g["days_with_flow"].to_numpy(dtype=float))
-        y_top = max(31.0, ymax_data, ymax_flow) + 0.6
-
-        fig = go.Figure()
-
-        # bars
-        fig.add_bar(
-            x=g["month"],  # 1..12, ticks hidden anyway
-            y=g["days_with_data"],
-            marker_color="rgba(200,200,200,0.4)",
-            showlegend=False,
-            hoverinfo="skip",
-            hovertemplate=None
+def _(
+    DRY,
+    WET,
+    day_key,
+    derived_cache,
+    gauge_stats,
+    mo,
+    ranked_years,
+    streak_max_gap,
+    streak_threshold,
+    summary_lists_html,
+):
+    # streaks, wettest/driest years and top flow days - computed when scrolled into view;
+    # only this cell reruns when the streak settings change
+    def _summary_lists():
+        def _top_streaks(stats):
+            # frozen runs live in bounded heaps - only the open runs at the end are re-derived
+            settings = (streak_threshold.value, int(streak_max_gap.value))
+            return stats.top_runs(WET, *settings, k=10), stats.top_runs(DRY, *settings, k=10)
+
+        top10_wet, top10_dry = derived_cache.get_or_compute(
+            day_key + ("top_streaks", streak_threshold.value, int(streak_max_gap.value)),
+            lambda: gauge_stats(_top_streaks)
         )
 
-        # line (slightly thinner)
-        fig.add_scatter(
-            x=g["month"],
-            y=flow_vals,
-            mode="lines",
-            line=dict(color=LINE_COLOR, width=2),
-            showlegend=False,
-            connectgaps=False,
-            hoverinfo="skip",
-            hovertemplate=None
+        # Wettest & Driest Years (eligible = ≥1 data day each month)
+        annual_mean = derived_cache.get_or_compute(
+            day_key + ("annual_mean",),
+            lambda: gauge_stats(lambda stats: stats.annual_mean())
         )
+        wettest, driest = ranked_years(annual_mean, 10)
 
-        fig.update_xaxes(showticklabels=False, ticks="")
-        fig.update_yaxes(showticklabels=False, range=[0, y_top])
-
-        # layout; use annotation for the year label to avoid title quirks
-        fig.update_layout(
-            width=FACET_W,
-            height=FACET_H,
-            margin=dict(t=10, r=0, b=2, l=0),
-            template="plotly_white",
-            bargap=0.2,
-            annotations=[
-                dict(
-                    x=0.0, y=1.2,                  # ← move higher above bars
-                    xref="paper", yref="paper",
-                    text=str(year),
-                    showarrow=False,
-                    xanchor="left", yanchor="top",
-                    font=dict(size=9,              # ← slightly larger
-                              color="rgba(0,0,0,0.3)")
-                )
-            ],
+        # Top 10 Daily Mean Flow Days
+        top10_flow = derived_cache.get_or_compute(
+            day_key + ("top10_flow",),
+            lambda: gauge_stats(lambda stats: stats.top_flow_days(10))
         )
 
-        return fig
-
-    # build figures for all years
-    figs = [tiny_fig(y) for y in years]
+        return mo.md(summary_lists_html(top10_wet, top10_dry, wettest, driest, top10_flow,
+                                        wet_threshold=streak_threshold.value))
 
-    # static, no interactivity
-    static_config = {
-        "staticPlot": True,
-        "displayModeBar": False,
-        "displaylogo": False,
-    }
+    mo.lazy(_summary_lists, show_loading_indicator=True)
+    return
 
-    tiles = [mo.ui.plotly(f, config=static_config) for f in figs]
 
-    mo.md(
-        f"""
-        <h2 style="text-align:center;">Days of Flow</h2>
-        <hr style="width:100%; border:none; border-top:1px solid #ddd; margin:30px 0;">
-        <div style="display:flex; flex-wrap:wrap; column-gap:2px; row-gap:12px; align-items:flex-start;">
-          {"".join(f"<div>{p}</div>" for p in tiles)}
-        </div>
-        <hr style="width:100%; border:none; border-top:1px solid #ddd; margin:30px 0;">
-        """
+@app.cell
+def _(SEASONS, day_data, mo):
+    _first_year, _last_year = int(day_data["year"].iloc[0]), int(day_data["year"].iloc[-1])
+    range_years = mo.ui.range_slider(
+        start=_first_year, stop=max(_last_year, _first_year + 1), step=1,
+        value=[_first_year, _last_year],
+        label="Years", show_value=True, full_width=True
     )
-    return go, years
+    range_season = mo.ui.dropdown(options=list(SEASONS), value="All year", label="Season")
+
+    mo.vstack([
+        mo.md('<h2 style="text-align:center;">Date Range &amp; Season</h2>'),
+        mo.lazy(mo.vstack([range_season, range_years])),
+    ])
+    return range_season, range_years
 
 
 @app.cell
-def _(mo, month_summary_data, pd):
-    def monthly_flow_band_linear(
-        month_summary_data: pd.DataFrame,
-        y_title="Flow (cfs)"
-    ):
-        import numpy as np
-        import pandas as pd
-        import plotly.graph_objects as go
-
-        # --- Keep only needed columns and ensure months 1–12 ---
-        cols = ["month", "median_flow",
-                "twenty_five_quantile_flow", "seventy_five_quantile_flow"]
-        df = month_summary_data[cols].copy()
-
-        df["month"] = df["month"].astype(int)
-        month_index = pd.Index(np.arange(1, 13), name="month")
-        df = df.set_index("month").reindex(month_index).reset_index()
-
-        # ensure numeric (preserve NaN)
-        for c in ["median_flow", "twenty_five_quantile_flow", "seventy_five_quantile_flow"]:
-            df[c] = pd.to_numeric(df[c], errors="coerce")
-
-        # --- Handle swapped quantiles (rare but safe check) ---
-        q25 = df["twenty_five_quantile_flow"].to_numpy(dtype=float)
-        q75 = df["seventy_five_quantile_flow"].to_numpy(dtype=float)
-        swap_mask = (q25 > q75) & np.isfinite(q25) & np.isfinite(q75)
-        if np.any(swap_mask):
-            tmp = q25.copy()
-            q25[swap_mask] = q75[swap_mask]
-            q75[swap_mask] = tmp[swap_mask]
-
-        x = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
-
-        # --- Plotly figure ---
-        fig = go.Figure()
-
-        # Lower bound (q25) invisible anchor
-        fig.add_trace(go.Scatter(
-            x=x, y=q25,
-            mode="lines",
-            line=dict(width=0),
-            showlegend=False,
-            hoverinfo="skip"
-        ))
-
-        # Upper bound (q75) filled to q25
-        fig.add_trace(go.Scatter(
-            x=x, y=q75,
-            mode="lines",
-            line=dict(width=0),
-            fill="tonexty",
-            name="25–75% band",
-            hoverinfo="skip",
-            # optional: set a subtle fill if you want
-            # fillcolor="rgba(31,119,180,0.2)"
-        ))
-
-        # Median line (+ show band in tooltip via customdata)
-        custom = np.column_stack([q25, q75])
-        fig.add_trace(go.Scatter(
-            x=x, y=df["median_flow"],
-            mode="lines+markers",
-            name="Median",
-            customdata=custom,
-            hovertemplate=(
-                "Month: %{x}<br>"
-                "Median: %{y:.2f} cfs<br>"
-                "25–75%: %{customdata[0]:.2f}–%{customdata[1]:.2f} cfs"
-                "<extra></extra>"
-            )
-        ))
-
-        # --- Layout (mobile/static friendly) ---
-        fig.update_layout(
-            title=None,
-            xaxis_title="",
-            yaxis_title=y_title,
-            margin=dict(l=8, r=8, t=40, b=30),
-            height=280,
-            legend=dict(orientation="h", y=1.1, x=0),
-            hovermode="x unified",
-            dragmode=False,    
-            plot_bgcolor="white",
-            paper_bgcolor="white"
+def _(
+    CalendarIndex,
+    SEASONS,
+    day_data,
+    day_key,
+    derived_cache,
+    mo,
+    month_of_year_flow_stats,
+    monthly_flow_band_linear,
+    range_season,
+    range_summary_html,
+    range_years,
+    ranked_years,
+    stage,
+    tiles,
+):
+    def _range_section():
+        # prefix sums over the calendar, built once per data version when the section
+        # is first shown - moving the slider or switching the season is then a few
+        # array lookups, not a recomputation
+        calendar_index = derived_cache.get_or_compute(
+            day_key + ("calendar_index",),
+            lambda: CalendarIndex(day_data)
         )
 
-        fig.update_xaxes(fixedrange=True)
-        fig.update_yaxes(rangemode="tozero", fixedrange=True, tickformat="~s")  # 1.2k style
+        first_year, last_year = range_years.value
+        months = SEASONS[range_season.value]
+        # season years - a winter starts in the December before its year
+        start, end = calendar_index.season_bounds(first_year, last_year, months)
+
+        totals = calendar_index.totals(start, end, months)
+        by_year = calendar_index.by_year(first_year, last_year, months)
+        wettest, driest = ranked_years(by_year.loc[by_year["complete"], "mean_flow"].dropna(), 10)
+
+        # one prebuilt tile per calendar year
+        tile_offset = int(day_data["year"].iloc[0])
+        year_tiles = tiles[max(first_year - tile_offset, 0):last_year - tile_offset + 1]
+
+        def _range_band_tile():
+            # quantiles don't come from prefix sums - the band is computed on the
+            # calendar slice of the year range, once per range, and masked to the season
+            band = derived_cache.get_or_compute(
+                day_key + ("month_summary_data", start, end),
+                lambda: month_of_year_flow_stats(day_data.iloc[calendar_index.rows(start, end)])
+            )
+            band = band.assign(**{
+                c: band[c].where(band["month"].isin(months))
+                for c in ["median_flow", "twenty_five_quantile_flow", "seventy_five_quantile_flow"]
+            })
+            with stage("plotly_ui", figure="range_flow_band"):
+                return mo.ui.plotly(monthly_flow_band_linear(band), config={
+                    "displayModeBar": False, "scrollZoom": False, "doubleClick": False
+                })
 
-        return fig
+        label = f"{range_season.value}, {first_year}–{last_year}"
+        return mo.md(
+            f"""
+            {range_summary_html(label, totals, wettest, driest)}
 
-    # --- Marimo tile ---
-    monthly_flow_fig = monthly_flow_band_linear(month_summary_data)
+            <h3>Days of Flow</h3>
+            <div style="display:flex; flex-wrap:wrap; column-gap:2px; row-gap:12px; align-items:flex-start;">
+              {"".join(f"<div>{t}</div>" for t in year_tiles)}
+            </div>
 
-    monthly_flow_tile = mo.ui.plotly(
-        monthly_flow_fig,
-        config={
-            "displayModeBar": False,
-            "scrollZoom": False,
-            "doubleClick": False,   # ok to disable double-click reset
-            "staticPlot": False     # keep interactivity for tooltips
-        },
-    )
+            <h3>Monthly Flow - Median with 25-75% Band</h3>
+            {mo.lazy(_range_band_tile, show_loading_indicator=True)}
+            <hr style="width:100%; border:none; border-top:1px solid #ddd; margin:30px 0;">
+            """
+        )
 
-    mo.md(
-        f"""
-        <h2 style="text-align:center;">Monthly Flow - Median with 25-75% Band</h2>
-        <hr style="width:100%; border:none; border-top:1px solid #ddd; margin:30px 0;">
-        {monthly_flow_tile}
-        <hr style="width:100%; border:none; border-top:1px solid #ddd; margin:30px 0;">
-        """
-    )
+    mo.lazy(_range_section, show_loading_indicator=True)
     return
 
 
 @app.cell
-def _(go, mo, month_data, month_numbers, np, years):
-    # --- Pivot just what you need ---
-    mmf = (
-        month_data.pivot_table(
-            index="year",
-            columns="month",
-            values="max_mean_flow",
-            aggfunc="mean",
-        )
-        .reindex(index=years)                       # keep years in desired order
-        .reindex(columns=month_numbers)             # ensure months 1..12
+def _(MONTH_LABELS, day_data, mo):
+    duration_month = mo.ui.dropdown(
+        options={"All months": 0, **{label: m for m, label in enumerate(MONTH_LABELS, start=1)}},
+        value="All months", label="Month"
+    )
+    # the calendar is dense - every year from the first to the last
+    _first_year, _last_year = int(day_data["year"].iloc[0]), int(day_data["year"].iloc[-1])
+    duration_year = mo.ui.dropdown(
+        options={"All years": 0, **{str(y): y for y in range(_first_year, _last_year + 1)}},
+        value="All years", label="Year"
+    )
+    duration_percent = mo.ui.number(
+        start=0.1, stop=99.9, step=0.1, value=10,
+        label="Flow exceeded on % of days"
     )
 
-    # --- Log transform; NaNs stay NaN and will render as gaps/transparent ---
-    z_logged = np.log10(mmf + 1)
+    mo.vstack([
+        mo.md('<h2 style="text-align:center;">Flow Duration</h2>'),
+        mo.lazy(mo.hstack([duration_month, duration_year, duration_percent], justify="start", gap=2)),
+    ])
+    return duration_month, duration_percent, duration_year
 
-    # --- Hover text: "No Data" for NaN, else value with 2 decimals ---
-    heat_hover_text = (
-        mmf.round(2)
-           .astype(object)                          # allow mixing floats and strings
-           .where(~mmf.isna(), "No Data")
-    )
 
-    month_labels = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
-
-    fig = go.Figure(
-        data=go.Heatmap(
-            z=z_logged.to_numpy(),
-            x=month_labels,
-            y=mmf.index.astype(str),
-            colorscale="PuBu",
-            text=heat_hover_text.to_numpy(),
-            hovertemplate=(
-                "Year: %{y}<br>"
-                "Month: %{x}<br>"
-                "max_mean_flow: %{text}<extra></extra>"
-            ),
-            colorbar=dict(
-                title="log₁₀",
-                orientation="h",
-                x=0.5,
-                xanchor="center",
-                y=1.02,
-                yanchor="bottom",
-                len=0.8,
-                thickness=15
-            ),
-            showscale=True,
-            hoverongaps=False
+@app.cell
+def _(
+    DURATION_EXCEEDANCES,
+    FlowDuration,
+    MONTH_LABELS,
+    day_data,
+    day_key,
+    derived_cache,
+    duration_month,
+    duration_percent,
+    duration_year,
+    flow_duration_figure,
+    fmt_cfs,
+    mo,
+    stage,
+):
+    def _duration_section():
+        # sorted daily means per month of the year, year and calendar month, built
+        # once per data version when the section is first shown - a curve or
+        # percentile is then a lookup, not a re-sort
+        flow_duration = derived_cache.get_or_compute(
+            day_key + ("flow_duration",),
+            lambda: FlowDuration(day_data)
         )
-    )
 
-    # Size per year for mobile
-    row_height = 20
-    total_height = max(400, len(mmf.index) * row_height)
-
-    fig.update_layout(
-        title="",
-        xaxis=dict(title="", fixedrange=True, showgrid=False),
-        yaxis=dict(
-            title="",
-            autorange="reversed",
-            fixedrange=True,
-            showgrid=False,
-            tickmode="array",
-            tickvals=mmf.index,
-            ticktext=mmf.index.astype(str),
-        ),
-        margin=dict(l=4, r=4, t=2, b=10),
-        height=total_height,
-        paper_bgcolor="white",
-        plot_bgcolor="white",
-        hovermode="x unified",
-        dragmode=False
-    )
+        month = duration_month.value or None
+        year = duration_year.value or None
+        share = duration_percent.value / 100
+        selection = " ".join(
+            ([MONTH_LABELS[month - 1]] if month else []) + ([str(year)] if year else [])
+        ) or "the whole record"
+
+        flow = flow_duration.flow_exceeded(share, month, year)
+        days = len(flow_duration.values(month, year))
+        with_flow = flow_duration.exceedance(0.0, month, year)
+
+        def _duration_tile():
+            curves = {"Whole record": flow_duration.curve()}
+            if month is not None or year is not None:
+                curves[selection] = flow_duration.curve(month, year)
+            with stage("plotly_ui", figure="flow_duration"):
+                return mo.ui.plotly(flow_duration_figure(curves), config={
+                    "displayModeBar": False, "scrollZoom": False, "doubleClick": False
+                })
 
-    heat_map_tile = mo.ui.plotly(
-        fig,
-        config={
-            "displayModeBar": False,
-            "scrollZoom": False,
-            "doubleClick": False,
-            "staticPlot": False
-        },
-    )
+        exceedances = sorted({*DURATION_EXCEEDANCES, share})
+        table = flow_duration.percentile_table(exceedances, year)
+        table["month"] = MONTH_LABELS
 
-    mo.md(
-        f"""
-        <h2 style="text-align:center;">Max Daily Mean Flow by Month</h2>
-        <hr style="width:100%; border:none; border-top:1px solid #ddd; margin:30px 0;">
-        {heat_map_tile}
-        <hr style="width:100%; border:none; border-top:1px solid #ddd; margin:30px 0;">
-        """
-    )
+        return mo.vstack([
+            mo.md(
+                f"**{fmt_cfs(flow)} cfs** is exceeded on {duration_percent.value:g}% of the {days:,} days "
+                f"with data in {selection}; flow > 0 on {with_flow:.0%} of them."
+                if days else f"No days with data in {selection}."
+            ),
+            mo.lazy(_duration_tile, show_loading_indicator=True),
+            mo.md(f"Flow (cfs) exceeded on p% of days (Qp) by month, {year or 'all years'}"),
+            mo.ui.table(table.round(2), selection=None, pagination=False),
+        ])
+
+    mo.lazy(_duration_section, show_loading_indicator=True)
     return
 
 
 @app.cell
-def _(day_data, mo, np, pd):
-    def fmt_cfs(x):
-        if pd.isna(x): return "—"
-        if x >= 1000:  return f"{x:,.0f}"
-        if x >= 100:   return f"{x:,.0f}"
-        if x >= 10:    return f"{x:,.1f}"
-        return f"{x:,.2f}"
-
-    def fmt_date(d):
-        return d.strftime("%Y-%m-%d") if pd.notna(d) else "—"
-
-    # --- Prepare data ---
-    df = day_data.copy()
-    df["dateTime"] = pd.to_datetime(df["dateTime"])
-    df = df.sort_values("dateTime").reset_index(drop=True)
-
-    if "has_data" not in df.columns:
-        df["has_data"] = df["mean_flow"].notna()
-    if "has_flow" not in df.columns:
-        df["has_flow"] = df["mean_flow"] > 0
-
-    df["year"]  = df["dateTime"].dt.year
-    df["month"] = df["dateTime"].dt.month
-
-    # =============================================================================
-    # 1) Top 10 Dry Streaks (missing data ends streak)
-    # =============================================================================
-    # state: -1 = missing data, 1 = dry (flow == 0), 0 = wet (flow > 0)
-    state = np.where(
-        df["has_data"] == False, -1,
-        np.where(df["has_flow"] == False, 1, 0)
-    )
-    state = pd.Series(state, index=df.index)
-    run_id = (state != state.shift()).cumsum()
-
-    dry_mask = (state == 1)
-    dry_rows = df.loc[dry_mask].assign(run=run_id[dry_mask].values)
-
-    if not dry_rows.empty:
-        dry_summary = (dry_rows.groupby("run")
-                                .agg(length=("dateTime", "size"),
-                                     start=("dateTime", "min"),
-                                     end=("dateTime", "max"))
-                                .reset_index(drop=True))
-        top10_dry = (dry_summary.sort_values(["length", "start"], ascending=[False, True])
-                               .head(10)
-                               .reset_index(drop=True))
-    else:
-        top10_dry = pd.DataFrame(columns=["length","start","end"])
-
-    # =============================================================================
-    # 1b) Top 10 Wet Streaks (flow > 0; missing data ends streak)
-    # =============================================================================
-    wet_mask = (state == 0)
-    wet_rows = df.loc[wet_mask].assign(run=run_id[wet_mask].values)
-
-    if not wet_rows.empty:
-        wet_summary = (wet_rows.groupby("run")
-                                .agg(length=("dateTime", "size"),
-                                     start=("dateTime", "min"),
-                                     end=("dateTime", "max"))
-                                .reset_index(drop=True))
-        top10_wet = (wet_summary.sort_values(["length", "start"], ascending=[False, True])
-                               .head(10)
-                               .reset_index(drop=True))
-    else:
-        top10_wet = pd.DataFrame(columns=["length","start","end"])
-
-    # =============================================================================
-    # 2) Wettest & Driest Years (eligible = ≥1 data day each month)
-    # =============================================================================
-    data_days = df[df["has_data"]].copy()
-
-    ym_counts = (data_days.groupby(["year","month"])
-                            .size()
-                            .rename("days_with_data")
-                            .reset_index())
-
-    months_per_year = (ym_counts.assign(has_month=ym_counts["days_with_data"]>0)
-                                  .groupby("year")["has_month"].sum())
+def _(mo):
+    compare_all = mo.ui.switch(label="Compare all gauges")
 
-    eligible_years = months_per_year[months_per_year>=12].index
+    mo.vstack([
+        mo.md('<h2 style="text-align:center;">Regional Comparison</h2>'),
+        compare_all,
+    ])
+    return (compare_all,)
 
-    annual_mean = (data_days[data_days["year"].isin(eligible_years)]
-                   .groupby("year")["mean_flow"]
-                   .mean()
-                   .sort_index())
 
-    if annual_mean.empty:
-        wettest = driest = pd.Series(dtype=float)
-    else:
-        wettest = annual_mean.sort_values(ascending=False).head(10)
-        driest  = annual_mean.sort_values(ascending=True).head(10)
-
-    # =============================================================================
-    # 3) Top 10 Daily Mean Flow Days
-    # =============================================================================
-    top10_flow = (
-        df.nlargest(10, "mean_flow")[["dateTime", "mean_flow"]]
-          .assign(date_str=lambda s: s["dateTime"].dt.strftime("%Y-%m-%d"))
-          .reset_index(drop=True)
+@app.cell
+def _(GAUGE_SITE_IDS, GAUGE_SITE_LABELS, compare_all, mo, region_years, regional_flow):
+    mo.stop(not compare_all.value)
+
+    # every configured gauge on one aligned calendar (site x day) - per-site work
+    # runs in a process pool, the result is cached under the content of every series
+    region = regional_flow(GAUGE_SITE_IDS)
+    mo.stop(not region, mo.md("No data for the configured gauges."))
+
+    region_labels = [GAUGE_SITE_LABELS.get(s, s) for s in region["site_ids"]]
+    region_first_year, region_last_year = region_years(region)
+    region_year = mo.ui.slider(
+        start=region_first_year, stop=region_last_year, value=region_last_year,
+        label="Year", show_value=True, full_width=True
     )
+    return region, region_labels, region_year
 
-    # =============================================================================
-    # --- HTML Rendering
-    # =============================================================================
-    def make_dry_list_html():
-        if top10_dry.empty:
-            return "<li>No dry streaks found</li>"
-        return "".join(
-            f"<li><strong>{int(r.length)}</strong> days &nbsp; "
-            f"({fmt_date(r.start)} → {fmt_date(r.end)})</li>"
-            for r in top10_dry.itertuples(index=False)
-        )
 
-    def make_wet_list_html():
-        if top10_wet.empty:
-            return "<li>No wet streaks found</li>"
-        return "".join(
-            f"<li><strong>{int(r.length)}</strong> days &nbsp; "
-            f"({fmt_date(r.start)} → {fmt_date(r.end)})</li>"
-            for r in top10_wet.itertuples(index=False)
-        )
+@app.cell
+def _(
+    mo,
+    region,
+    region_labels,
+    regional_days_of_flow_heatmap,
+    regional_max_flow_heatmap,
+):
+    _plot_config = {"displayModeBar": False, "scrollZoom": False, "doubleClick": False}
+
+    mo.vstack([
+        mo.md("### Share of Days with Flow by Month"),
+        mo.ui.plotly(regional_days_of_flow_heatmap(region, region_labels), config=_plot_config),
+        mo.md("### Max Daily Mean Flow by Month"),
+        mo.ui.plotly(regional_max_flow_heatmap(region, region_labels), config=_plot_config),
+    ])
+    return
 
-    def make_year_list_html(series):
-        if series.empty:
-            return "<li>No eligible years</li>"
-        return "".join(
-            f"<li><strong>{int(y)}</strong> — {fmt_cfs(v)} cfs</li>"
-            for y, v in series.items()
-        )
 
-    def make_flow_list_html():
-        return "".join(
-            f"<li>{r.date_str}: {fmt_cfs(r.mean_flow)} cfs</li>"
-            for r in top10_flow.itertuples(index=False)
-        )
+@app.cell
+def _(mo, region, region_labels, region_year, regional_day_flow_heatmap):
+    _longest_runs = region["longest_runs"].assign(gauge=region_labels).set_index("gauge").drop(columns="site_id")
+
+    mo.vstack([
+        mo.md("### Days with Flow"),
+        region_year,
+        mo.ui.plotly(
+            regional_day_flow_heatmap(region, region_labels, region_year.value),
+            config={"displayModeBar": False, "scrollZoom": False, "doubleClick": False}
+        ),
+        mo.md("### Longest Wet and Dry Streaks"),
+        mo.ui.table(_longest_runs, selection=None, pagination=False),
+    ])
+    return
 
-    html = f"""
-    <style>
-    .section {{ margin-bottom: 30px; }}
-    .top-list {{ margin: 12px 0 0 20px; padding: 0; }}
-    .top-list li {{ margin: 4px 0; }}
-    h3 {{ margin: 16px 0 6px 0; }}
-    </style>
-
-    <div class="section">
-      <h3>Top 10 Wet Streaks</h3>
-      <ol class="top-list">{make_wet_list_html()}</ol>
-    </div>
-
-    <div class="section">
-      <h3>Top 10 Dry Streaks</h3>
-      <ol class="top-list">{make_dry_list_html()}</ol>
-    </div>
-
-    <div class="section">
-      <h3>Top 10 Wettest Years (annual mean, full coverage)</h3>
-      <ol class="top-list">{make_year_list_html(wettest)}</ol>
-    </div>
-
-    <div class="section">
-      <h3>Top 10 Driest Years (annual mean, full coverage)</h3>
-      <ol class="top-list">{make_year_list_html(driest)}</ol>
-    </div>
-
-    <div class="section">
-      <h3>Top 10 Daily Mean Flow Days</h3>
-      <ol class="top-list">{make_flow_list_html()}</ol>
-    </div>
-    """
 
-    # In Marimo:
-    mo.md(html)
+@app.cell
+def _(DIAGNOSTICS, gauge_values, mo, stage_summary):
+    # operators only (GAUGE_DIAGNOSTICS=1) - per-stage timings for this process, read when opened
+    gauge_values
+    mo.accordion({
+        "Diagnostics": mo.lazy(lambda: mo.ui.table(stage_summary(), selection=None, pagination=False))
+    }) if DIAGNOSTICS else None
     return
 
 
@@ -0,0 +1,194 @@
+"""Local stand-in for the USGS Daily Values service (/nwis/dv/), for offline runs and load tests.
+
+    python usgs_mock.py --port 8765 --latency-ms 400 --jitter-ms 300 --failure-rate 0.02
+    USGS_WATER_SERVICES_URL=http://127.0.0.1:8765 marimo run usgs_gauge_flow.py
+
+Answers the requests usgs_service makes - json or rdb, several sites per
+request, the full period or from startDT - with either recorded responses
+(--recorded DIR holding <site>.rdb files, e.g. saved with --record) or
+synthetic series from usgs_synthetic, generated once per site. Each request
+waits latency +- jitter and fails with a 503 at --failure-rate. Sites without
+data are left out of the response, and a request matching nothing gets a 404,
+like the real service. /nwis/iv/ is not served (404).
+"""
+import argparse
+import gzip
+import logging
+import random
+import sys
+import threading
+import time
+from datetime import date
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from gauge_sites import GAUGE_SITE_IDS
+from usgs_service import DV_URL, fetch_dv_rdb, parse_dv_rdb
+from usgs_synthetic import clip_sites, dv_json_text, dv_rdb, synthetic_site
+
+log = logging.getLogger(__name__)
+
+
+class MockSettings:
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, failure_rate: float = 0.0,
+                 recorded: Path | None = None, years: float = 75):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.recorded = recorded
+        self.years = years
+
+
+@lru_cache(maxsize=None)
+def _synthetic(site: str, years: float) -> dict:
+    return synthetic_site(site, years=years)
+
+
+@lru_cache(maxsize=None)
+def _recorded(path: Path) -> str | None:
+    return path.read_text() if path.exists() else None
+
+
+def _recorded_rdb(recorded: Path, sites: list[str], start_dt: date | None) -> str:
+    """Recorded rdb for sites - headers kept, data rows before start_dt dropped."""
+    parts = []
+    for site in sites:
+        text = _recorded(recorded / f"{site}.rdb")
+        if text is None:
+            continue
+        lines = text.splitlines(keepends=True)
+        if start_dt is not None:
+            cutoff = start_dt.isoformat()
+            # data rows are agency, site, date, ... - dates compare as strings
+            lines = [line for line in lines
+                     if not line.startswith("USGS\t") or line.split("\t", 3)[2] >= cutoff]
+        parts.append("".join(lines))
+    return "".join(parts)
+
+
+def _recorded_json(recorded: Path, sites: list[str], start_dt: date | None) -> str:
+    """Recorded rdb converted to DV json."""
+    synthetic = []
+    for site, values in parse_dv_rdb(_recorded_rdb(recorded, sites, start_dt)).items():
+        quals = values["qualifiers"].astype(str)
+        synthetic.append({
+            "siteCode": site,
+            "siteName": str(values["siteName"].iloc[0]),
+            "series": [{
+                "variableCode": str(values["variableCode"].iloc[0]),
+                "statisticCode": str(values["statisticCode"].iloc[0]),
+                "values": pd.DataFrame({"date": values["dateTime"].to_numpy("datetime64[D]"),
+                                        "value": values["value"].to_numpy(), "qualifiers": quals.to_numpy()}),
+            }],
+        })
+    return dv_json_text(synthetic) if synthetic else ""
+
+
+def dv_response(settings: MockSettings, params: dict) -> tuple[int, str, str]:
+    """(status, content type, body) for a DV query."""
+    sites = [s for s in params.get("sites", "").split(",") if s]
+    fmt = params.get("format", "json").split(",")[0]
+    start_dt = date.fromisoformat(params["startDT"]) if "startDT" in params else None
+
+    if settings.recorded is not None:
+        body = (_recorded_json if fmt == "json" else _recorded_rdb)(settings.recorded, sites, start_dt)
+    else:
+        selected = clip_sites([_synthetic(site, settings.years) for site in sites], start_dt)
+        body = dv_json_text(selected) if fmt == "json" else dv_rdb(selected)
+
+    if not body:
+        return 404, "text/plain", "No sites found matching all criteria"
+    return 200, "application/json" if fmt == "json" else "text/plain", body
+
+
+def _make_handler(settings: MockSettings):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+            delay = settings.latency_ms + random.uniform(-settings.jitter_ms, settings.jitter_ms)
+            time.sleep(max(0.0, delay) / 1000)
+
+            if url.path.rstrip("/") != "/nwis/dv":
+                status, content_type, body = 404, "text/plain", "not served by the mock"
+            elif random.random() < settings.failure_rate:
+                status, content_type, body = 503, "text/plain", "injected failure"
+            else:
+                status, content_type, body = dv_response(settings, params)
+
+            data = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            if "gzip" in self.headers.get("Accept-Encoding", "") and len(data) > 1024:
+                data = gzip.compress(data, compresslevel=1)
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            log.debug("%s - %s", self.address_string(), format % args)
+
+    return Handler
+
+
+def make_mock_server(settings: MockSettings, port: int = 0, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _make_handler(settings))
+    server.daemon_threads = True
+    return server
+
+
+def start_mock_server(settings: MockSettings, port: int = 0, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve the mock in a daemon thread; the bound port is server.server_address[1]."""
+    server = make_mock_server(settings, port, host)
+    threading.Thread(target=server.serve_forever, name="usgs-mock", daemon=True).start()
+    return server
+
+
+def record_sites(site_ids: list[str], out_dir: Path) -> None:
+    """Save the live service's full-record rdb for each site as <site>.rdb."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for site_id in site_ids:
+        text = fetch_dv_rdb(site_id)
+        if text:
+            (out_dir / f"{site_id}.rdb").write_text(text)
+            log.info("recorded %s (%d bytes)", site_id, len(text))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Local stand-in for the USGS Daily Values service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0, help="mean added latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="latency varies uniformly by +- this")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--years", type=float, default=75, help="record length of synthetic sites")
+    parser.add_argument("--recorded", type=Path, help="serve <site>.rdb files from this directory")
+    parser.add_argument("--record", type=Path, help=f"save live responses from {DV_URL} to this directory and exit")
+    parser.add_argument("--sites", nargs="+", default=GAUGE_SITE_IDS, help="sites to --record")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.record:
+        record_sites(args.sites, args.record)
+        return 0
+
+    settings = MockSettings(args.latency_ms, args.jitter_ms, args.failure_rate, args.recorded, args.years)
+    server = make_mock_server(settings, args.port, args.host)
+    log.info("serving /nwis/dv/ on http://%s:%d", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,546 @@
+"""Access to the USGS Water Services Daily Values (DV) and Instantaneous Values (IV) services.
+
+Daily values are requested as tab-delimited rdb - only daily mean discharge,
+over a pooled, gzip-negotiating session - and parsed with pandas' C reader.
+The json format is kept as a fallback (USGS_DV_FORMAT=json, or when an rdb
+response can't be parsed) and is parsed as the body streams in, one daily value
+at a time; both paths produce the same flattened frame.
+
+Instantaneous (15-minute) discharge is only requested for bounded date
+windows, as rdb - see gauge_iv for the chunked daily aggregation.
+"""
+import codecs
+import io
+import json
+import logging
+import os
+import re
+import threading
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from gauge_metrics import stage
+
+log = logging.getLogger(__name__)
+
+# point at a local stand-in (usgs_mock.py) for offline runs and load tests
+WATER_SERVICES_URL = os.environ.get("USGS_WATER_SERVICES_URL", "https://waterservices.usgs.gov").rstrip("/")
+DV_URL = f"{WATER_SERVICES_URL}/nwis/dv/"
+IV_URL = f"{WATER_SERVICES_URL}/nwis/iv/"
+
+# roughly 75 years - the full record for every gauge in the notebook
+FULL_PERIOD = "P3900W"
+
+# the notebook only uses daily mean discharge
+DISCHARGE_PARAMETER = "00060"
+MEAN_STATISTIC = "00003"
+
+# "rdb" or "json"
+DV_FORMAT = os.environ.get("USGS_DV_FORMAT", "rdb")
+
+# (connect, read) seconds - a full record for a batch of sites can take a while
+REQUEST_TIMEOUT = (10, 180)
+
+# sites per batched request - the service accepts up to 100, but full-record
+# responses for that many sites get very large
+BATCH_SITES = 10
+
+# simultaneous requests allowed against one host, however many threads are fetching
+HOST_CONCURRENCY = 4
+
+# body bytes read at a time from a streamed (json) response
+STREAM_CHUNK_BYTES = 64 * 1024
+
+DAILY_COLUMNS = ["siteCode", "siteName", "variableCode", "statisticCode", "dateTime", "value", "qualifiers"]
+
+_host_limits: dict[str, threading.BoundedSemaphore] = {}
+_host_limits_lock = threading.Lock()
+
+
+def _host_limit(url: str) -> threading.BoundedSemaphore:
+    host = urlsplit(url).netloc
+    with _host_limits_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(HOST_CONCURRENCY)
+        return _host_limits[host]
+
+
+def _new_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HOST_CONCURRENCY)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
+
+
+# shared by every thread - keeps connections (and TLS sessions) alive between requests
+_session = _new_session()
+
+
+def _service_get(url: str, params: dict) -> requests.Response | None:
+    """GET from a water service; None when the service has no matching data."""
+    with _host_limit(url), stage("usgs_request", service=url.rstrip("/").rsplit("/", 1)[-1],
+                                 format=params["format"].split(",")[0]) as record:
+        response = _session.get(url, params=params, timeout=REQUEST_TIMEOUT)
+        record.bytes = len(response.content)
+    # the service answers 404 when none of the sites has data for the request
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response
+
+
+@contextmanager
+def _service_stream(url: str, params: dict) -> Iterator[Iterator[str] | None]:
+    """GET from a water service, yielding its body as text chunks; None when the service has no matching data.
+
+    The body is read inside the block - the host slot and the usgs_request stage
+    are held until it exits.
+    """
+    with _host_limit(url), stage("usgs_request", service=url.rstrip("/").rsplit("/", 1)[-1],
+                                 format=params["format"].split(",")[0]) as record:
+        response = _session.get(url, params=params, timeout=REQUEST_TIMEOUT, stream=True)
+        try:
+            if response.status_code == 404:
+                yield None
+                return
+            response.raise_for_status()
+
+            def _chunks():
+                decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+                record.bytes = 0
+                for chunk in response.iter_content(STREAM_CHUNK_BYTES):
+                    record.bytes += len(chunk)
+                    yield decoder.decode(chunk)
+                yield decoder.decode(b"", final=True)
+
+            yield _chunks()
+        finally:
+            response.close()
+
+
+def _dv_params(sites: str, start_dt: date | None, fmt: str) -> dict:
+    params = {
+        "format": fmt,
+        "sites": sites,
+        "parameterCd": DISCHARGE_PARAMETER,
+        "statCd": MEAN_STATISTIC,
+        "siteStatus": "all"
+    }
+    if start_dt is None:
+        params["period"] = FULL_PERIOD
+    else:
+        params["startDT"] = start_dt.isoformat()
+    return params
+
+
+def fetch_dv_json(sites: str, start_dt: date | None = None) -> dict[str, pd.DataFrame]:
+    """Flattened daily values from DV json for a site (or comma separated sites), keyed by site.
+
+    The full record, or from start_dt onward; parsed while the body downloads.
+    """
+    with _service_stream(DV_URL, _dv_params(sites, start_dt, "json")) as chunks:
+        if chunks is None:
+            return {}
+        with stage("parse_dv_json") as record:
+            values = parse_dv_json(chunks)
+            record.rows = sum(len(v) for v in values.values())
+        return values
+
+
+def fetch_dv_rdb(sites: str, start_dt: date | None = None) -> str:
+    """Fetch DV rdb text for a site (or comma separated sites) - the full record, or from start_dt onward."""
+    response = _service_get(DV_URL, _dv_params(sites, start_dt, "rdb,1.0"))
+    return response.text if response is not None else ""
+
+
+def fetch_iv_rdb(site: str, start_dt: date, end_dt: date) -> str:
+    """Fetch IV (15-minute) discharge rdb text for a site from start_dt through end_dt."""
+    response = _service_get(IV_URL, {
+        "format": "rdb,1.0",
+        "sites": site,
+        "parameterCd": DISCHARGE_PARAMETER,
+        "startDT": start_dt.isoformat(),
+        "endDT": end_dt.isoformat(),
+        "siteStatus": "all"
+    })
+    return response.text if response is not None else ""
+
+
+def fetch_dv_sites(sites: list[str], start_dt: date | None = None) -> dict[str, pd.DataFrame]:
+    """Flattened daily values for one request's worth of sites, keyed by site."""
+    if DV_FORMAT == "rdb":
+        try:
+            text = fetch_dv_rdb(",".join(sites), start_dt)
+            with stage("parse_dv_rdb") as record:
+                values = parse_dv_rdb(text)
+                record.rows = sum(len(v) for v in values.values())
+            return values
+        except (ValueError, KeyError) as e:
+            log.warning("rdb response for %s unusable (%s) - retrying as json", ",".join(sites), e)
+
+    return fetch_dv_json(",".join(sites), start_dt)
+
+
+def fetch_dv_batch(site_ids: list[str], start_dt: date | None = None) -> dict[str, pd.DataFrame]:
+    """Flattened daily values for many sites using as few requests as possible.
+
+    Sites are requested BATCH_SITES at a time (chunks run concurrently, within the
+    per-host limit). Sites the service returns no series for are left out.
+    """
+    chunks = [site_ids[i:i + BATCH_SITES] for i in range(0, len(site_ids), BATCH_SITES)]
+
+    values = {}
+    with ThreadPoolExecutor(max_workers=HOST_CONCURRENCY, thread_name_prefix="dv-batch") as pool:
+        for chunk_values in pool.map(lambda chunk: fetch_dv_sites(chunk, start_dt), chunks):
+            values.update(chunk_values)
+    return values
+
+
+def empty_daily_values() -> pd.DataFrame:
+    return flatten_usgs_daily({"value": {"timeSeries": []}})
+
+
+_META_COLUMNS = ["siteCode", "siteName", "variableCode", "statisticCode"]
+
+
+class _DailyFrameBuilder:
+    """Collects typed per-series columns and assembles the flattened daily frame.
+
+    String fields are kept as integer codes into shared category tables, so the
+    result is built from categoricals without ever materializing per-row strings.
+    """
+
+    def __init__(self):
+        self.meta_categories = {k: {} for k in _META_COLUMNS}
+        self.qual_categories = {}
+        self.parts = []
+
+    def factorize_quals(self, quals: pd.Series, separator: str = ",") -> np.ndarray:
+        codes, uniques = pd.factorize(quals.fillna(""))
+        uniques = [u.replace(separator, ",") for u in uniques]
+        remap = np.array([self.qual_categories.setdefault(u, len(self.qual_categories)) for u in uniques],
+                         dtype=np.int32)
+        return remap[codes] if len(remap) else codes.astype(np.int32)
+
+    def add(self, meta: dict, date_times: np.ndarray, values: np.ndarray, qual_codes: np.ndarray):
+        meta_codes = {k: self.meta_categories[k].setdefault(meta[k], len(self.meta_categories[k]))
+                      for k in _META_COLUMNS}
+        self.parts.append((meta_codes, date_times.astype("datetime64[ns]"), values, qual_codes))
+
+    def frame(self) -> pd.DataFrame:
+        def _concat(arrays, dtype):
+            return np.concatenate(arrays) if arrays else np.empty(0, dtype=dtype)
+
+        date_times = _concat([p[1] for p in self.parts], "datetime64[ns]")
+        values = _concat([p[2] for p in self.parts], np.float64)
+        quals = _concat([p[3] for p in self.parts], np.int32)
+        meta_columns = {k: _concat([np.full(len(p[1]), p[0][k], dtype=np.int32) for p in self.parts], np.int32)
+                        for k in _META_COLUMNS}
+
+        # a single series already arrives in date order
+        if len(date_times) > 1 and (np.diff(date_times) < np.timedelta64(0)).any():
+            order = np.argsort(date_times, kind="stable")
+            date_times, values, quals = date_times[order], values[order], quals[order]
+            meta_columns = {k: v[order] for k, v in meta_columns.items()}
+
+        columns = {k: _categorical(meta_columns[k], self.meta_categories[k]) for k in _META_COLUMNS}
+        columns["dateTime"] = date_times
+        columns["value"] = values
+        columns["qualifiers"] = _categorical(quals, self.qual_categories)
+        return pd.DataFrame({c: columns[c] for c in DAILY_COLUMNS}, copy=False)
+
+
+def _categorical(codes: np.ndarray, categories: dict) -> pd.Categorical:
+    return pd.Categorical.from_codes(codes, list(categories))
+
+
+def _quals_str(point) -> str:
+    quals = point.get("qualifiers") or []
+    return ",".join(map(str, quals)) if isinstance(quals, list) else str(quals or "")
+
+
+def _parse_values(values: list) -> np.ndarray:
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        # odd non-numeric values - coerce like the service's noData
+        return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(np.float64)
+
+
+def _point_columns(points: Iterable[dict]) -> tuple[np.ndarray, np.ndarray, pd.Series]:
+    """(dateTime, value, qualifiers) of a DV json value list, consumed point by point.
+
+    Only the three fields are kept per point. A malformed dateTime drops its
+    point, as does a point without a dateTime or value.
+    """
+    date_times, values, quals = [], [], []
+    for p in points:
+        if p and "dateTime" in p and "value" in p:
+            date_times.append(p["dateTime"])
+            values.append(p["value"])
+            quals.append(_quals_str(p))
+    parsed = pd.to_datetime(pd.Series(date_times, dtype=object), format="ISO8601", errors="coerce")
+    parsed = parsed.to_numpy("datetime64[ns]")
+    valid = ~np.isnat(parsed)
+    return parsed[valid], _parse_values(values)[valid], pd.Series(quals, dtype=object)[valid]
+
+
+def _series_meta(source_info: dict, variable: dict) -> dict:
+    return {
+        "siteCode": source_info["siteCode"][0]["value"],
+        "siteName": source_info["siteName"],
+        "variableCode": variable["variableCode"][0]["value"],
+        "statisticCode": variable["options"]["option"][0]["optionCode"],
+    }
+
+
+def flatten_usgs_daily(data) -> pd.DataFrame:
+    """Flatten decoded DV json to one row per daily value.
+
+    Each timeSeries' value lists are read straight into typed columns
+    (datetime64, float64 and categorical codes for the string fields) - no
+    per-point row dicts and no re-parsing of string columns afterwards.
+    """
+    builder = _DailyFrameBuilder()
+    for ts in data["value"]["timeSeries"]:
+        meta = _series_meta(ts["sourceInfo"], ts["variable"])
+        for block in ts["values"]:
+            date_times, values, quals = _point_columns(block["value"])
+            builder.add(meta, date_times, values, builder.factorize_quals(quals))
+    return builder.frame()
+
+
+class _JsonStream:
+    """Incremental reader over json text chunks.
+
+    The caller walks the containers it cares about with members()/elements()
+    and decodes everything else whole with value() (json's C raw_decode), so
+    only the current chunk and the value being decoded are held in memory.
+    """
+
+    _SPACE = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, chunks: Iterable[str]):
+        self._chunks = iter(chunks)
+        self._text = ""
+        self._pos = 0
+        self._decoder = json.JSONDecoder()
+
+    def _more(self) -> bool:
+        for chunk in self._chunks:
+            if chunk:
+                self._text = self._text[self._pos:] + chunk
+                self._pos = 0
+                return True
+        return False
+
+    def _peek(self) -> str:
+        while True:
+            self._pos = self._SPACE.match(self._text, self._pos).end()
+            if self._pos < len(self._text):
+                return self._text[self._pos]
+            if not self._more():
+                raise ValueError("truncated json")
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise ValueError(f"expected {char!r} in json at {self._text[self._pos:self._pos + 20]!r}")
+        self._pos += 1
+
+    def _separator(self, close: str) -> bool:
+        """Consume a ',' (True - another item follows) or the closing bracket (False)."""
+        char = self._peek()
+        self._pos += 1
+        if char == close:
+            return False
+        if char != ",":
+            raise ValueError(f"expected ',' or {close!r} in json")
+        return True
+
+    def value(self):
+        """Decode the value at the cursor."""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._text, self._pos)
+            except json.JSONDecodeError:
+                if self._more():
+                    continue
+                raise ValueError("truncated or malformed json") from None
+            # a number at the end of the chunk may continue in the next one
+            if end == len(self._text) and self._more():
+                continue
+            self._pos = end
+            return value
+
+    def members(self) -> Iterator[str]:
+        """Keys of the object at the cursor; each key's value must be consumed before the next."""
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(":")
+            yield key
+            if not self._separator("}"):
+                return
+
+    def elements(self) -> Iterator[None]:
+        """Step through the array at the cursor; each element must be consumed before the next."""
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield
+            if not self._separator("]"):
+                return
+
+
+def parse_dv_json(chunks: Iterable[str]) -> dict[str, pd.DataFrame]:
+    """Parse (multi-site) DV json text, arriving in chunks, into flattened daily frames keyed by site.
+
+    value.timeSeries[*].values[*].value[*] is walked one daily value at a time
+    into typed columns - the json tree is never built, so memory follows the
+    output columns rather than the response.
+    """
+    stream = _JsonStream(chunks)
+    builders = {}
+    for key in stream.members():
+        if key != "value":
+            stream.value()
+            continue
+        for key in stream.members():
+            if key != "timeSeries":
+                stream.value()
+                continue
+            for _ in stream.elements():
+                source_info = variable = None
+                blocks = []
+                for key in stream.members():
+                    if key == "values":
+                        for _ in stream.elements():
+                            for key in stream.members():
+                                if key == "value":
+                                    blocks.append(_point_columns(stream.value() for _ in stream.elements()))
+                                else:
+                                    stream.value()
+                    elif key == "sourceInfo":
+                        source_info = stream.value()
+                    elif key == "variable":
+                        variable = stream.value()
+                    else:
+                        stream.value()
+
+                meta = _series_meta(source_info, variable)
+                builder = builders.setdefault(meta["siteCode"], _DailyFrameBuilder())
+                for date_times, values, quals in blocks:
+                    builder.add(meta, date_times, values, builder.factorize_quals(quals))
+    return {site: builder.frame() for site, builder in builders.items()}
+
+
+# RDB value columns are named <ts id>_<parameter>_<statistic>, with a matching <...>_cd qualifier column
+_RDB_VALUE_COLUMN = re.compile(r"^\d+_(\d{5})_(\d{5})$")
+_RDB_SITE_NAME = re.compile(r"^#\s+USGS\s+(\d+)\s+(.+?)\s*$", re.MULTILINE)
+
+
+def parse_dv_rdb(text: str) -> dict[str, pd.DataFrame]:
+    """Parse a (multi-site) DV rdb response into flattened daily frames keyed by site.
+
+    Each site's tab-delimited block goes through pandas' C reader, so values and
+    dates arrive as typed columns. Qualifier codes are rewritten from the rdb
+    'A:e' form to the 'A,e' form flatten_usgs_daily produces.
+    """
+    site_names = dict(_RDB_SITE_NAME.findall(text))
+
+    builders = {}
+    # every site block starts with its own header row
+    for block in re.split(r"^(?=agency_cd\t)", text, flags=re.MULTILINE):
+        if not block.startswith("agency_cd\t"):
+            continue
+        rdb = pd.read_csv(
+            io.StringIO(block),
+            sep="\t",
+            comment="#",
+            skiprows=[1],  # column width/type row
+            dtype={"agency_cd": str, "site_no": str},
+            keep_default_na=False,
+            na_values=[""],
+        )
+        if rdb.empty:
+            continue
+
+        date_times = pd.to_datetime(rdb["datetime"], format="%Y-%m-%d").to_numpy("datetime64[ns]")
+        for site, site_rows in rdb.groupby("site_no", sort=False):
+            builder = builders.setdefault(site, _DailyFrameBuilder())
+            rows = site_rows.index.to_numpy()
+            for column in rdb.columns:
+                match = _RDB_VALUE_COLUMN.match(column)
+                if not match:
+                    continue
+                series = site_rows[column]
+                present = series.notna().to_numpy() | site_rows[f"{column}_cd"].notna().to_numpy()
+                if not present.any():
+                    continue
+                builder.add(
+                    {
+                        "siteCode": site,
+                        "siteName": site_names.get(site, site),
+                        "variableCode": match.group(1),
+                        "statisticCode": match.group(2),
+                    },
+                    date_times[rows[present]],
+                    pd.to_numeric(series[present], errors="coerce").to_numpy(np.float64),
+                    builder.factorize_quals(site_rows[f"{column}_cd"][present], separator=":"),
+                )
+    return {site: builder.frame() for site, builder in builders.items() if builder.parts}
+
+
+# IV value columns are named <ts id>_<parameter> (no statistic), with a matching <...>_cd qualifier column
+_RDB_IV_COLUMN = re.compile(r"^\d+_" + DISCHARGE_PARAMETER + "$")
+
+
+def parse_iv_rdb(text: str) -> tuple[str | None, pd.DataFrame]:
+    """(site name, readings) from a single-site IV rdb response.
+
+    Readings are dateTime (local clock time, as published), value (NaN for
+    non-numeric codes like 'Ice' or 'Eqp') and provisional (qualifier has P),
+    from the first discharge series in the response.
+    """
+    site_names = _RDB_SITE_NAME.findall(text)
+    site_name = site_names[0][1] if site_names else None
+    empty = pd.DataFrame({"dateTime": np.empty(0, "datetime64[ns]"), "value": np.empty(0),
+                          "provisional": np.empty(0, bool)})
+    if "agency_cd\t" not in text:
+        return site_name, empty
+
+    rdb = pd.read_csv(
+        io.StringIO(text[text.index("agency_cd\t"):]),
+        sep="\t",
+        comment="#",
+        skiprows=[1],  # column width/type row
+        dtype={"agency_cd": str, "site_no": str, "datetime": str, "tz_cd": str},
+        keep_default_na=False,
+        na_values=[""],
+    )
+    columns = [c for c in rdb.columns if _RDB_IV_COLUMN.match(c)]
+    if rdb.empty or not columns:
+        return site_name, empty
+
+    column = columns[0]
+    return site_name, pd.DataFrame({
+        "dateTime": pd.to_datetime(rdb["datetime"], format="%Y-%m-%d %H:%M").to_numpy("datetime64[ns]"),
+        "value": pd.to_numeric(rdb[column], errors="coerce").to_numpy(np.float64),
+        "provisional": rdb[f"{column}_cd"].fillna("").astype(str).str.contains("P", regex=False).to_numpy(),
+    })
@@ -0,0 +1,185 @@
+"""Synthetic USGS Daily Values payloads for offline benchmarking and testing.
+
+The generated series look like the desert gauges in the notebook: alternating
+zero-flow and wet runs, occasional multi-day gaps in the record, approved
+("A") values with some estimated ("A,e") ones and provisional ("P") values
+for the most recent months. The same sites can be rendered as DV json
+(dv_json) or rdb (dv_rdb), in the shapes usgs_service parses.
+
+    sites = synthetic_sites(10, years=100, seed=1)
+    text = dv_rdb(sites)
+"""
+import json
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from usgs_service import DISCHARGE_PARAMETER, MEAN_STATISTIC
+
+# (mean log, sigma) of a wet day's flow in cfs - a long right tail, like flood days
+WET_FLOW_LOGNORMAL = (1.0, 1.4)
+
+
+def _alternating_runs(rng: np.random.Generator, n: int, mean_off: float, mean_on: float) -> np.ndarray:
+    """Boolean array of n days alternating between off and on runs with geometric lengths."""
+    pairs = int(n / (mean_off + mean_on)) + 16
+    while True:
+        lengths = np.empty(2 * pairs, dtype=np.int64)
+        lengths[0::2] = rng.geometric(1 / mean_off, pairs)
+        lengths[1::2] = rng.geometric(1 / mean_on, pairs)
+        # start somewhere inside the first off/on pair
+        offset = int(rng.integers(0, lengths[:2].sum()))
+        if lengths.sum() >= n + offset:
+            break
+        pairs *= 2
+    states = np.tile([False, True], pairs)
+    return np.repeat(states, lengths)[offset:offset + n]
+
+
+def synthetic_series(
+    years: float = 75,
+    end: date | None = None,
+    seed: int = 0,
+    mean_dry_days: float = 40,
+    mean_wet_days: float = 15,
+    gap_fraction: float = 0.03,
+    mean_gap_days: float = 20,
+    estimated_fraction: float = 0.01,
+    provisional_days: int = 120,
+) -> pd.DataFrame:
+    """One daily mean series: date (datetime64[D]), value (float, 2 decimals) and qualifiers."""
+    rng = np.random.default_rng(seed)
+    end = end or date.today()
+    start = end - timedelta(days=round(years * 365.25) - 1)
+    dates = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1)
+    n = len(dates)
+
+    wet = _alternating_runs(rng, n, mean_dry_days, mean_wet_days)
+    flow = np.where(wet, rng.lognormal(*WET_FLOW_LOGNORMAL, n).round(2), 0.0)
+
+    if gap_fraction > 0:
+        mean_present_days = mean_gap_days * (1 - gap_fraction) / gap_fraction
+        present = ~_alternating_runs(rng, n, mean_present_days, mean_gap_days)
+    else:
+        present = np.ones(n, dtype=bool)
+
+    qualifiers = np.full(n, "A", dtype=object)
+    qualifiers[rng.random(n) < estimated_fraction] = "A,e"
+    qualifiers[-provisional_days:] = "P"
+
+    return pd.DataFrame({"date": dates[present], "value": flow[present], "qualifiers": qualifiers[present]})
+
+
+def synthetic_site(
+    site_code: str,
+    site_name: str | None = None,
+    seed: int | None = None,
+    parameters: tuple[str, ...] = (DISCHARGE_PARAMETER,),
+    **series_options,
+) -> dict:
+    """One site with a timeSeries per parameter; series_options go to synthetic_series."""
+    seed = int(site_code) if seed is None else seed
+    return {
+        "siteCode": site_code,
+        "siteName": site_name or f"SYNTHETIC WASH {site_code} NEAR TUCSON, AZ",
+        "series": [
+            {
+                "variableCode": parameter,
+                "statisticCode": MEAN_STATISTIC,
+                "values": synthetic_series(seed=seed * 101 + k, **series_options),
+            }
+            for k, parameter in enumerate(parameters)
+        ],
+    }
+
+
+def synthetic_sites(n_sites: int = 1, seed: int = 0, **site_options) -> list[dict]:
+    """n_sites sites with codes 09400000, 09400001, ..."""
+    return [
+        synthetic_site(f"{9400000 + i:08d}", f"SYNTHETIC WASH {i} NEAR TUCSON, AZ", seed=seed * 100003 + i,
+                       **site_options)
+        for i in range(n_sites)
+    ]
+
+
+def clip_sites(sites: list[dict], start_dt: date | None = None, end_dt: date | None = None) -> list[dict]:
+    """The sites with every series cut to start_dt..end_dt (inclusive)."""
+    lo = np.datetime64(start_dt or date.min, "D")
+    hi = np.datetime64(end_dt or date.max, "D")
+    return [
+        {**site, "series": [
+            {**series, "values": series["values"][(series["values"]["date"] >= lo)
+                                                  & (series["values"]["date"] <= hi)].reset_index(drop=True)}
+            for series in site["series"]
+        ]}
+        for site in sites
+    ]
+
+
+def dv_json(sites: list[dict]) -> dict:
+    """DV json (the subset of the WaterML-json shape flatten_usgs_daily reads)."""
+    time_series = []
+    for site in sites:
+        for series in site["series"]:
+            values = series["values"]
+            date_times = np.datetime_as_string(values["date"].to_numpy(), unit="D")
+            points = [
+                {"value": f"{v:g}", "qualifiers": q.split(","), "dateTime": f"{d}T00:00:00.000"}
+                for v, q, d in zip(values["value"].tolist(), values["qualifiers"].tolist(), date_times.tolist())
+            ]
+            time_series.append({
+                "sourceInfo": {
+                    "siteName": site["siteName"],
+                    "siteCode": [{"value": site["siteCode"], "network": "NWIS", "agencyCode": "USGS"}],
+                },
+                "variable": {
+                    "variableCode": [{"value": series["variableCode"]}],
+                    "options": {"option": [{"optionCode": series["statisticCode"]}]},
+                },
+                "values": [{"value": points}],
+                "name": f"USGS:{site['siteCode']}:{series['variableCode']}:{series['statisticCode']}",
+            })
+    return {"name": "ns1:timeSeriesResponseType", "value": {"timeSeries": time_series}}
+
+
+def dv_json_text(sites: list[dict]) -> str:
+    return json.dumps(dv_json(sites))
+
+
+def dv_rdb(sites: list[dict]) -> str:
+    """DV rdb text - one tab-delimited block per site, a value/_cd column pair per series."""
+    lines = [
+        "# ---------------------------------- WARNING ----------------------------------------",
+        "# Synthetic data - generated by usgs_synthetic.py",
+        "#",
+        f"# Data for the following {len(sites)} site(s) are contained in this file",
+    ]
+    lines += [f"#    USGS {site['siteCode']} {site['siteName']}" for site in sites]
+    lines.append("# -----------------------------------------------------------------------------------")
+    header = "\n".join(lines) + "\n"
+
+    blocks = [header]
+    for site in sites:
+        block = None
+        for k, series in enumerate(site["series"]):
+            column = f"{149640 + k}_{series['variableCode']}_{series['statisticCode']}"
+            values = series["values"]
+            frame = pd.DataFrame({
+                "datetime": values["date"].to_numpy(),
+                column: values["value"].to_numpy(),
+                f"{column}_cd": values["qualifiers"].str.replace(",", ":", regex=False).to_numpy(),
+            })
+            block = frame if block is None else block.merge(frame, on="datetime", how="outer")
+        block = block.sort_values("datetime")
+        block["datetime"] = block["datetime"].dt.strftime("%Y-%m-%d")
+        block.insert(0, "site_no", site["siteCode"])
+        block.insert(0, "agency_cd", "USGS")
+
+        widths = "\t".join(["5s", "15s", "20d"] + ["14n", "10s"] * len(site["series"]))
+        blocks.append(
+            f"#\n# Data provided for site {site['siteCode']}\n#\n"
+            + "\t".join(block.columns) + "\n" + widths + "\n"
+            + block.to_csv(sep="\t", header=False, index=False, float_format="%g")
+        )
+    return "".join(blocks)